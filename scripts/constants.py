@@ -1,6 +1,8 @@
 # Module name: Constants
 # Purpose: This module contains all the constants used in this project.
 
+import os
+
 # CONSTANTS NOT INTENDED TO BE CHANGED
 # OFFSETS
 WIKIPEDIA_TITLE_OFFSET = 30  # base looks like this: https://en.wikipedia.org/wiki/
@@ -15,18 +17,30 @@ YEAR_OFFSET = 4  # base looks like this: 1900-10-31
 SPARQL_URL = 'https://query.wikidata.org/sparql'
 MWAPI_URL = 'https://en.wikipedia.org/w/api.php'
 WIKIMEDIA_COMMONS_API_URL = 'https://commons.wikimedia.org/w/api.php'
+HTTP_TIMEOUT = (10, 90)  # connect and read timeout in seconds, read timeout is over 60 s limit of SPARQL endpoint
+HTTP_POOL_SIZE = 16  # number of connections kept alive for one host, it is never lower than DOWNLOAD_WORKERS
+HTTP_MAX_RETRIES = 5
+HTTP_BACKOFF_BASE = 1  # seconds to wait before the first retry, the wait is doubled with every next retry
+HTTP_BACKOFF_MAX = 120
+HTTP_RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+MAXLAG = 5  # https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
+ERROR_BUDGET = 0.5  # maximal ratio of failed requests to one endpoint in ERROR_BUDGET_WINDOW before it is paused
+ERROR_BUDGET_WINDOW = 100
+ERROR_BUDGET_COOLDOWN = 600  # seconds for which the endpoint is not called once its error budget is spent
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]  # upper bounds of latency histogram in seconds
 
 # STRUCTURES
 PERSON_STRUCTURE = ['name', 'description', 'gender', 'birthDate', 'deathDate', 'nationality', 'occupation', 'images',
                     'wikipediaTitle', 'wikidataID']
-IMAGE_STRUCTURE = ['year', 'caption', 'date', 'exifDate', 'url', 'fileNameLocal', 'fileNameWiki', 'extension', 'age',
-                   'faces']
+IMAGE_STRUCTURE = ['year', 'caption', 'date', 'exifDate', 'url', 'fileNameLocal', 'fileNameWiki', 'extension', 'size',
+                   'width', 'height', 'scale', 'mime', 'sha1', 'age', 'faces']
 FACE_STRUCTURE = ['box', 'score']
 
 # LISTS DEFINITIONS
 BROKEN_DATA = ['.well-known/genid']
 PROPERTIES_WITH_TAGS = ['gender', 'nationality', 'occupation']
 PROPERTIES_TO_MERGE = ['birthDate', 'deathDate']
+IMAGE_METADATA_PROPERTIES = ['size', 'width', 'height', 'mime', 'sha1']  # describe the current revision of the file
 PERSON_PROPERTIES_FOR_TRAINING = ['gender', 'birthDate', 'deathDate', 'nationality', 'occupation']
 IMAGE_PROPERTIES_FOR_TRAINING = ['age', 'faces', 'fileNameLocal', 'extension']
 PERSON_PROPERTIES_FOR_EVALUATION = ['birthDate', 'wikipediaTitle', 'wikidataID']
@@ -46,7 +60,15 @@ IMAGES_SIZE = 128
 
 # DOWNLOAD CONSTANTS
 YEAR_STEP = 1  # changing this is not recommended as it will most likely cause timeout on the API
-MAX_URI_LENGTH = 5000
+SPARQL_PARTITION_LIMIT = 250000  # partitions of birth dates with more results are split into smaller ones
+SPARQL_VALUES_CHUNK_SIZE = 500  # number of people queried at once, when they are queried by their wikidataIDs
+SPARQL_VALUES_SEPARATOR = '\u001F'  # separates multiple values of one property in the grouped SPARQL query
+SPARQL_IMAGE_SEPARATOR = '\u001E'  # separates URL, caption and date of one image in the grouped SPARQL query
+# Maximal size of one Mediawiki API response in bytes, bigger responses are continued
+API_RESPONSE_BUDGET = 8 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # images are streamed to the disk in chunks of this size in bytes
+DUMP_BATCH_SIZE = 1000  # number of lines of the Wikidata dump sent to one process at once
+JOURNAL_CHUNK_SIZE = 1000  # number of people in one entry of the journal, so lines of the journal stay small
 
 # CONSTANTS INTENDED TO BE CHANGED
 # DIRECTORIES
@@ -57,12 +79,78 @@ STATS_DIRECTORY = '../../stats'
 LOGS_DIRECTORY = '../../logs'
 RESULTS_DIRECTORY = '../../results'
 AGE_DB_IMAGES_DIRECTORY = '../../AgeDB/AgeDB'
+CACHE_DIRECTORY = '../../cache'
+LEASE_DIRECTORY = '../../data/leases'  # leases of years processed by workers, see scheduler module
+JOURNAL_DIRECTORY = '../../data/journal'  # journals of completed work, see journal module
+DUMP_DIRECTORY = '../../data/dump'  # shards of the Wikidata dump by birth year, see dumpReader
+DATABASE_LOCATION = '../../data/wikipeople.sqlite'  # SQLite store of the dataset, see database module
+IMAGE_TABLE_LOCATION = '../../data/images.parquet'  # columnar table of images, see exporter module
+IMAGE_INDEX_LOCATION = '../../dataset/imageIndex.npy'  # memory-mapped index of training images, see model.imageIndex
 
 # DOWNLOAD CONSTANTS
 START_YEAR = 1840
 END_YEAR = 2016
+DOWNLOAD_WORKERS = 8  # number of images downloaded at once, it is also the size of the shared connection pool
+# Maximum of concurrent requests to one host, keep it low to respect API Etiquette, it is divided among
+# WORKER_PROCESSES, so it holds for all of them together (see WORKER_PROCESSES)
+DOWNLOAD_WORKERS_PER_HOST = 4
+SPARQL_WORKERS = 3  # number of SPARQL queries sent at once, the endpoint allows 5 parallel queries per IP address
+LABEL_WORKERS = 2  # number of SPARQL queries for labels sent at once, together with SPARQL_WORKERS at most 5
+API_WORKERS = 3  # number of Mediawiki API requests sent at once (thumbnails, metadata and links of images)
+MAX_IMAGE_BYTES = 50 * 1024 * 1024  # images bigger than this size in bytes are not downloaded
+MAX_IMAGE_PIXELS = 100_000_000  # images with more pixels than this are not downloaded
+# 'original' downloads images in full resolution, 'thumbnail' downloads images scaled by Wikimedia Commons
+# to DOWNLOAD_WIDTH, which is much smaller download for the face crops of IMAGES_SIZE
+DOWNLOAD_MODE = 'original'
+DOWNLOAD_WIDTH = 1024  # width of images in pixels in 'thumbnail' download mode, narrower images are not upscaled
+# 'all' downloads images usable for training (with age and allowed extension) first and then the rest,
+# 'useful' downloads only images usable for training and skips the rest
+DOWNLOAD_PRIORITY = 'all'
+# 'sparql' downloads people from the SPARQL endpoint, 'dump' reads them from the Wikidata JSON dump in DUMP_LOCATION
+DATA_SOURCE = 'sparql'
+DUMP_LOCATION = '../../latest-all.json.bz2'
+DUMP_PROCESSES = None  # number of processes parsing the dump, None uses all the cores
+# 'flat' returns one result for every combination of values of a person, 'grouped' returns one result for every
+# person with all the values concatenated, which is much smaller response for people with many values
+SPARQL_QUERY_MODE = 'flat'
+
+# SCHEDULER CONSTANTS
+# Number of processes working on different years, every process uses its own workers for downloading,
+# so the number of requests sent at once is multiplied, keep it low to respect API Etiquette, only
+# DOWNLOAD_WORKERS_PER_HOST is divided among them (every process gets at least one request to a host)
+WORKER_PROCESSES = 1
+LEASE_TTL = 10 * 60  # seconds after which lease of a year not renewed by its worker expires
+
+# INSTRUMENTATION CONSTANTS
+PROMETHEUS_TEXTFILE = None  # location of .prom file for textfile collector of node exporter, None disables it
+
+# STORAGE CONSTANTS
+# Format of the year files in DATA_DIRECTORY: 'json' (indented JSON), 'jsonl' (compact JSON Lines, one person
+# per line) or 'msgpack' (binary, requires msgpack package), format of existing files is detected on read
+# Year files are indexed, so storage.getPerson reads only one year file and only one line of uncompressed 'jsonl' files
+STORAGE_FORMAT = 'json'
+STORAGE_COMPRESSION = None  # None, 'gzip' or 'zstd' (requires zstandard package)
+STORAGE_COMPRESSION_LEVEL = {'gzip': 6, 'zstd': 3}  # higher levels make smaller files, but slower saving
+# 'files' reads all the year files for training and evaluation, 'sqlite' queries DATABASE_LOCATION instead,
+# which has to be built by database.buildDatabase after the data collection, face detection updates it itself
+DATA_STORE = 'files'
+
+# CACHE CONSTANTS
+CACHE_MODE = 'on'  # 'on' caches API responses, 'off' disables the cache, 'offline' uses only cached responses
+CACHE_TTL = {  # how long the cached responses from the endpoint are valid in seconds
+    SPARQL_URL: 20 * 60 * 60,  # shorter than a day, so the daily download always gets fresh data
+    MWAPI_URL: 7 * 24 * 60 * 60,
+    WIKIMEDIA_COMMONS_API_URL: 30 * 24 * 60 * 60
+}
+CACHE_MAX_BYTES = 20 * 1024 ** 3  # least recently used responses are removed when the cache is bigger
+LABELS_TTL = 30 * 24 * 60 * 60  # labels of Wikidata tags older than this are resolved again, in seconds
 
 # REQUESTS
 HEADERS = {
     "User-Agent": "wikipeople-bot/0.0 (https://github.com/dreamwaffer/wikipeople; kotrblu2@fel.cvut.cz)"
-}
\ No newline at end of file
+}
+# Bot password (see Special:BotPasswords on Wikipedia) used to log in to the Mediawiki API, accounts with apihighlimits
+# right (e.g., bots) can ask for 500 titles in one query instead of 50, the password is read from the environment,
+# so it is never stored in the repository, the API is used anonymously when it is not set
+BOT_USERNAME = os.environ.get('WIKIPEOPLE_BOT_USERNAME')  # e.g., 'YourAccount@wikipeople'
+BOT_PASSWORD = os.environ.get('WIKIPEOPLE_BOT_PASSWORD')
@@ -0,0 +1,216 @@
+# Module name: Cache
+# Purpose: This module contains functions for caching API responses on the disk. Responses are stored
+#          in CACHE_DIRECTORY under the hash of the endpoint and the parameters of the request.
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from constants import CACHE_DIRECTORY, CACHE_MODE, CACHE_TTL, CACHE_MAX_BYTES
+
+# Size of all the files in the cache, it is computed on the first write
+cacheSize = None
+cacheSizeLock = threading.Lock()
+
+
+def isCached(url):
+    """This method checks if responses from the endpoint are cached.
+
+        Keyword arguments:
+        url -- URL of the endpoint
+    """
+
+    return CACHE_MODE != 'off' and url in CACHE_TTL
+
+
+def isOffline():
+    """This method checks if the cache is in offline mode, in which no requests are sent and only cached
+       responses are used regardless of their age.
+
+        Keyword arguments:
+        None
+    """
+
+    return CACHE_MODE == 'offline'
+
+
+def getKey(url, params=None, data=None, headers=None):
+    """This method returns key of the request in the cache. Parameters are sorted and converted to strings,
+       so the same request has always the same key. Parameter maxlag is left out as it does not change
+       the response.
+
+        Keyword arguments:
+        url -- URL of the endpoint
+        params -- parameters of the request sent in the URL (default: None)
+        data -- parameters of the request sent in the body (default: None)
+        headers -- additional headers of the request (default: None)
+    """
+
+    def canonicalise(parameters):
+        return sorted((str(k), str(v)) for k, v in (parameters or {}).items() if k != 'maxlag')
+
+    request = json.dumps([url, canonicalise(params), canonicalise(data), canonicalise(headers)],
+                         ensure_ascii=False)
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+
+def getPath(key):
+    """This method returns location of the cached response. Responses are divided into subdirectories
+       by first two characters of the key, so there are not too many files in one directory.
+
+        Keyword arguments:
+        key -- key of the request in the cache
+    """
+
+    return f'{CACHE_DIRECTORY}/{key[:2]}/{key}'
+
+
+def getCachedResponse(url, key):
+    """This method returns location of the cached response or None, when the response is not cached
+       or it is older than TTL of the endpoint. The access time of the file is updated,
+       so the recently used responses are evicted last.
+
+        Keyword arguments:
+        url -- URL of the endpoint
+        key -- key of the request in the cache
+    """
+
+    location = getPath(key)
+    try:
+        age = time.time() - os.path.getmtime(location)
+    except OSError:
+        return None
+    if age > CACHE_TTL[url] and not isOffline():
+        return None
+
+    # Age is measured from the creation of the response, access time is used for the eviction
+    os.utime(location, (time.time(), os.path.getmtime(location)))
+    return location
+
+
+def readResponse(url, key):
+    """This method returns content of the cached response or None, see getCachedResponse.
+
+        Keyword arguments:
+        url -- URL of the endpoint
+        key -- key of the request in the cache
+    """
+
+    location = getCachedResponse(url, key)
+    if location is None:
+        return None
+    try:
+        with open(location, 'rb') as f:
+            return f.read()
+    except OSError:
+        # File could be evicted in the meantime
+        return None
+
+
+def saveResponse(key, content):
+    """This method saves content of the response to the cache.
+
+        Keyword arguments:
+        key -- key of the request in the cache
+        content -- content of the response in bytes
+    """
+
+    f = openResponse(key)
+    try:
+        f.write(content)
+    except BaseException:
+        discardResponse(f)
+        raise
+    commitResponse(f, key)
+
+
+def openResponse(key):
+    """This method opens a temporary file, to which a streamed response can be written. The file has to be
+       either committed to the cache with commitResponse or discarded with discardResponse.
+
+        Keyword arguments:
+        key -- key of the request in the cache
+    """
+
+    directory = os.path.dirname(getPath(key))
+    os.makedirs(directory, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False)
+
+
+def commitResponse(f, key):
+    """This method closes the temporary file and atomically moves it to the cache.
+
+        Keyword arguments:
+        f -- temporary file opened with openResponse
+        key -- key of the request in the cache
+    """
+
+    f.close()
+    os.replace(f.name, getPath(key))
+    addToCacheSize(os.path.getsize(getPath(key)))
+
+
+def discardResponse(f):
+    """This method closes and removes the temporary file.
+
+        Keyword arguments:
+        f -- temporary file opened with openResponse
+    """
+
+    f.close()
+    os.remove(f.name)
+
+
+def addToCacheSize(size):
+    """This method adds size of the new response to the size of the cache and evicts the least recently used
+       responses, when the cache is bigger than CACHE_MAX_BYTES. The cache is reduced to 90 % of its limit,
+       so the eviction does not run after every response.
+
+        Keyword arguments:
+        size -- size of the new response in bytes
+    """
+
+    global cacheSize
+    with cacheSizeLock:
+        if cacheSize is None:
+            cacheSize = sum(size for _, size, _ in getCachedFiles())
+        else:
+            cacheSize += size
+        if cacheSize <= CACHE_MAX_BYTES:
+            return
+
+        files = sorted(getCachedFiles(), key=lambda file: file[2])
+        for location, size, _ in files:
+            if cacheSize <= CACHE_MAX_BYTES * 0.9:
+                break
+            try:
+                os.remove(location)
+                cacheSize -= size
+            except OSError:
+                logging.exception(f'Exception happened while evicting {location} from cache')
+
+
+def getCachedFiles():
+    """This method returns location, size and last access time of all the responses in the cache.
+
+        Keyword arguments:
+        None
+    """
+
+    files = []
+    for directory, _, fileNames in os.walk(CACHE_DIRECTORY):
+        for fileName in fileNames:
+            if fileName.endswith('.part'):
+                continue
+            location = f'{directory}/{fileName}'
+            try:
+                stat = os.stat(location)
+            except OSError:
+                continue
+            files.append((location, stat.st_size, stat.st_atime))
+
+    return files
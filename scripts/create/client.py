@@ -0,0 +1,545 @@
+# Module name: Client
+# Purpose: This module contains a shared HTTP client used for all the API calls in this project.
+#          It keeps a long-lived connection pool, retries failed requests with exponential backoff,
+#          respects the API Etiquette (Retry-After header, maxlag parameter) and collects statistics of requests.
+
+import copy
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+from create import cache
+from constants import HEADERS, SPARQL_URL, MWAPI_URL, WIKIMEDIA_COMMONS_API_URL, HTTP_TIMEOUT, HTTP_POOL_SIZE, \
+    HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX, HTTP_RETRY_STATUS_CODES, MAXLAG, ERROR_BUDGET, \
+    ERROR_BUDGET_WINDOW, ERROR_BUDGET_COOLDOWN, LATENCY_BUCKETS, DOWNLOAD_WORKERS, DOWNLOAD_WORKERS_PER_HOST, \
+    BOT_USERNAME, BOT_PASSWORD
+
+session = None
+sessionLock = threading.Lock()
+# Result of the login to every Mediawiki API, cookies of the logged in user are kept in the session
+logins = {}
+loginLock = threading.Lock()
+
+# Semaphores limiting concurrent requests to one host, they are shared by all the workers of the process,
+# the limit is divided among the worker processes of the scheduler, see setWorkerProcesses
+hostSemaphores = {}
+hostSemaphoresLock = threading.Lock()
+workersPerHost = DOWNLOAD_WORKERS_PER_HOST
+
+# Error budget of every endpoint, window contains True for every failed request and False for successful one
+errorWindows = {}
+blockedUntil = {}
+stats = {}
+statsLock = threading.Lock()
+
+# Name of the environment variable with JSON dictionary of URL prefixes and their replacements (e.g., a local fake
+# server, see eval/fakeWikimedia.py), worker processes inherit it from the main process
+URL_OVERRIDES_VARIABLE = 'WIKIPEOPLE_URL_OVERRIDES'
+
+
+def getSession():
+    """This method returns the session shared by all the API calls. The session is created on the first call,
+       its connection pool is big enough for all the download workers.
+
+        Keyword arguments:
+        None
+    """
+
+    global session
+    with sessionLock:
+        if session is None:
+            poolSize = max(HTTP_POOL_SIZE, DOWNLOAD_WORKERS)
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=poolSize)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(HEADERS)
+        return session
+
+
+def login(url):
+    """This method logs the shared session in to the Mediawiki API with the bot password from BOT_USERNAME
+       and BOT_PASSWORD, so all the following requests of this process to the API are sent as the bot user.
+       The login is tried only once for every API, True is returned when the session is logged in.
+       Nothing is sent and False is returned, when the bot password is not set.
+
+        Keyword arguments:
+        url -- URL of the API
+    """
+
+    # example of login with bot password
+    # https://www.mediawiki.org/wiki/API:Login
+
+    if not BOT_USERNAME or not BOT_PASSWORD:
+        return False
+
+    with loginLock:
+        if url not in logins:
+            params = {
+                'action': 'query',
+                'meta': 'tokens',
+                'type': 'login',
+                'format': 'json',
+                'formatversion': 2
+            }
+            try:
+                # Token is bound to the session cookie, so the responses are never taken from the cache
+                token = getResponse(url, params=params).json()['query']['tokens']['logintoken']
+                data = {
+                    'action': 'login',
+                    'lgname': BOT_USERNAME,
+                    'lgpassword': BOT_PASSWORD,
+                    'lgtoken': token,
+                    'format': 'json',
+                    'formatversion': 2
+                }
+                result = getResponse(url, data=data).json()['login']
+                logins[url] = result['result'] == 'Success'
+                if not logins[url]:
+                    logging.error(f'Login of {BOT_USERNAME} to {url} failed: {result.get("reason", result)}')
+            except Exception:
+                logging.exception(f'Exception happened while logging in to {url}')
+                logins[url] = False
+
+        return logins[url]
+
+
+def getHostSemaphore(url):
+    """This method returns a semaphore limiting the number of concurrent requests to the host of the passed URL.
+
+        Keyword arguments:
+        url -- URL of the request
+    """
+
+    host = urlparse(url).netloc
+    with hostSemaphoresLock:
+        if host not in hostSemaphores:
+            hostSemaphores[host] = threading.BoundedSemaphore(workersPerHost)
+        return hostSemaphores[host]
+
+
+def setWorkerProcesses(processes):
+    """This method divides DOWNLOAD_WORKERS_PER_HOST among the worker processes downloading at once,
+       so all of them together do not send more concurrent requests to one host. Every process is allowed
+       at least one request. It has to be called before the first request of the process.
+
+        Keyword arguments:
+        processes -- number of worker processes
+    """
+
+    global workersPerHost
+    with hostSemaphoresLock:
+        workersPerHost = max(1, DOWNLOAD_WORKERS_PER_HOST // processes)
+        hostSemaphores.clear()
+
+
+def getJson(url, params=None, data=None, retryStatusCodes=None):
+    """This method calls the API and returns parsed JSON response. POST request is sent if data are passed,
+       GET request otherwise. Exception is raised when the response is not a 2xx response.
+       Responses from the API endpoints are cached on the disk, see cache module.
+
+        Keyword arguments:
+        url -- URL of the API
+        params -- parameters of the request sent in the URL (default: None)
+        data -- parameters of the request sent in the body (default: None)
+        retryStatusCodes -- status codes of responses to retry (default defined in constants module)
+    """
+
+    if not isCached(url):
+        return getResponse(url, params, data, retryStatusCodes=retryStatusCodes).json()
+
+    key = cache.getKey(url, params, data)
+    content = cache.readResponse(url, key)
+    if content is None:
+        response = getResponse(url, params, data, retryStatusCodes=retryStatusCodes)
+        result = response.json()
+        # Only valid responses are cached
+        cache.saveResponse(key, response.content)
+        return result
+
+    recordCacheHit(getEndpoint(url), len(content))
+    return json.loads(content)
+
+
+def getLines(url, params=None, data=None, headers=None, retryStatusCodes=None, chunkSize=65536):
+    """This method calls the API and yields lines of the response as they are downloaded, so the whole
+       response is never held in memory. POST request is sent if data are passed, GET request otherwise.
+       Exception is raised when the response is not a 2xx response. ValueError is raised when the last line
+       is not terminated by a new line, which means that the response was truncated.
+       Responses from the API endpoints are cached on the disk, see cache module.
+
+        Keyword arguments:
+        url -- URL of the API
+        params -- parameters of the request sent in the URL (default: None)
+        data -- parameters of the request sent in the body (default: None)
+        headers -- additional headers of the request (default: None)
+        retryStatusCodes -- status codes of responses to retry (default defined in constants module)
+        chunkSize -- number of bytes read from the response at once (default: 65536)
+    """
+
+    if isCached(url):
+        # Accept header changes format of the response, so it is part of the key
+        key = cache.getKey(url, params, data, headers)
+        location = cache.getCachedResponse(url, key)
+        if location is not None:
+            recordCacheHit(getEndpoint(url))
+            with open(location, 'rb') as f:
+                yield from splitLines(countBytes(iter(lambda: f.read(chunkSize), b''), url, cached=True), url)
+            return
+    else:
+        key = None
+
+    method = 'GET' if data is None else 'POST'
+    with request(method, url, params=params, data=data, headers=headers, stream=True,
+                 retryStatusCodes=retryStatusCodes) as r:
+        r.raise_for_status()  # raises exception when not a 2xx response
+        if key is None:
+            yield from splitLines(countBytes(r.iter_content(chunk_size=chunkSize), url), url)
+            return
+
+        # Response is saved to the cache while it is streamed, it is committed only when it is read completely
+        f = cache.openResponse(key)
+        try:
+            yield from splitLines(writeChunks(countBytes(r.iter_content(chunk_size=chunkSize), url), f), url)
+        except BaseException:
+            cache.discardResponse(f)
+            raise
+        cache.commitResponse(f, key)
+
+
+def splitLines(chunks, url):
+    """This method yields lines from the chunks of the response. ValueError is raised when the last line
+       is not terminated by a new line, which means that the response was truncated.
+
+        Keyword arguments:
+        chunks -- iterable of chunks of the response in bytes
+        url -- URL of the request, used for the error message
+    """
+
+    pending = b''
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8')
+    if pending:
+        raise ValueError(f'Response from {url} was truncated')
+
+
+def writeChunks(chunks, f):
+    """This method writes chunks of the response to the file and yields them further.
+
+        Keyword arguments:
+        chunks -- iterable of chunks of the response in bytes
+        f -- file to write the chunks to
+    """
+
+    for chunk in chunks:
+        f.write(chunk)
+        yield chunk
+
+
+def countBytes(chunks, url, cached=False):
+    """This method yields chunks of the response and adds their size to the statistics of the endpoint
+       as they are read, so the bytes of streamed responses are counted even without Content-Length header
+       (e.g., chunked transfer encoding). Streamed responses have to be read through this method.
+
+        Keyword arguments:
+        chunks -- iterable of chunks of the response in bytes
+        url -- URL of the request
+        cached -- True if the chunks are read from the cache, they are counted separately (default: False)
+    """
+
+    endpoint = getEndpoint(url)
+    for chunk in chunks:
+        recordBytes(endpoint, len(chunk), cached)
+        yield chunk
+
+
+def getResponse(url, params=None, data=None, retryStatusCodes=None):
+    """This method calls the API and returns the downloaded response. POST request is sent if data are passed,
+       GET request otherwise. Exception is raised when the response is not a 2xx response.
+
+        Keyword arguments:
+        url -- URL of the API
+        params -- parameters of the request sent in the URL (default: None)
+        data -- parameters of the request sent in the body (default: None)
+        retryStatusCodes -- status codes of responses to retry (default defined in constants module)
+    """
+
+    method = 'GET' if data is None else 'POST'
+    with request(method, url, params=params, data=data, retryStatusCodes=retryStatusCodes) as r:
+        r.raise_for_status()  # raises exception when not a 2xx response
+        return r
+
+
+def request(method, url, params=None, data=None, headers=None, stream=False, retryStatusCodes=None):
+    """This method sends a request and retries it, when it fails on connection error, timeout
+       or on one of retryStatusCodes. Waiting time between retries grows exponentially
+       with random jitter, unless the server says how long to wait in Retry-After header.
+       Calls to Mediawiki API are sent with maxlag parameter, so they are postponed when the servers are lagged.
+       Response is returned also when it is not a 2xx response, but cannot be retried (e.g., 404).
+
+        Keyword arguments:
+        method -- HTTP method of the request
+        url -- URL of the request
+        params -- parameters of the request sent in the URL (default: None)
+        data -- parameters of the request sent in the body (default: None)
+        headers -- additional headers of the request (default: None)
+        stream -- if True the content is not downloaded immediately (default: False)
+        retryStatusCodes -- status codes of responses to retry (default defined in constants module)
+    """
+
+    if retryStatusCodes is None:
+        retryStatusCodes = HTTP_RETRY_STATUS_CODES
+    if cache.isOffline():
+        raise requests.exceptions.ConnectionError(f'Request to {url} is not cached and the cache is in offline mode')
+    params = dict(params) if params else {}
+    if url in [MWAPI_URL, WIKIMEDIA_COMMONS_API_URL]:
+        params.setdefault('maxlag', MAXLAG)
+    endpoint = getEndpoint(url)
+
+    error = None
+    for attempt in range(HTTP_MAX_RETRIES + 1):
+        checkErrorBudget(endpoint)
+        start = time.monotonic()
+        retryAfter = None
+        try:
+            response = getSession().request(method, getUrl(url), params=params or None, data=data,
+                                            headers=headers, stream=stream, timeout=HTTP_TIMEOUT)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = e
+        else:
+            if response.status_code in retryStatusCodes or \
+                    response.headers.get('MediaWiki-API-Error') == 'maxlag':
+                error = requests.exceptions.HTTPError(f'{response.status_code} {response.reason} - {url}',
+                                                      response=response)
+                retryAfter = getRetryAfter(response)
+                response.close()
+            else:
+                # Streamed responses are not read yet, their bytes are counted while they are read, see countBytes
+                size = 0 if stream else len(response.content)
+                recordRequest(endpoint, time.monotonic() - start, response=response, size=size)
+                return response
+
+        recordRequest(endpoint, time.monotonic() - start, retry=attempt < HTTP_MAX_RETRIES)
+        if attempt < HTTP_MAX_RETRIES:
+            delay = retryAfter if retryAfter is not None else getBackoff(attempt)
+            logging.warning(f'Request to {endpoint} failed ({error}), retrying in {delay:.1f} s')
+            time.sleep(delay)
+
+    raise requests.exceptions.RetryError(f'Request to {endpoint} failed {HTTP_MAX_RETRIES + 1} times') from error
+
+
+def setUrlOverrides(overrides):
+    """This method sets replacements of URL prefixes used by all the following requests of this process
+       and of the worker processes started afterwards. Statistics and error budget are still kept under
+       the original endpoints. Passing None removes all the replacements.
+
+        Keyword arguments:
+        overrides -- dictionary with URL prefixes as keys and their replacements as values
+                     (e.g., {'https://query.wikidata.org/sparql': 'http://localhost:8000/sparql'})
+    """
+
+    if overrides:
+        os.environ[URL_OVERRIDES_VARIABLE] = json.dumps(overrides)
+    else:
+        os.environ.pop(URL_OVERRIDES_VARIABLE, None)
+
+
+def getUrl(url):
+    """This method returns the URL the request is actually sent to, the longest matching prefix set
+       by setUrlOverrides is replaced. The URL is returned unchanged, when no prefix matches.
+
+        Keyword arguments:
+        url -- URL of the request
+    """
+
+    overrides = json.loads(os.environ.get(URL_OVERRIDES_VARIABLE, '{}'))
+    prefixes = [prefix for prefix in overrides if url.startswith(prefix)]
+    if not prefixes:
+        return url
+    prefix = max(prefixes, key=len)
+
+    return overrides[prefix] + url[len(prefix):]
+
+
+def isCached(url):
+    """This method checks if the responses from the URL are cached. Responses of overridden URLs are never
+       cached, so they are not mixed with the responses of the real endpoints.
+
+        Keyword arguments:
+        url -- URL of the request
+    """
+
+    return cache.isCached(url) and getUrl(url) == url
+
+
+def getBackoff(attempt):
+    """This method returns time to wait before next retry. It is an exponential backoff with full jitter,
+       so the workers failing at the same time do not retry at the same time.
+
+        Keyword arguments:
+        attempt -- number of the failed attempt, starting with 0
+    """
+
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def getRetryAfter(response):
+    """This method returns number of seconds from Retry-After header of the response or None if it is missing.
+       The header can contain either number of seconds or a HTTP date.
+
+        Keyword arguments:
+        response -- response of the server
+    """
+
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def getEndpoint(url):
+    """This method returns endpoint of the URL, statistics and error budget are kept per endpoint.
+       Endpoint of the API calls is the URL of the API, all other requests (e.g., images) are grouped by the host.
+
+        Keyword arguments:
+        url -- URL of the request
+    """
+
+    if url in [SPARQL_URL, MWAPI_URL, WIKIMEDIA_COMMONS_API_URL]:
+        return url
+    parsedUrl = urlparse(url)
+    return f'{parsedUrl.scheme}://{parsedUrl.netloc}'
+
+
+def checkErrorBudget(endpoint):
+    """This method raises an exception if the error budget of the endpoint is spent and the endpoint is paused.
+
+        Keyword arguments:
+        endpoint -- endpoint to check
+    """
+
+    with statsLock:
+        if blockedUntil.get(endpoint, 0) > time.monotonic():
+            raise requests.exceptions.RetryError(f'Error budget of {endpoint} is spent, endpoint is paused')
+
+
+def recordRequest(endpoint, latency, response=None, size=0, retry=False):
+    """This method records one request in the statistics and in the error budget of the endpoint.
+       Request without a response is considered as failed.
+
+        Keyword arguments:
+        endpoint -- endpoint the request was sent to
+        latency -- time from sending the request to receiving the response headers in seconds
+        response -- response of the server (default: None)
+        size -- number of downloaded bytes (default: 0)
+        retry -- True if the request is going to be retried (default: False)
+    """
+
+    failed = response is None or not response.ok
+    with statsLock:
+        endpointStats = getEndpointStats(endpoint)
+        endpointStats['requests'] += 1
+        endpointStats['errors'] += failed
+        endpointStats['retries'] += retry
+        endpointStats['bytes'] += size
+        endpointStats['latency']['sum'] += latency
+        endpointStats['latency']['count'] += 1
+        bucket = next((bucket for bucket in LATENCY_BUCKETS if latency <= bucket), '+Inf')
+        endpointStats['latency']['buckets'][str(bucket)] += 1
+
+        window = errorWindows[endpoint]
+        # Not found pages are a valid answer, they are not counted into the error budget
+        window.append(failed and (response is None or response.status_code >= 500))
+        if len(window) == ERROR_BUDGET_WINDOW and sum(window) > ERROR_BUDGET * ERROR_BUDGET_WINDOW:
+            blockedUntil[endpoint] = time.monotonic() + ERROR_BUDGET_COOLDOWN
+            window.clear()
+            logging.error(f'Error budget of {endpoint} is spent, pausing it for {ERROR_BUDGET_COOLDOWN} s')
+
+
+def recordBytes(endpoint, size, cached=False):
+    """This method adds bytes read from a response to the statistics of the endpoint.
+
+        Keyword arguments:
+        endpoint -- endpoint the request was sent to
+        size -- number of read bytes
+        cached -- True if the bytes are read from the cache (default: False)
+    """
+
+    with statsLock:
+        getEndpointStats(endpoint)['cachedBytes' if cached else 'bytes'] += size
+
+
+def recordCacheHit(endpoint, size=0):
+    """This method records one response of the endpoint read from the cache instead of sending a request.
+
+        Keyword arguments:
+        endpoint -- endpoint the request would be sent to
+        size -- number of bytes of the cached response, streamed responses are counted by countBytes (default: 0)
+    """
+
+    with statsLock:
+        endpointStats = getEndpointStats(endpoint)
+        endpointStats['cacheHits'] += 1
+        endpointStats['cachedBytes'] += size
+
+
+def getEndpointStats(endpoint):
+    """This method returns the statistics of the endpoint, they are created on the first request.
+       It has to be called with statsLock acquired.
+
+        Keyword arguments:
+        endpoint -- endpoint of the statistics
+    """
+
+    if endpoint not in stats:
+        stats[endpoint] = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'bytes': 0,
+            'cacheHits': 0,
+            'cachedBytes': 0,
+            'latency': {
+                'buckets': {str(bucket): 0 for bucket in LATENCY_BUCKETS + ['+Inf']},
+                'sum': 0.0,
+                'count': 0
+            }
+        }
+        errorWindows[endpoint] = deque(maxlen=ERROR_BUDGET_WINDOW)
+
+    return stats[endpoint]
+
+
+def getStats():
+    """This method returns a copy of statistics of all requests sent by the client. Statistics are
+       grouped by endpoint and contain number of requests, errors, retries, downloaded bytes, number
+       of responses and bytes read from the cache and histogram of latencies (number of requests with latency
+       lower or equal to the bucket, but higher than the previous bucket).
+
+        Keyword arguments:
+        None
+    """
+
+    with statsLock:
+        return copy.deepcopy(stats)
@@ -13,7 +13,8 @@ from constants import ALLOWED_EXTENSIONS, IMAGES_DIRECTORY
 
 def removeBrokenImages(data):
     """This method removes broken images in passed dataset. Broken images are images that cannot be opened
-       or worked with packages Pillow or cv2.
+       or worked with packages Pillow or cv2. Images that were not downloaded (e.g., skipped by the download
+       priority) are kept.
 
         Keyword arguments:
         data -- processed data from sparql endpoint
@@ -21,6 +22,8 @@ def removeBrokenImages(data):
     for person in tqdm(list(data.values()), desc='removeBrokenImages', miniters=int(len(data) / 100)):
         if 'images' in person:
             for image in list(person['images'].values()):
+                if 'fileNameLocal' not in image:
+                    continue
                 if os.path.exists(f'{IMAGES_DIRECTORY}/{image["fileNameLocal"]}'):
                     if isImageBroken(f'{IMAGES_DIRECTORY}/{image["fileNameLocal"]}'):
                         logging.info(f'Removing image - {image["fileNameLocal"]} because it is broken')
@@ -5,57 +5,91 @@ import os, logging
 
 from create.ageFinder import addAgeToImages
 from create.corrector import removeBrokenImages
-from create.merger import mergeListOfValues, mergeDatasets
+from create.merger import mergeListOfValues, mergeDatasets, replaceImageMetadata
 from create.utils import readData, saveData
-from create.transformer import removeBrokenData, processSparqlData, simplifySparqlData
 from create.dataCollectionSetup import config
 from create.sorter import orderData, changeOrderOfProperties
+from create import journal, scheduler, instrumentation
 from create.labeler import labelTags
-from create.downloader import getRawSparqlData, getThumbnails, getMetadataAndLinks, getPictures
-from constants import START_YEAR, END_YEAR, YEAR_STEP, DATA_DIRECTORY
+from create.downloader import getSparqlData, getThumbnails, getMetadataAndLinks, getPictures
+from create.dumpReader import readDump, getDumpData
+from constants import START_YEAR, END_YEAR, YEAR_STEP, DATA_DIRECTORY, DATA_SOURCE, DUMP_LOCATION, STORAGE_FORMAT, \
+    STORAGE_COMPRESSION
 
 
-def fullDataDownload():
+def fullDataDownload(processes=None):
     """This method create the database, download all the data and process it.
-       This method contains only the data collection part.
+       This method contains only the data collection part. People are downloaded from the SPARQL endpoint
+       or read from the Wikidata dump, depending on DATA_SOURCE. Completed work is journaled, so the method
+       continues where it stopped, when it is run again after a crash. Years are processed in parallel
+       by worker processes, see scheduler module. When all the years are completed, the next generation
+       of the job is started, so the next run downloads them again. Every stage is measured,
+       see instrumentation module.
 
        Keyword arguments:
-        None
+        processes -- number of worker processes (default defined in constants module)
     """
 
     config()
-    for year in range(START_YEAR, END_YEAR, YEAR_STEP):
-        print(f'Starting year: {year}!')
-        if os.path.isfile(f'{DATA_DIRECTORY}/{year}.json'):
-            foundData = readData(f'{DATA_DIRECTORY}/{year}.json')
-        else:
-            foundData = {}
-        data = getRawSparqlData(year, year + YEAR_STEP)
-        data = removeBrokenData(data)
-        data = simplifySparqlData(data)
-        data = processSparqlData(data)
-        data = mergeListOfValues(data)
-
-        data = labelTags(data)
-        data = getThumbnails(data)
-        data = getMetadataAndLinks(data)
-
-        data = addAgeToImages(data)
-
-        data = orderData(data)
-        data = changeOrderOfProperties(data)
-        data = mergeDatasets([foundData, data])
-        data = mergeListOfValues(data)
-        saveData(data, f'{DATA_DIRECTORY}/{year}.json')
-
-        data = getPictures(data)
-        data = removeBrokenImages(data)
-
-        data = orderData(data)
-        data = changeOrderOfProperties(data)
-        saveData(data, f'{DATA_DIRECTORY}/{year}.json')
-        logging.info(f"Year {str(year)} was completed!")
+    instrumentation.startRun('dataCollection')
+    generation = scheduler.getGeneration('dataCollection')
+    if DATA_SOURCE == 'dump':
+        journal.openJournal(f'dump-{generation}')
+        if not journal.getEntries('dump'):
+            instrumentation.runStage('readDump', None, readDump, DUMP_LOCATION)
+            journal.addEntry('dump', DUMP_LOCATION, True)
+        journal.closeJournal()
 
+    if scheduler.runYears('dataCollection', downloadYear, range(START_YEAR, END_YEAR, YEAR_STEP), processes,
+                          initializer=config, generation=generation):
+        # All the years are completed, so the next run starts from the beginning
+        journal.removeJournal(f'dump-{generation}')
+        scheduler.resetYears('dataCollection', generation)
+
+
+def downloadYear(year):
+    """This method downloads all the data of one year and processes it. The journal of the year is removed,
+       when the year is completed, so the next generation of the job does not skip its work.
+
+       Keyword arguments:
+        year -- year to download
+    """
+
+    journal.openJournal(year)
+    print(f'Starting year: {year}!')
+    if os.path.isfile(f'{DATA_DIRECTORY}/{year}.json'):
+        foundData = instrumentation.runStage('readData', year, readData, f'{DATA_DIRECTORY}/{year}.json')
+    else:
+        foundData = {}
+    if DATA_SOURCE == 'dump':
+        data = instrumentation.runStage('getDumpData', year, getDumpData, year, year + YEAR_STEP)
+    else:
+        data = instrumentation.runStage('getSparqlData', year, getSparqlData, year, year + YEAR_STEP)
+    data = instrumentation.runStage('mergeListOfValues', year, mergeListOfValues, data)
+
+    data = instrumentation.runStage('labelTags', year, labelTags, data)
+    data = instrumentation.runStage('getThumbnails', year, getThumbnails, data)
+    data = instrumentation.runStage('getMetadataAndLinks', year, getMetadataAndLinks, data)
+
+    data = instrumentation.runStage('addAgeToImages', year, addAgeToImages, data)
+
+    data = instrumentation.runStage('orderData', year, orderData, data)
+    data = instrumentation.runStage('changeOrderOfProperties', year, changeOrderOfProperties, data)
+    foundData = instrumentation.runStage('replaceImageMetadata', year, replaceImageMetadata, foundData, data)
+    data = instrumentation.runStage('mergeDatasets', year, mergeDatasets, [foundData, data])
+    data = instrumentation.runStage('mergeListOfValuesAfterMerge', year, mergeListOfValues, data)
+    instrumentation.runStage('saveData', year, saveData, data, f'{DATA_DIRECTORY}/{year}.json',
+                             format=STORAGE_FORMAT, compression=STORAGE_COMPRESSION)
+
+    data = instrumentation.runStage('getPictures', year, getPictures, data)
+    data = instrumentation.runStage('removeBrokenImages', year, removeBrokenImages, data)
+
+    data = instrumentation.runStage('orderDataAfterPictures', year, orderData, data)
+    data = instrumentation.runStage('changeOrderOfPropertiesAfterPictures', year, changeOrderOfProperties, data)
+    instrumentation.runStage('saveDataAfterPictures', year, saveData, data, f'{DATA_DIRECTORY}/{year}.json',
+                             format=STORAGE_FORMAT, compression=STORAGE_COMPRESSION)
+    journal.removeJournal(year)
+    logging.info(f"Year {str(year)} was completed!")
 
 if __name__ == '__main__':
     fullDataDownload()
\ No newline at end of file
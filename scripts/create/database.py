@@ -0,0 +1,360 @@
+# Module name: Database
+# Purpose: This module contains an optional SQLite store of the dataset with normalised tables of people,
+#          their values (gender, nationality, occupation), images and faces. It is built from the year files
+#          by buildDatabase and queried by queryPeople and queryImages, which return the same dictionaries
+#          as the year files and the transformers, so the consumers do not have to read all the year files.
+
+import json
+import os
+import sqlite3
+
+from tqdm import tqdm
+
+from constants import DATABASE_LOCATION, DATA_DIRECTORY, START_YEAR, END_YEAR, YEAR_STEP, PERSON_STRUCTURE, \
+    PROPERTIES_WITH_TAGS, PERSON_PROPERTIES_FOR_TRAINING, IMAGE_PROPERTIES_FOR_TRAINING
+from create.utils import readData
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS years (
+        year INTEGER PRIMARY KEY,
+        modified REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS people (
+        wikidataID TEXT PRIMARY KEY,
+        birthYear INTEGER NOT NULL,
+        name TEXT,
+        description TEXT,
+        birthDate TEXT,
+        deathDate TEXT,
+        wikipediaTitle TEXT
+    );
+    CREATE TABLE IF NOT EXISTS personValues (
+        wikidataID TEXT NOT NULL,
+        property TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (wikidataID, property, position)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS images (
+        id INTEGER PRIMARY KEY,
+        wikidataID TEXT NOT NULL,
+        fileNameWiki TEXT NOT NULL,
+        fileNameLocal TEXT,
+        extension TEXT,
+        age INTEGER,
+        faceCount INTEGER,
+        data TEXT NOT NULL,
+        UNIQUE (wikidataID, fileNameWiki)
+    );
+    CREATE TABLE IF NOT EXISTS faces (
+        imageId INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        box TEXT NOT NULL,
+        score REAL,
+        PRIMARY KEY (imageId, position)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS peopleBirthYear ON people (birthYear);
+    CREATE INDEX IF NOT EXISTS personValuesValue ON personValues (property, value);
+    CREATE INDEX IF NOT EXISTS imagesFileNameLocal ON images (fileNameLocal);
+    CREATE INDEX IF NOT EXISTS imagesAge ON images (age);
+    CREATE INDEX IF NOT EXISTS imagesFaceCount ON images (faceCount, age);
+'''
+
+
+def connect(location=None):
+    """This method opens the database and creates its tables and indexes, if they do not exist.
+
+        Keyword arguments:
+        location -- location of the database (default defined in constants module)
+    """
+
+    if location is None:
+        location = DATABASE_LOCATION
+
+    # Worker processes of the face detection update their years at once, see faceDetectionProcess
+    connection = sqlite3.connect(location, timeout=60)
+    connection.row_factory = sqlite3.Row
+    # Readers are not blocked by the writer and the year is written to the disk only once
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+
+    return connection
+
+
+def buildDatabase(location=None, years=None):
+    """This method saves all the year files into the database. Only years, whose file was modified after
+       it was saved to the database last time, are saved again, so the database can be updated after every
+       run of the data collection or face detection.
+
+        Keyword arguments:
+        location -- location of the database (default defined in constants module)
+        years -- list of years to save (default: all the years between START_YEAR and END_YEAR)
+    """
+
+    if years is None:
+        years = range(START_YEAR, END_YEAR, YEAR_STEP)
+
+    connection = connect(location)
+    try:
+        savedYears = {row['year']: row['modified'] for row in connection.execute('SELECT year, modified FROM years')}
+        for year in tqdm(years, desc='buildDatabase'):
+            file = f'{DATA_DIRECTORY}/{year}.json'
+            if not os.path.isfile(file) or savedYears.get(year) == os.path.getmtime(file):
+                continue
+            with connection:
+                saveYear(connection, readData(file), year)
+                connection.execute('INSERT OR REPLACE INTO years VALUES (?, ?)', (year, os.path.getmtime(file)))
+    finally:
+        connection.close()
+
+
+def saveYear(connection, data, year):
+    """This method replaces all the people born in the year in the database with the people from the data.
+       Values, images and faces of the people from the data are replaced too, even if they were saved
+       with another year (people with more birth years).
+
+        Keyword arguments:
+        connection -- connection to the database
+        data -- processed data of the year
+        year -- birth year of the people
+    """
+
+    removeYear(connection, year)
+    # Replaced images get new IDs, so the faces of the old ones have to be removed with them
+    wikidataIDs = [(person['wikidataID'],) for person in data.values()]
+    connection.executemany('DELETE FROM faces WHERE imageId IN (SELECT id FROM images WHERE wikidataID = ?)',
+                           wikidataIDs)
+    connection.executemany('DELETE FROM images WHERE wikidataID = ?', wikidataIDs)
+    connection.executemany('DELETE FROM personValues WHERE wikidataID = ?', wikidataIDs)
+
+    people, values, faces = [], [], []
+    for person in data.values():
+        people.append((person['wikidataID'], year, person.get('name'), person.get('description'),
+                       toColumn(person.get('birthDate')), toColumn(person.get('deathDate')),
+                       person.get('wikipediaTitle')))
+        for property in PROPERTIES_WITH_TAGS:
+            for position, value in enumerate(person.get(property, [])):
+                values.append((person['wikidataID'], property, position, value))
+    connection.executemany('INSERT OR REPLACE INTO people VALUES (?, ?, ?, ?, ?, ?, ?)', people)
+    connection.executemany('INSERT OR REPLACE INTO personValues VALUES (?, ?, ?, ?)', values)
+
+    for person in data.values():
+        for image in person.get('images', {}).values():
+            imageData = {key: value for key, value in image.items() if key != 'faces'}
+            cursor = connection.execute(
+                'INSERT OR REPLACE INTO images (wikidataID, fileNameWiki, fileNameLocal, extension, age, faceCount, '
+                'data) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (person['wikidataID'], image['fileNameWiki'], image.get('fileNameLocal'), image.get('extension'),
+                 image.get('age'), len(image['faces']) if 'faces' in image else None,
+                 json.dumps(imageData, ensure_ascii=False)))
+            for position, face in enumerate(image.get('faces', [])):
+                faces.append((cursor.lastrowid, position, json.dumps(face['box']), face.get('score')))
+    connection.executemany('INSERT OR REPLACE INTO faces VALUES (?, ?, ?, ?)', faces)
+
+
+def removeYear(connection, year):
+    """This method removes all the people born in the year from the database with their images and faces.
+
+        Keyword arguments:
+        connection -- connection to the database
+        year -- birth year of the people
+    """
+
+    people = 'SELECT wikidataID FROM people WHERE birthYear = ?'
+    connection.execute(f'DELETE FROM faces WHERE imageId IN (SELECT id FROM images WHERE wikidataID IN ({people}))',
+                       (year,))
+    connection.execute(f'DELETE FROM images WHERE wikidataID IN ({people})', (year,))
+    connection.execute(f'DELETE FROM personValues WHERE wikidataID IN ({people})', (year,))
+    connection.execute('DELETE FROM people WHERE birthYear = ?', (year,))
+
+
+def toColumn(value):
+    """This method converts value of the date into the column, lists of dates are saved as JSON.
+
+        Keyword arguments:
+        value -- date or list of dates
+    """
+
+    return json.dumps(value) if isinstance(value, list) else value
+
+
+def fromColumn(value):
+    """This method converts the column back into the date or list of dates, see toColumn.
+
+        Keyword arguments:
+        value -- value of the column
+    """
+
+    return json.loads(value) if value.startswith('[') else value
+
+
+def queryPeople(wikidataIDs=None, fromYear=None, toYear=None, location=None):
+    """This method returns people from the database in the same format as in the year files,
+       as a dictionary with wikidataIDs as keys.
+
+        Keyword arguments:
+        wikidataIDs -- list of wikidataIDs of the people (default: all the people)
+        fromYear -- first birth year (default: None)
+        toYear -- first birth year after the range (default: None)
+        location -- location of the database (default defined in constants module)
+    """
+
+    conditions, params = [], []
+    if wikidataIDs is not None:
+        conditions.append(f'wikidataID IN ({", ".join("?" * len(wikidataIDs))})')
+        params.extend(wikidataIDs)
+    if fromYear is not None:
+        conditions.append('birthYear >= ?')
+        params.append(fromYear)
+    if toYear is not None:
+        conditions.append('birthYear < ?')
+        params.append(toYear)
+
+    connection = connect(location)
+    try:
+        selection = f'SELECT wikidataID FROM people WHERE {" AND ".join(conditions) or "1"}'
+        people = readPeople(connection, selection, params)
+        imageSelection = f'SELECT id FROM images WHERE wikidataID IN ({selection})'
+        for wikidataID, image in readImages(connection, imageSelection, params):
+            people[wikidataID]['images'][image['fileNameWiki']] = image
+    finally:
+        connection.close()
+
+    return people
+
+
+def queryImages(withAge=False, minAge=None, maxAge=None, faces=None, genders=None, excludeExtensions=None,
+                withWikipedia=False, fromYear=None, toYear=None, personProperties=None, imageProperties=None,
+                location=None):
+    """This method returns images from the database in the same format as transformer.toImageData, every image
+       contains the properties of its person and its own properties. Filters are evaluated by indexed queries,
+       e.g. the images used for age estimation training (see merger.mergeAllDataForTrainingAge) are returned by
+       queryImages(withAge=True, minAge=17, maxAge=80, faces=1, excludeExtensions=BANNED_EXTENSIONS).
+
+        Keyword arguments:
+        withAge -- if True only images with found age are returned (default: False)
+        minAge -- minimal age in the image (default: None)
+        maxAge -- maximal age in the image (default: None)
+        faces -- number of detected faces in the image (default: None)
+        genders -- if passed only people with exactly one gender, which is in the list, are returned (default: None)
+        excludeExtensions -- list of extensions of images, which are not returned (default: None)
+        withWikipedia -- if True only people with Wikipedia page are returned (default: False)
+        fromYear -- first birth year (default: None)
+        toYear -- first birth year after the range (default: None)
+        personProperties -- properties of the person added to the image (default defined in constants module)
+        imageProperties -- properties of the image (default defined in constants module)
+        location -- location of the database (default defined in constants module)
+    """
+
+    if personProperties is None:
+        personProperties = PERSON_PROPERTIES_FOR_TRAINING
+    if imageProperties is None:
+        imageProperties = IMAGE_PROPERTIES_FOR_TRAINING
+
+    conditions, params = [], []
+    if withAge or minAge is not None or maxAge is not None:
+        conditions.append('i.age IS NOT NULL')
+    if minAge is not None:
+        conditions.append('i.age >= ?')
+        params.append(minAge)
+    if maxAge is not None:
+        conditions.append('i.age <= ?')
+        params.append(maxAge)
+    if faces is not None:
+        conditions.append('i.faceCount = ?')
+        params.append(faces)
+    if excludeExtensions:
+        conditions.append(f'i.extension NOT IN ({", ".join("?" * len(excludeExtensions))})')
+        params.extend(excludeExtensions)
+    if genders is not None:
+        conditions.append("(SELECT COUNT(*) FROM personValues v WHERE v.wikidataID = p.wikidataID "
+                          "AND v.property = 'gender') = 1")
+        conditions.append(f"EXISTS (SELECT 1 FROM personValues v WHERE v.wikidataID = p.wikidataID "
+                          f"AND v.property = 'gender' AND v.value IN ({', '.join('?' * len(genders))}))")
+        params.extend(genders)
+    if withWikipedia:
+        conditions.append('p.wikipediaTitle IS NOT NULL')
+    if fromYear is not None:
+        conditions.append('p.birthYear >= ?')
+        params.append(fromYear)
+    if toYear is not None:
+        conditions.append('p.birthYear < ?')
+        params.append(toYear)
+
+    connection = connect(location)
+    try:
+        # Selected images are kept in a temporary table, so the filters are evaluated only once
+        connection.execute('DROP TABLE IF EXISTS temp.selectedImages')
+        connection.execute(f'CREATE TEMP TABLE selectedImages AS SELECT i.id, i.wikidataID FROM images i '
+                           f'JOIN people p ON p.wikidataID = i.wikidataID '
+                           f'WHERE {" AND ".join(conditions) or "1"} ORDER BY i.id', params)
+        people = readPeople(connection, 'SELECT wikidataID FROM temp.selectedImages')
+        images = []
+        for wikidataID, image in readImages(connection, 'SELECT id FROM temp.selectedImages'):
+            info = {key: value for key, value in people[wikidataID].items() if key in personProperties}
+            images.append(info | {key: value for key, value in image.items() if key in imageProperties})
+    finally:
+        connection.close()
+
+    return images
+
+
+def readPeople(connection, selection, params=()):
+    """This method reads people selected by the SQL query with their values, but without images.
+       People are returned as a dictionary with wikidataIDs as keys and their properties in the order
+       of PERSON_STRUCTURE.
+
+        Keyword arguments:
+        connection -- connection to the database
+        selection -- SQL query returning wikidataIDs of the people
+        params -- parameters of the query (default: ())
+    """
+
+    people = {}
+    for row in connection.execute(f'SELECT * FROM people WHERE wikidataID IN ({selection})', params):
+        person = {key: row[key] for key in row.keys() if row[key] is not None}
+        for key in ['birthDate', 'deathDate']:
+            if key in person:
+                person[key] = fromColumn(person[key])
+        people[row['wikidataID']] = person
+    for row in connection.execute(f'SELECT wikidataID, property, value FROM personValues '
+                                  f'WHERE wikidataID IN ({selection}) ORDER BY wikidataID, property, position',
+                                  params):
+        people[row['wikidataID']].setdefault(row['property'], []).append(row['value'])
+
+    for wikidataID, person in people.items():
+        person['images'] = {}
+        people[wikidataID] = {key: person[key] for key in PERSON_STRUCTURE if key in person}
+
+    return people
+
+
+def readImages(connection, selection, params=()):
+    """This method yields tuples of wikidataID and image for all the images selected by the SQL query,
+       images contain their faces.
+
+        Keyword arguments:
+        connection -- connection to the database
+        selection -- SQL query returning IDs of the images
+        params -- parameters of the query (default: ())
+    """
+
+    faces = {}
+    for row in connection.execute(f'SELECT imageId, box, score FROM faces WHERE imageId IN ({selection}) '
+                                  f'ORDER BY imageId, position', params):
+        face = {'box': json.loads(row['box'])}
+        if row['score'] is not None:
+            face['score'] = row['score']
+        faces.setdefault(row['imageId'], []).append(face)
+
+    for row in connection.execute(f'SELECT id, wikidataID, faceCount, data FROM images WHERE id IN ({selection}) '
+                                  f'ORDER BY id', params):
+        image = json.loads(row['data'])
+        if row['faceCount'] is not None:
+            image['faces'] = faces.get(row['id'], [])
+        yield row['wikidataID'], image
+
+
+if __name__ == '__main__':
+    buildDatabase()
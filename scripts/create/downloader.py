@@ -3,113 +3,506 @@
 #          Data comes from various APIs (Wikidata SPARQL API, EN Mediawiki API, Wikipedia Commons API).
 
 import hashlib
+import json
 import logging
 import os
+import tempfile
+import threading
 import requests
 
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from datetime import date, datetime, timedelta
+from functools import partial
 from bs4 import BeautifulSoup
 from tqdm import tqdm
-from urllib.parse import unquote
+from urllib.parse import unquote, urlparse
 
-from create.utils import addDistinctValues
-from constants import IMAGES_DIRECTORY, MWAPI_URL, SPARQL_URL, START_YEAR, HEADERS, FILE_EXT_INDEX, MAX_URI_LENGTH, \
-    FILE_TITLE_OFFSET
+from create import client, journal
+from create.transformer import addPersonToDictionary, parseSparqlTsvLine, removeBrokenRecord, simplifySparqlRecord, \
+    simplifyGroupedSparqlRecord
+from create.utils import addDistinctValues, readData, mergeAndSaveData
+from constants import IMAGES_DIRECTORY, MWAPI_URL, SPARQL_URL, START_YEAR, FILE_EXT_INDEX, API_RESPONSE_BUDGET, \
+    FILE_TITLE_OFFSET, DOWNLOAD_WORKERS, DOWNLOAD_CHUNK_SIZE, HTTP_RETRY_STATUS_CODES, SPARQL_WORKERS, \
+    SPARQL_PARTITION_LIMIT, SPARQL_QUERY_MODE, SPARQL_VALUES_SEPARATOR, SPARQL_IMAGE_SEPARATOR, API_WORKERS, \
+    DATA_DIRECTORY, MAX_IMAGE_BYTES, MAX_IMAGE_PIXELS, DOWNLOAD_MODE, DOWNLOAD_WIDTH, DOWNLOAD_PRIORITY, \
+    ALLOWED_EXTENSIONS, BANNED_EXTENSIONS, END_YEAR, SPARQL_VALUES_CHUNK_SIZE, WIKIDATA_ENTITY_OFFSET, \
+    IMAGE_METADATA_PROPERTIES, JOURNAL_CHUNK_SIZE
 
+# Maximal number of titles in one query for every Mediawiki API, see getApiLimit
+apiLimits = {}
+# Number of titles and total size of responses for every query to the Mediawiki API, see getChunkSize
+responseSizes = {}
+# Local file names of all the downloaded images by SHA-1 of their content, they are loaded from downloadedImages.json
+# in DATA_DIRECTORY on the first use
+downloadedImages = None
+downloadedImagesLock = threading.Lock()
 
-def getRawSparqlData(fromYear=None, toYear=None):
-    """This method gets data about all the people from wikidata between certain years.
+
+def getSparqlData(fromYear=None, toYear=None, workers=None):
+    """This method gets data about all the people from wikidata between certain years and returns them
+       processed the same way as with removeBrokenData, simplifySparqlData and processSparqlData.
+       Responses are parsed as they are downloaded and records are added directly to the dictionary
+       of people, so the memory is bounded by the number of people, not by the number of records.
+       Every year is one partition queried on its own, partitions are queried in parallel.
+       When the query of a partition times out or its result is too large (SPARQL_PARTITION_LIMIT),
+       the partition is split into months and those into days. Completed and split partitions are journaled,
+       so they are not queried again after a restart.
 
         Keyword arguments:
         fromYear -- beginning of the range (default defined in constants module is set to 1840)
         toYear -- end of the range (default defined in constants module is set t 2015)
+        workers -- number of partitions queried at once (default defined in constants module)
     """
 
     if fromYear is None:
         fromYear = START_YEAR
     if toYear is None:
         toYear = datetime.now().year
+    if workers is None:
+        workers = SPARQL_WORKERS
 
-    data = []
-    with requests.Session() as session:
-        for i in tqdm(range(fromYear, toYear), desc='getRawSparqlData'):
-            success = False
-            numOfErrors = 0
-            # Double parantheses as an escape for a F-string, otherwise the content between them is considered a variable
-            query = f'''
-                SELECT DISTINCT ?wikidataID ?name ?description ?imageUrl ?caption ?imageDate ?birthDate ?deathDate ?gender ?nationality ?occupation ?wikipediaTitle WITH {{ 
-                SELECT ?wikidataID ?name ?birthDate WHERE {{
-                    ?wikidataID wdt:P31 wd:Q5;
-                                rdfs:label ?name;
-                                wdt:P569 ?birthDate.
-                                hint:Prior hint:rangeSafe "true"^^xsd:boolean.
-                    FILTER(("{i}-00-00"^^xsd:dateTime <= ?birthDate) && (?birthDate < "{i + 1}-00-00"^^xsd:dateTime))
-                    FILTER((LANG(?name)) = "en")
-                }} }} as %i
-                WHERE {{
-                    INCLUDE %i
-                    OPTIONAL {{ ?wikidataID schema:description ?description.   FILTER((LANG(?description)) = "en") }}
-                    OPTIONAL {{ ?wikidataID wdt:P734 ?lastname. }}
-                    OPTIONAL {{ ?wikidataID wdt:P570 ?deathDate. }}
-                    OPTIONAL {{ ?wikidataID wdt:P27 ?nationality . }}
-                    OPTIONAL {{ ?wikidataID wdt:P106 ?occupation . }}
-                    OPTIONAL {{ ?wikidataID wdt:P21 ?gender. }}
-                    OPTIONAL {{
-                        ?wikidataID p:P18 ?stat.
-                        ?stat ps:P18 ?imageUrl.
-                        OPTIONAL {{ ?stat pq:P2096 ?caption. FILTER (langmatches(lang(?caption), "en")) }}
-                        OPTIONAL {{ ?stat pq:P585 ?imageDate. }}
-                    }}
-                    OPTIONAL {{ ?wikipediaTitle schema:about ?wikidataID; 
-                             schema:isPartOf <https://en.wikipedia.org/>.
-                    }}                    
-                }}
-            '''
-            while not success:
-                try:
-                    r = session.get(url=SPARQL_URL, params={'format': 'json', 'query': query},
-                                    headers=HEADERS)
-                    data.extend(r.json()['results']['bindings'])
-                except requests.exceptions.RequestException as e:
-                    numOfErrors += 1
-                    success = False
-                    logging.exception(f'Exception in request happened')
-                except ValueError as ve:
-                    numOfErrors += 1
-                    success = False
-                    logging.exception(f'Exception in JSON happened')
-                else:
-                    success = True
-                finally:
-                    logging.info(f"Getting SPARQL data for year {str(i)} produced {str(numOfErrors)} errors!")
+    # Dates in the form YEAR-00-00 are the beginnings of years, they are kept to cover exactly the same
+    # range of birth dates as the whole year query
+    partitions = [(f'{year}-00-00', f'{year + 1}-00-00') for year in range(fromYear, toYear)]
+    # Partitions split before the restart are replaced by their parts
+    partitions = replaceSplitPartitions(partitions, journal.getEntries('sparqlSplit'))
+    completedPartitions = journal.getEntries('sparql')
+    journaledPeople = journal.getEntries('sparqlPeople')
+    data = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            tqdm(total=len(partitions), desc='getSparqlData') as progress:
+        pending = {}
+        for partition in partitions:
+            if '/'.join(partition) in completedPartitions:
+                for i in range(completedPartitions['/'.join(partition)]):
+                    for person in journaledPeople[f'{"/".join(partition)}/{i}']:
+                        addPersonToDictionary(person, data)
+                progress.update()
+            else:
+                pending[executor.submit(getSparqlDataForPartition, partition)] = partition
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                partition = pending.pop(future)
+                people = future.result()
+                if people is not None:
+                    journalPartition('/'.join(partition), people)
+                    # One person can be in multiple partitions, when there are more birth dates
+                    for person in people.values():
+                        addPersonToDictionary(person, data)
+                    progress.update()
+                    continue
+
+                subPartitions = splitPartition(partition)
+                if subPartitions is None:
+                    raise requests.exceptions.RetryError(f'SPARQL data for {partition} cannot be downloaded')
+                journal.addEntry('sparqlSplit', '/'.join(partition), subPartitions)
+                logging.info(f'Splitting SPARQL partition {partition} into {len(subPartitions)} partitions')
+                progress.total += len(subPartitions) - 1
+                progress.refresh()
+                for subPartition in subPartitions:
+                    pending[executor.submit(getSparqlDataForPartition, subPartition)] = subPartition
+
+    return data
+
+
+def journalPartition(partition, people):
+    """This method journals people of the completed partition in entries of JOURNAL_CHUNK_SIZE people,
+       so lines of the journal stay small even for large partitions. The partition is journaled as completed
+       with the number of its entries only after all of them, so partially journaled partition is queried again.
+
+        Keyword arguments:
+        partition -- partition joined by a slash
+        people -- dictionary of people of the partition
+    """
+
+    people = list(people.values())
+    starts = range(0, len(people), JOURNAL_CHUNK_SIZE)
+    for i, start in enumerate(starts):
+        journal.addEntry('sparqlPeople', f'{partition}/{i}', people[start:start + JOURNAL_CHUNK_SIZE])
+    journal.addEntry('sparql', partition, len(starts))
+
+
+def replaceSplitPartitions(partitions, splitPartitions):
+    """This method replaces split partitions by their parts, recursively.
+
+        Keyword arguments:
+        partitions -- list of partitions
+        splitPartitions -- dictionary with split partitions joined by a slash as keys and their parts as values
+    """
+
+    result = []
+    for partition in partitions:
+        if '/'.join(partition) in splitPartitions:
+            subPartitions = [tuple(subPartition) for subPartition in splitPartitions['/'.join(partition)]]
+            result.extend(replaceSplitPartitions(subPartitions, splitPartitions))
+        else:
+            result.append(partition)
+
+    return result
+
+
+def getSparqlDataForPartition(partition, wikidataIDs=None, url=None):
+    """This method gets data about all the people born in the partition. None is returned, when the query
+       timed out or its result reached SPARQL_PARTITION_LIMIT, such partition has to be split.
+       The response is requested as TSV, which can be parsed line by line. The query is chosen according
+       to SPARQL_QUERY_MODE. When wikidataIDs are passed, only those people are queried and the query
+       is sent in the body of a POST request, so it is not limited by the length of the URL.
+
+        Keyword arguments:
+        partition -- tuple of the first birth date in the partition and the first birth date after it
+        wikidataIDs -- list of wikidataIDs of people to query (default: None)
+        url -- URL of the SPARQL endpoint (default defined in constants module)
+    """
+
+    if url is None:
+        url = SPARQL_URL
+
+    grouped = SPARQL_QUERY_MODE == 'grouped'
+    if grouped:
+        query = getGroupedSparqlQuery(*partition, limit=SPARQL_PARTITION_LIMIT, wikidataIDs=wikidataIDs)
+    else:
+        query = getSparqlQuery(*partition, limit=SPARQL_PARTITION_LIMIT, wikidataIDs=wikidataIDs)
+    # Timeout of the query is returned as 500 or as a truncated response, it would time out again,
+    # so it is not retried by the client
+    retryStatusCodes = [code for code in HTTP_RETRY_STATUS_CODES if code != 500]
+    people = {}
+    numOfRecords = 0
+    if wikidataIDs is None:
+        params, data = {'query': query}, None
+    else:
+        params, data = None, {'query': query}
+    lines = client.getLines(url, params=params, data=data, headers={'Accept': 'text/tab-separated-values'},
+                            retryStatusCodes=retryStatusCodes)
+    try:
+        header = next(lines, None)
+        if header is None:
+            raise ValueError('Response has no header')
+        variables = [variable[1:] for variable in header.split('\t')]
+        for line in lines:
+            record = parseSparqlTsvLine(line, variables)
+            if grouped:
+                person = simplifyGroupedSparqlRecord(record)
+            else:
+                person = simplifySparqlRecord(removeBrokenRecord(record))
+            addPersonToDictionary(person, people)
+            numOfRecords += 1
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code != 500:
+            raise
+        logging.warning(f'SPARQL query for {partition} timed out')
+        return None
+    except ValueError as ve:
+        logging.warning(f'SPARQL query for {partition} returned invalid response - {ve}')
+        return None
+    finally:
+        # Closes the response, when it was not read to the end
+        lines.close()
+
+    if numOfRecords >= SPARQL_PARTITION_LIMIT:
+        logging.warning(f'SPARQL query for {partition} reached the limit of {SPARQL_PARTITION_LIMIT} results')
+        return None
+
+    return people
+
+
+def splitPartition(partition):
+    """This method splits partition of birth dates into months, or into days when it is not longer than
+       a month. None is returned if the partition is only one day long and cannot be split.
+
+        Keyword arguments:
+        partition -- tuple of the first birth date in the partition and the first birth date after it
+    """
+
+    fromDate, toDate = partition
+    start = parseDate(fromDate)
+    end = parseDate(toDate)
+    if (end - start).days <= 1:
+        return None
+
+    boundaries = []
+    if (end - start).days > 31:
+        month = start.replace(day=1)
+        while month < end:
+            if month > start:
+                boundaries.append(month.isoformat())
+            month = (month + timedelta(days=32)).replace(day=1)
+    else:
+        boundaries = [(start + timedelta(days=day)).isoformat() for day in range(1, (end - start).days)]
+
+    boundaries = [fromDate] + boundaries + [toDate]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parseDate(dateString):
+    """This method parses date used in SPARQL query, the date can contain zero month and day
+       (e.g., 1900-00-00), which is the same as the first day of the year.
+
+        Keyword arguments:
+        dateString -- date in format YEAR-MONTH-DAY
+    """
+
+    year, month, day = [int(part) for part in dateString.split('-')]
+    return date(year, max(month, 1), max(day, 1))
+
+
+def getSparqlQuery(fromDate, toDate, limit=None, wikidataIDs=None):
+    """This method creates SPARQL query for all the people born between two dates.
+
+        Keyword arguments:
+        fromDate -- first birth date in the range
+        toDate -- first birth date after the range
+        limit -- maximum number of returned results (default: None)
+        wikidataIDs -- list of wikidataIDs, the query is restricted to these people (default: None)
+    """
+
+    values = getSparqlValues(wikidataIDs)
+    # Double parantheses as an escape for a F-string, otherwise the content between them is considered a variable
+    query = f'''
+        SELECT DISTINCT ?wikidataID ?name ?description ?imageUrl ?caption ?imageDate ?birthDate ?deathDate ?gender ?nationality ?occupation ?wikipediaTitle WITH {{ 
+        SELECT ?wikidataID ?name ?birthDate WHERE {{
+            {values}
+            ?wikidataID wdt:P31 wd:Q5;
+                        rdfs:label ?name;
+                        wdt:P569 ?birthDate.
+                        hint:Prior hint:rangeSafe "true"^^xsd:boolean.
+            FILTER(("{fromDate}"^^xsd:dateTime <= ?birthDate) && (?birthDate < "{toDate}"^^xsd:dateTime))
+            FILTER((LANG(?name)) = "en")
+        }} }} as %i
+        WHERE {{
+            INCLUDE %i
+            OPTIONAL {{ ?wikidataID schema:description ?description.   FILTER((LANG(?description)) = "en") }}
+            OPTIONAL {{ ?wikidataID wdt:P734 ?lastname. }}
+            OPTIONAL {{ ?wikidataID wdt:P570 ?deathDate. }}
+            OPTIONAL {{ ?wikidataID wdt:P27 ?nationality . }}
+            OPTIONAL {{ ?wikidataID wdt:P106 ?occupation . }}
+            OPTIONAL {{ ?wikidataID wdt:P21 ?gender. }}
+            OPTIONAL {{
+                ?wikidataID p:P18 ?stat.
+                ?stat ps:P18 ?imageUrl.
+                OPTIONAL {{ ?stat pq:P2096 ?caption. FILTER (langmatches(lang(?caption), "en")) }}
+                OPTIONAL {{ ?stat pq:P585 ?imageDate. }}
+            }}
+            OPTIONAL {{ ?wikipediaTitle schema:about ?wikidataID; 
+                     schema:isPartOf <https://en.wikipedia.org/>.
+            }}                    
+        }}
+    '''
+    if limit is not None:
+        query += f'LIMIT {limit}'
+
+    return query
+
+
+def getGroupedSparqlQuery(fromDate, toDate, limit=None, wikidataIDs=None):
+    """This method creates SPARQL query for all the people born between two dates, which returns only one
+       result for every person. Properties with multiple values are concatenated with SPARQL_VALUES_SEPARATOR
+       and every image is concatenated with its caption and date using SPARQL_IMAGE_SEPARATOR.
+       Results of this query are simplified by simplifyGroupedSparqlRecord.
+
+        Keyword arguments:
+        fromDate -- first birth date in the range
+        toDate -- first birth date after the range
+        limit -- maximum number of returned results (default: None)
+        wikidataIDs -- list of wikidataIDs, the query is restricted to these people (default: None)
+    """
+
+    values = getSparqlValues(wikidataIDs)
+    # Separators are control characters, so they are passed to the query as escape sequences
+    valuesSeparator = f'\\u{ord(SPARQL_VALUES_SEPARATOR):04X}'
+    imageSeparator = f'\\u{ord(SPARQL_IMAGE_SEPARATOR):04X}'
+    # Double parantheses as an escape for a F-string, otherwise the content between them is considered a variable
+    query = f'''
+        SELECT ?wikidataID
+            (GROUP_CONCAT(DISTINCT ?name; SEPARATOR="{valuesSeparator}") AS ?names)
+            (GROUP_CONCAT(DISTINCT ?description; SEPARATOR="{valuesSeparator}") AS ?descriptions)
+            (GROUP_CONCAT(DISTINCT STR(?birthDate); SEPARATOR="{valuesSeparator}") AS ?birthDates)
+            (GROUP_CONCAT(DISTINCT STR(?deathDate); SEPARATOR="{valuesSeparator}") AS ?deathDates)
+            (GROUP_CONCAT(DISTINCT STR(?gender); SEPARATOR="{valuesSeparator}") AS ?genders)
+            (GROUP_CONCAT(DISTINCT STR(?nationality); SEPARATOR="{valuesSeparator}") AS ?nationalities)
+            (GROUP_CONCAT(DISTINCT STR(?occupation); SEPARATOR="{valuesSeparator}") AS ?occupations)
+            (GROUP_CONCAT(DISTINCT STR(?wikipediaTitle); SEPARATOR="{valuesSeparator}") AS ?wikipediaTitles)
+            (GROUP_CONCAT(DISTINCT ?image; SEPARATOR="{valuesSeparator}") AS ?images)
+        WITH {{
+        SELECT ?wikidataID ?name ?birthDate WHERE {{
+            {values}
+            ?wikidataID wdt:P31 wd:Q5;
+                        rdfs:label ?name;
+                        wdt:P569 ?birthDate.
+                        hint:Prior hint:rangeSafe "true"^^xsd:boolean.
+            FILTER(("{fromDate}"^^xsd:dateTime <= ?birthDate) && (?birthDate < "{toDate}"^^xsd:dateTime))
+            FILTER((LANG(?name)) = "en")
+        }} }} as %i
+        WHERE {{
+            INCLUDE %i
+            OPTIONAL {{ ?wikidataID schema:description ?description.   FILTER((LANG(?description)) = "en") }}
+            OPTIONAL {{ ?wikidataID wdt:P570 ?deathDate. }}
+            OPTIONAL {{ ?wikidataID wdt:P27 ?nationality . }}
+            OPTIONAL {{ ?wikidataID wdt:P106 ?occupation . }}
+            OPTIONAL {{ ?wikidataID wdt:P21 ?gender. }}
+            OPTIONAL {{
+                ?wikidataID p:P18 ?stat.
+                ?stat ps:P18 ?imageUrl.
+                OPTIONAL {{ ?stat pq:P2096 ?caption. FILTER (langmatches(lang(?caption), "en")) }}
+                OPTIONAL {{ ?stat pq:P585 ?imageDate. }}
+                BIND(CONCAT(STR(?imageUrl), "{imageSeparator}", COALESCE(STR(?caption), ""), "{imageSeparator}",
+                            COALESCE(STR(?imageDate), "")) AS ?image)
+            }}
+            OPTIONAL {{ ?wikipediaTitle schema:about ?wikidataID;
+                     schema:isPartOf <https://en.wikipedia.org/>.
+            }}
+        }}
+        GROUP BY ?wikidataID
+    '''
+    if limit is not None:
+        query += f'LIMIT {limit}'
+
+    return query
+
+
+def getSparqlValues(wikidataIDs):
+    """This method creates VALUES clause of SPARQL query, which restricts the query to the passed people.
+       Empty string is returned, when no wikidataIDs are passed.
+
+        Keyword arguments:
+        wikidataIDs -- list of wikidataIDs
+    """
+
+    if wikidataIDs is None:
+        return ''
+
+    return f'VALUES ?wikidataID {{ wd:{" wd:".join(wikidataIDs)} }}'
+
+
+def getChangedPeople(since, url=None):
+    """This method returns wikidataIDs of all the people modified after the passed time with the time
+       of their last modification (schema:dateModified).
+
+        Keyword arguments:
+        since -- time in format YYYY-MM-DDTHH:MM:SSZ
+        url -- URL of the SPARQL endpoint (default defined in constants module)
+    """
+
+    if url is None:
+        url = SPARQL_URL
+
+    # Double parantheses as an escape for a F-string, otherwise the content between them is considered a variable
+    query = f'''
+        SELECT ?wikidataID ?dateModified WHERE {{
+            ?wikidataID schema:dateModified ?dateModified.
+                        hint:Prior hint:rangeSafe "true"^^xsd:boolean.
+            FILTER("{since}"^^xsd:dateTime < ?dateModified)
+            ?wikidataID wdt:P31 wd:Q5.
+        }}
+    '''
+    changedPeople = {}
+    lines = client.getLines(url, data={'query': query}, headers={'Accept': 'text/tab-separated-values'})
+    try:
+        header = next(lines, None)
+        if header is None:
+            raise ValueError('Response has no header')
+        variables = [variable[1:] for variable in header.split('\t')]
+        for line in lines:
+            record = parseSparqlTsvLine(line, variables)
+            wikidataID = record['wikidataID']['value'][WIKIDATA_ENTITY_OFFSET:]
+            changedPeople[wikidataID] = max(changedPeople.get(wikidataID, ''), record['dateModified']['value'])
+    finally:
+        lines.close()
+
+    return changedPeople
+
+
+def getSparqlDataForPeople(wikidataIDs, chunkSize=None, url=None):
+    """This method gets data about the passed people born between START_YEAR and END_YEAR and returns them
+       processed the same way as getSparqlData. People are queried in chunks of chunkSize.
+
+        Keyword arguments:
+        wikidataIDs -- list of wikidataIDs
+        chunkSize -- number of people in one query (default defined in constants module)
+        url -- URL of the SPARQL endpoint (default defined in constants module)
+    """
+
+    if chunkSize is None:
+        chunkSize = SPARQL_VALUES_CHUNK_SIZE
+
+    partition = (f'{START_YEAR}-00-00', f'{END_YEAR}-00-00')
+    data = {}
+    for i in tqdm(range(0, len(wikidataIDs), chunkSize), desc='getSparqlDataForPeople'):
+        chunk = wikidataIDs[i:i + chunkSize]
+        people = getSparqlDataForPartition(partition, wikidataIDs=chunk, url=url)
+        if people is None:
+            raise requests.exceptions.RetryError(f'SPARQL data for {chunk[0]} - {chunk[-1]} cannot be downloaded')
+        for person in people.values():
+            addPersonToDictionary(person, data)
 
     return data
 
 
-def getThumbnails(data, chunkSize=50):
+def getThumbnails(data, chunkSize=None, workers=None, url=None):
     """This method adds thumbnail images to all people in the passed dataset if they have one on the Wikipedia page,
        the picture is only added if it is not in the set already (from wikidata or other source).
+       Chunks are sent to the API concurrently and their results are saved as they arrive. Completed chunks
+       are journaled, so they are not sent again after a restart.
 
         Keyword arguments:
         data -- processed data from sparql endpoint
         chunkSize -- number of people that can be processed at once, limited by mediawiki API
-                     to 50 for standard user or 500 for user with additional rights (default: 50)
+                     to 50 for standard user or 500 for user with additional rights (default: limit of the user)
+        workers -- number of chunks sent at once (default defined in constants module)
+        url -- URL of the Mediawiki API (default defined in constants module)
     """
 
-    toProcess = []
-    for index, person in enumerate(tqdm(data.values(), desc='getThumbnails', miniters=int(len(data) / 100))):
-        if len(toProcess) >= chunkSize:
-            getThumbnailsForChunk(toProcess, data)
-            toProcess = []
-        if 'wikipediaTitle' in person:
-            toProcess.append(person['wikipediaTitle'])
+    if url is None:
+        url = MWAPI_URL
+    if chunkSize is None:
+        chunkSize = getApiLimit(url)
 
-    if toProcess:
-        getThumbnailsForChunk(toProcess, data)
+    # Completed work is identified by pairs of wikidataID and title, so a title of more people is not skipped
+    # for the people from the chunks, which were not completed
+    completedPeople = set()
+    for chunk in journal.getEntries('thumbnails').values():
+        saveThumbnails(chunk['pages'], data)
+        completedPeople.update((wikidataID, title) for title, wikidataIDs in chunk['titlesDict'].items()
+                               for wikidataID in wikidataIDs)
+
+    def save(pages, titlesDict):
+        title, wikidataIDs = next(iter(titlesDict.items()))
+        journal.addEntry('thumbnails', f'{wikidataIDs[0]}/{title}', {'titlesDict': titlesDict, 'pages': pages})
+        recordResponseSize('thumbnails', titlesDict, pages)
+        saveThumbnails(pages, data)
+
+    runPipeline(getThumbnailsChunks(data, chunkSize, completedPeople), partial(fetchThumbnailsForChunk, url=url), save,
+                workers)
 
     return data
 
 
+def getThumbnailsChunks(data, chunkSize, completedPeople=None):
+    """This method yields chunks of Wikipedia titles of all people in the passed dataset. Chunk is a dictionary
+       with titles as keys and lists of wikidataIDs as values. Chunk is smaller than chunkSize, when the response
+       for it would be bigger than API_RESPONSE_BUDGET.
+
+        Keyword arguments:
+        data -- processed data from sparql endpoint
+        chunkSize -- maximal number of titles in one chunk
+        completedPeople -- set of tuples of wikidataID and title, which are left out (default: None)
+    """
+
+    if completedPeople is None:
+        completedPeople = set()
+
+    toProcess = {}
+    for index, person in enumerate(tqdm(data.values(), desc='getThumbnails', miniters=int(len(data) / 100))):
+        if len(toProcess) >= getChunkSize('thumbnails', chunkSize):
+            yield toProcess
+            toProcess = {}
+        if 'wikipediaTitle' in person and (person['wikidataID'], person['wikipediaTitle']) not in completedPeople:
+            toProcess.setdefault(person['wikipediaTitle'], []).append(person['wikidataID'])
+
+    if toProcess:
+        yield toProcess
+
+
 def getThumbnailsForChunk(titles, people):
     """This method finds all thumbnail images for Wikipedia titles passed in and saves them in the dataset.
 
@@ -118,6 +511,20 @@ def getThumbnailsForChunk(titles, people):
         people -- processed data from sparql endpoint
     """
 
+    saveThumbnails(fetchThumbnailsForChunk(titles), people)
+
+
+def fetchThumbnailsForChunk(titles, url=None):
+    """This method fetches page properties of Wikipedia titles passed in, thumbnail images are part of them.
+
+        Keyword arguments:
+        titles -- list of wikipedia titles or chunk from getThumbnailsChunks
+        url -- URL of the Mediawiki API (default defined in constants module)
+    """
+
+    if url is None:
+        url = MWAPI_URL
+
     # example:
     # https://en.wikipedia.org/w/api.php?action=query&titles=Ayn%20Rand&prop=pageprops&format=json&formatversion=2
 
@@ -129,51 +536,98 @@ def getThumbnailsForChunk(titles, people):
         'formatversion': 2
     }
 
-    with requests.Session() as session:
-        titlesString = "|".join(titles)
-        params['titles'] = titlesString
-        r = session.get(url=MWAPI_URL, params=params, headers=HEADERS)
-        r.raise_for_status()  # raises exception when not a 2xx response
-        data = r.json()['query']['pages']
-        for page in data:
-            if 'pageprops' in page:
-                pageprops = page['pageprops']
-                # Necessary check, because some pictures can lack this link to wikidata
-                if 'wikibase_item' in pageprops:
-                    wikidataID = pageprops["wikibase_item"]
-                    image = {
-                        "caption": [],
-                        "date": [],
-                    }
-                    key = None
-                    if 'page_image' in pageprops:
-                        key = 'page_image'
-                    elif 'page_image_free' in pageprops:
-                        key = 'page_image_free'
-                    if key is not None:
-                        fileNameWiki = unquote(pageprops[key]).replace(" ", "_")
-                        image['fileNameWiki'] = fileNameWiki
-                        image[
-                            'extension'] = f'{os.path.splitext(image["fileNameWiki"])[FILE_EXT_INDEX].lower()}'
-                        addDistinctValues(fileNameWiki, image, people[wikidataID]['images'])
-
-
-def getMetadataAndLinks(data, chunkSize=50):
+    titlesString = "|".join(titles)
+    params['titles'] = titlesString
+    return queryAllPages(url, params)
+
+
+def saveThumbnails(pages, people):
+    """This method saves thumbnail images from fetched page properties in the dataset.
+
+        Keyword arguments:
+        pages -- pages fetched by fetchThumbnailsForChunk
+        people -- processed data from sparql endpoint
+    """
+
+    for page in pages:
+        if 'pageprops' in page:
+            pageprops = page['pageprops']
+            # Necessary check, because some pictures can lack this link to wikidata
+            if 'wikibase_item' in pageprops:
+                wikidataID = pageprops["wikibase_item"]
+                image = {
+                    "caption": [],
+                    "date": [],
+                }
+                key = None
+                if 'page_image' in pageprops:
+                    key = 'page_image'
+                elif 'page_image_free' in pageprops:
+                    key = 'page_image_free'
+                if key is not None:
+                    fileNameWiki = unquote(pageprops[key]).replace(" ", "_")
+                    image['fileNameWiki'] = fileNameWiki
+                    image[
+                        'extension'] = f'{os.path.splitext(image["fileNameWiki"])[FILE_EXT_INDEX].lower()}'
+                    addDistinctValues(fileNameWiki, image, people[wikidataID]['images'])
+
+
+def getMetadataAndLinks(data, chunkSize=None, workers=None):
     """This method finds metadata and links of all images in the passed dataset and saves it back to it.
+       Chunks are sent to the API concurrently and their results are saved as they arrive. Completed chunks
+       are journaled, so they are not sent again after a restart.
 
         Keyword arguments:
         data -- processed data from sparql endpoint
         chunkSize -- number of files that can be processed at once, limited by mediawiki API
-                     to 50 for standard user or 500 for user with additional rights (default: 50)
+                     to 50 for standard user or 500 for user with additional rights (default: limit of the user)
+        workers -- number of chunks sent at once (default defined in constants module)
     """
 
+    if chunkSize is None:
+        chunkSize = getApiLimit(MWAPI_URL)
+
+    # Completed work is identified by pairs of wikidataID and file name, so a file of more people is not skipped
+    # for the people from the chunks, which were not completed
+    completedImages = set()
+    for chunk in journal.getEntries('metadataAndLinks').values():
+        saveMetadataAndLinks(chunk['pages'], chunk['titlesDict'], data)
+        completedImages.update((wikidataID, fileName) for fileName, wikidataIDs in chunk['titlesDict'].items()
+                               for wikidataID in wikidataIDs)
+
+    def save(pages, titlesDict):
+        fileName, wikidataIDs = next(iter(titlesDict.items()))
+        journal.addEntry('metadataAndLinks', f'{wikidataIDs[0]}/{fileName}', {'titlesDict': titlesDict, 'pages': pages})
+        recordResponseSize('metadataAndLinks', titlesDict, pages)
+        saveMetadataAndLinks(pages, titlesDict, data)
+
+    runPipeline(getMetadataAndLinksChunks(data, chunkSize, completedImages), fetchMetadataAndLinksForChunk, save,
+                workers)
+
+    return data
+
+
+def getMetadataAndLinksChunks(data, chunkSize, completedImages=None):
+    """This method yields chunks of images of all people in the passed dataset. Chunk is a dictionary with image
+       file names as keys and lists of wikidataIDs as values. Chunk is smaller than chunkSize, when the response
+       for it would be bigger than API_RESPONSE_BUDGET.
+
+        Keyword arguments:
+        data -- processed data from sparql endpoint
+        chunkSize -- maximal number of files in one chunk
+        completedImages -- set of tuples of wikidataID and file name, which are left out (default: None)
+    """
+
+    if completedImages is None:
+        completedImages = set()
+
     toProcess = {}
-    length = 0
     for i, person in enumerate(tqdm(data.values(), desc='getMetadataAndLinks', miniters=int(len(data) / 100))):
         for j, image in enumerate(person['images'].values()):
-            if len(toProcess) >= chunkSize or length > MAX_URI_LENGTH:
-                getMetadataAndLinksForChunk(toProcess, data)
-                length = 0
+            if (person['wikidataID'], image['fileNameWiki']) in completedImages:
+                continue
+            if len(toProcess) >= getChunkSize('metadataAndLinks', chunkSize):
+                yield toProcess
                 toProcess = {image["fileNameWiki"]: [person['wikidataID']]}
             else:
                 # Some pictures can be used at multiple people, those picture usually would not be used for
@@ -183,13 +637,10 @@ def getMetadataAndLinks(data, chunkSize=50):
                     toProcess[image["fileNameWiki"]].append(person['wikidataID'])
                 else:
                     toProcess[image["fileNameWiki"]] = [person['wikidataID']]
-            length += len(image["fileNameWiki"])
 
     # Easy way how to check if dictionary is empty or not
     if toProcess:
-        getMetadataAndLinksForChunk(toProcess, data)
-
-    return data
+        yield toProcess
 
 
 def getMetadataAndLinksForChunk(titlesDict, data):
@@ -200,108 +651,522 @@ def getMetadataAndLinksForChunk(titlesDict, data):
         data -- processed data from sparql endpoint
     """
 
+    saveMetadataAndLinks(fetchMetadataAndLinksForChunk(titlesDict), titlesDict, data)
+
+
+def fetchMetadataAndLinksForChunk(titlesDict):
+    """This method fetches metadata and links of images in titlesDict.
+
+        Keyword arguments:
+        titlesDict -- dictionary with image file names as keys and wikidataID as values
+    """
+
     # example
-    # https://commons.wikimedia.org/w/api.php?action=query&prop=pageimages|imageinfo&iiprop=extmetadata&piprop=original&titles=File:Ayn_Rand_(1943_Talbot_portrait).jpg&formatversion=2&format=json
+    # https://commons.wikimedia.org/w/api.php?action=query&prop=pageimages|imageinfo&iiprop=extmetadata|size|sha1|mime&piprop=original&titles=File:Ayn_Rand_(1943_Talbot_portrait).jpg&formatversion=2&format=json
 
     params = {
         'action': 'query',
         'titles': '',
         'prop': 'pageimages|imageinfo',
         'piprop': 'original',
-        'iiprop': 'extmetadata',
+        'iiprop': 'extmetadata|size|sha1|mime',
         'format': 'json',
         'formatversion': 2
     }
+    if DOWNLOAD_MODE == 'thumbnail':
+        # URL of the image scaled to the width is returned in thumburl
+        params['iiprop'] += '|url'
+        params['iiurlwidth'] = DOWNLOAD_WIDTH
 
-    with requests.Session() as session:
-        titlesString = f'File:{"|File:".join(list(titlesDict.keys()))}'
-        params['titles'] = titlesString
-        r = session.get(url=MWAPI_URL, params=params, headers=HEADERS)
-        r.raise_for_status()  # raises exception when not a 2xx response
-        pages = r.json()['query']['pages']
-
-        for page in pages:
-            if 'original' in page:
-                # I also cannot use getLastPartOfURL on this image, because there might be some odd names of files
-                # (e.g., they can contain a ? or ;) which mess up with the method
-                fileName = unquote(page['title'][FILE_TITLE_OFFSET:]).replace(' ', '_')
-                # all dict value is a list instead of a single value so it is easier to use
-                for wikidataID in titlesDict[fileName]:
-                    person = data[wikidataID]
-                    image = person['images'][fileName]
-                    metadata = page['imageinfo'][0]['extmetadata']
-
-                    image['url'] = page['original']['source']
-                    if 'DateTime' in metadata:
-                        image['exifDate'] = metadata['DateTime']['value']
-                    if 'ImageDescription' in metadata:  # pujde to prepsat pomoci addDistinct value?
-                        caption = metadata['ImageDescription']['value']
-                        caption = BeautifulSoup(caption, features="html.parser").get_text()
-                        addDistinctValues('caption', caption, image)
-                    if 'DateTimeOriginal' in metadata:
-                        date = metadata['DateTimeOriginal']['value']
-                        date = BeautifulSoup(date, features="html.parser").get_text()
-                        addDistinctValues('date', date, image)
+    titlesString = f'File:{"|File:".join(list(titlesDict.keys()))}'
+    params['titles'] = titlesString
+    return queryAllPages(MWAPI_URL, params)
+
+
+def saveMetadataAndLinks(pages, titlesDict, data):
+    """This method saves fetched metadata and links of images in titlesDict to the dataset. In 'thumbnail'
+       download mode the link to the scaled image is saved together with its scale, which is the ratio
+       of its width to the width of the original. Faces are detected in the downloaded image, so their boxes
+       are in the coordinates of the scaled image, dividing them by the scale gives the boxes in the original.
+
+        Keyword arguments:
+        pages -- pages fetched by fetchMetadataAndLinksForChunk
+        titlesDict -- dictionary with image file names as keys and wikidataID as values, used for storing the fetched data in correct place
+        data -- processed data from sparql endpoint
+    """
+
+    for page in pages:
+        if 'original' in page:
+            # I also cannot use getLastPartOfURL on this image, because there might be some odd names of files
+            # (e.g., they can contain a ? or ;) which mess up with the method
+            fileName = unquote(page['title'][FILE_TITLE_OFFSET:]).replace(' ', '_')
+            # all dict value is a list instead of a single value so it is easier to use
+            for wikidataID in titlesDict[fileName]:
+                person = data[wikidataID]
+                image = person['images'][fileName]
+                imageinfo = page['imageinfo'][0]
+                metadata = imageinfo['extmetadata']
+
+                url, scale = page['original']['source'], None
+                if DOWNLOAD_MODE == 'thumbnail' and 'thumburl' in imageinfo:
+                    url = imageinfo['thumburl']
+                    scale = imageinfo['thumbwidth'] / imageinfo['width'] if imageinfo.get('width') else 1
+                image['url'] = url
+                if scale is not None:
+                    image['scale'] = scale
+                else:
+                    image.pop('scale', None)
+                # Size and hash of the file are used to skip the download of oversize and already downloaded files
+                for property in IMAGE_METADATA_PROPERTIES:
+                    if property in imageinfo:
+                        image[property] = imageinfo[property]
+                if 'DateTime' in metadata:
+                    image['exifDate'] = metadata['DateTime']['value']
+                if 'ImageDescription' in metadata:  # pujde to prepsat pomoci addDistinct value?
+                    caption = metadata['ImageDescription']['value']
+                    caption = BeautifulSoup(caption, features="html.parser").get_text()
+                    addDistinctValues('caption', caption, image)
+                if 'DateTimeOriginal' in metadata:
+                    date = metadata['DateTimeOriginal']['value']
+                    date = BeautifulSoup(date, features="html.parser").get_text()
+                    addDistinctValues('date', date, image)
+        else:
+            imageName= unquote(page['title'][FILE_TITLE_OFFSET:]).replace(' ', '_')
+            auxWikidataID = titlesDict[imageName]
+            logging.error(f'Image {imageName} from {auxWikidataID} does not exist')
+
+
+def queryAllPages(url, params):
+    """This method sends a query to the Mediawiki API and follows its continuation, until all the results
+       are returned. Results for one page can be divided into multiple responses, they are merged together.
+       Pages are returned in the order of the first response. Query is sent as POST request, so its size
+       is not limited by the maximal length of URI.
+
+        Keyword arguments:
+        url -- URL of the API
+        params -- parameters of the query
+    """
+
+    # example of continuation
+    # https://www.mediawiki.org/wiki/API:Continue
+
+    params = dict(params)
+    pages = {}
+    while True:
+        response = client.getJson(url, data=params)
+        for page in response.get('query', {}).get('pages', []):
+            if page['title'] in pages:
+                mergePages(page, pages[page['title']])
             else:
-                imageName= unquote(page['title'][FILE_TITLE_OFFSET:]).replace(' ', '_')
-                auxWikidataID = titlesDict[imageName]
-                logging.error(f'Image {imageName} from {auxWikidataID} does not exist')
+                pages[page['title']] = page
+        if 'continue' not in response:
+            break
+        params.update(response['continue'])
+
+    return list(pages.values())
+
+
+def mergePages(page, mergedPage):
+    """This method merges properties of the page from the continuation of a query into the page from
+       the previous responses.
+
+        Keyword arguments:
+        page -- page from the continuation
+        mergedPage -- page from the previous responses, result of the merge
+    """
+
+    for key, value in page.items():
+        if key not in mergedPage:
+            mergedPage[key] = value
+        elif isinstance(value, list) and isinstance(mergedPage[key], list):
+            mergedPage[key].extend(value)
+        elif isinstance(value, dict) and isinstance(mergedPage[key], dict):
+            mergedPage[key].update(value)
+
+
+def getApiLimit(url):
+    """This method returns the maximal number of titles in one query to the Mediawiki API. The limit is 500
+       for users with apihighlimits right (e.g., bots) and 50 for the others. The session is logged in
+       with the bot password first (see client.login), anonymous users always get 50. The limit is fetched
+       only once for every API.
+
+        Keyword arguments:
+        url -- URL of the API
+    """
+
+    # example
+    # https://en.wikipedia.org/w/api.php?action=query&meta=userinfo&uiprop=rights&format=json&formatversion=2
+
+    if url not in apiLimits:
+        rights = []
+        # Anonymous users never have apihighlimits right, so the rights are asked only after the login
+        if client.login(url):
+            params = {
+                'action': 'query',
+                'meta': 'userinfo',
+                'uiprop': 'rights',
+                'format': 'json',
+                'formatversion': 2
+            }
+            try:
+                # Rights depend on the user, so the response is not taken from the cache
+                rights = client.getResponse(url, params=params).json()['query']['userinfo'].get('rights', [])
+            except Exception:
+                logging.exception(f'Exception happened while getting rights of the user from {url}')
+        apiLimits[url] = 500 if 'apihighlimits' in rights else 50
+
+    return apiLimits[url]
 
 
-def getPictures(data, startIndex=None, endIndex=None):
-    """This method downloads all the pictures from the dataset passed in.
+def getChunkSize(query, chunkSize):
+    """This method returns number of titles in the next chunk of the query, so the response for it fits into
+       API_RESPONSE_BUDGET. Size of the response is estimated from the average size of the previous responses
+       per title.
+
+        Keyword arguments:
+        query -- name of the query, sizes of responses are tracked separately for every query
+        chunkSize -- maximal number of titles in one chunk
+    """
+
+    titles, size = responseSizes.get(query, (0, 0))
+    if titles == 0 or size == 0:
+        return chunkSize
+
+    return max(1, min(chunkSize, int(API_RESPONSE_BUDGET * titles / size)))
+
+
+def recordResponseSize(query, titles, pages):
+    """This method adds the size of the response to the statistics used by getChunkSize.
+
+        Keyword arguments:
+        query -- name of the query
+        titles -- titles of the chunk
+        pages -- pages returned for the chunk
+    """
+
+    count, size = responseSizes.get(query, (0, 0))
+    responseSizes[query] = (count + len(titles), size + len(json.dumps(pages)))
+
+
+def runPipeline(chunks, fetch, save, workers=None):
+    """This method fetches chunks concurrently and saves their results in the order they arrive. Chunks are
+       taken from the generator only when there is a free place among the chunks in flight, so the next chunk
+       is created while the previous ones are being fetched. Results are saved in the calling thread,
+       so the dataset is never modified concurrently.
+
+        Keyword arguments:
+        chunks -- iterable of chunks
+        fetch -- function fetching results of one chunk
+        save -- function saving results of one chunk, it is called with the results and the chunk
+        workers -- number of chunks fetched at once (default defined in constants module)
+    """
+
+    if workers is None:
+        workers = API_WORKERS
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for chunk in chunks:
+            pending[executor.submit(fetch, chunk)] = chunk
+            # Two chunks per worker are enough to keep all the workers busy
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    save(future.result(), pending.pop(future))
+
+        for future in as_completed(pending):
+            save(future.result(), pending[future])
+
+
+def getPictures(data, startIndex=None, endIndex=None, workers=None, priority=None):
+    """This method downloads all the pictures from the dataset passed in. Pictures are downloaded concurrently
+       by a pool of workers sharing one connection pool, the number of concurrent requests to one host is
+       limited by DOWNLOAD_WORKERS_PER_HOST. Pictures usable for training (see isImageUseful) are downloaded
+       first, the rest of them is downloaded afterwards or skipped, depending on the priority. Skipped
+       pictures stay in the dataset without local file, so they can be downloaded later, and so do oversize
+       pictures. Downloaded, oversize and removed pictures are journaled, so they are not downloaded again
+       after a restart.
 
         Keyword arguments:
         data -- processed data from sparql endpoint
-        startIndex -- starting point in dataset, can be used for dividing dataset or for threading
-        endIndex -- ending point in dataset, can be used for dividing dataset or for threading
+        startIndex -- starting point in dataset, can be used for dividing dataset
+        endIndex -- ending point in dataset, can be used for dividing dataset
+        workers -- number of pictures downloaded at once (default defined in constants module)
+        priority -- 'all' downloads all the pictures, 'useful' only those usable for training
+                    (default defined in constants module)
     """
     if startIndex is None:
         startIndex = 0
     if endIndex is None:
         endIndex = len(data)
+    if workers is None:
+        workers = DOWNLOAD_WORKERS
+    if priority is None:
+        priority = DOWNLOAD_PRIORITY
 
-    for person in tqdm(list(data.values())[startIndex:endIndex], desc='getPictures',
-                       miniters=int((endIndex - startIndex) / 100)):
+    getDownloadedImages()
+    replayPictures(list(data.values())[startIndex:endIndex])
+    # Images are collected before the download starts, because workers remove failed images from the dataset
+    tasks = [(person, image) for person in list(data.values())[startIndex:endIndex] if 'images' in person
+             for image in list(person['images'].values())]
+    # Sorting is stable, so the order of the dataset is kept within both groups
+    tasks.sort(key=lambda task: not isImageUseful(task[1]))
+    if priority == 'useful':
+        tasks = [(person, image) for person, image in tasks if isImageUseful(image)]
+    # The same file can belong to multiple people, it is downloaded only once and the other people
+    # get it from the index of downloaded images afterwards
+    hashes = set()
+    uniqueTasks, duplicateTasks = [], []
+    for person, image in tasks:
+        if 'sha1' in image and image['sha1'] in hashes:
+            duplicateTasks.append((person, image))
+        else:
+            hashes.add(image.get('sha1'))
+            uniqueTasks.append((person, image))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(getPicture, image, person): person for person, image in uniqueTasks}
+        for future in tqdm(as_completed(futures), total=len(futures), desc='getPictures',
+                           miniters=int(len(futures) / 100)):
+            try:
+                future.result()
+            except Exception as e:
+                logging.exception(f'Exception happened during downloading picture for {futures[future]["wikidataID"]}')
+
+    for person, image in duplicateTasks:
         try:
-            person = getPicturesForPerson(person)
+            getPicture(image, person)
         except Exception as e:
             logging.exception(f'Exception happened during downloading picture for {person["wikidataID"]}')
 
+    saveDownloadedImages()
     return data
 
 
+def isImageUseful(image):
+    """This method checks if the image can be used for training, i.e., it has age and an extension that can
+       undergo face detection and transformation.
+
+        Keyword arguments:
+        image -- image from processed dataset
+    """
+
+    age = 'age' in image and image['age'] is not None
+    return age and image['extension'] in ALLOWED_EXTENSIONS and image['extension'] not in BANNED_EXTENSIONS
+
+
 def getPicturesForPerson(person):
     """This method downloads all the pictures for the person passed into the method.
-       Name of the local file representing the image is SHA-256 hash of th image content
-       shortened by the hexdigest() method.
 
         Keyword arguments:
         person --  one person from processed dataset
     """
-    with requests.Session() as session:
-        if 'images' in person:
-            for image in list(person['images'].values()):
-                # When the database is created for the first time, all the pictures will be downloaded
-                # The check if the image is already in the directory works only if we have the data with
-                # fileNameLocal in them
-                if 'fileNameLocal' not in image or not os.path.isfile(
-                        f'{IMAGES_DIRECTORY}/{image["fileNameLocal"]}'):
-                    if 'url' in image:
-                        response = session.get(url=image['url'], headers=HEADERS)
-                        if response.ok:
-                            hash = hashlib.sha256(response.content).hexdigest()
-                            image["fileNameLocal"] = f"{hash}{image['extension']}"
-                            location = f'{IMAGES_DIRECTORY}/{image["fileNameLocal"]}'
-                            with open(location, "wb+") as f:
-                                f.write(response.content)
-                        else:
-                            logging.error(
-                                f'Image {image["fileNameWiki"]} which belongs to {person["wikidataID"]} not found! REMOVING IT!')
-                            del person['images'][image['fileNameWiki']]
-                    else:
-                        logging.error(
-                            f'Image {image["fileNameWiki"]} - {person["wikidataID"]} has no URL! REMOVING IT!')
-                        del person['images'][image['fileNameWiki']]
-
-    return person
\ No newline at end of file
+
+    if 'images' in person:
+        for image in list(person['images'].values()):
+            getPicture(image, person)
+
+    return person
+
+
+def getPicture(image, person):
+    """This method downloads one picture of the person passed into the method.
+       Name of the local file representing the image is SHA-256 hash of th image content
+       shortened by the hexdigest() method. Images that cannot be downloaded are removed from the person,
+       oversize images (see isOversize) are kept without local file.
+
+        Keyword arguments:
+        image -- image of the person to download
+        person --  one person from processed dataset, owner of the image
+    """
+
+    # When the database is created for the first time, all the pictures will be downloaded
+    # The check if the image is already in the directory works only if we have the data with
+    # fileNameLocal in them
+    if 'fileNameLocal' in image and os.path.isfile(f'{IMAGES_DIRECTORY}/{image["fileNameLocal"]}'):
+        return image
+
+    fileNameLocal = getDownloadedImage(image)
+    if fileNameLocal is not None:
+        image["fileNameLocal"] = fileNameLocal
+        return image
+
+    if isOversize(image):
+        # Oversize images are kept with their metadata like the skipped ones, False marks them in the journal
+        logging.info(f'Image {image["fileNameWiki"]} - {person["wikidataID"]} is too big! SKIPPING IT!')
+        journal.addEntry('pictures', f'{person["wikidataID"]}/{image["fileNameWiki"]}', False)
+        return image
+
+    if 'url' in image:
+        extension = image['extension']
+        if 'scale' in image:
+            # Scaled images of some formats are rendered in a different format (e.g., SVG to PNG)
+            extension = os.path.splitext(unquote(urlparse(image['url']).path))[FILE_EXT_INDEX].lower()
+        fileNameLocal = downloadPicture(image['url'], extension)
+        if fileNameLocal is not None:
+            image["fileNameLocal"] = fileNameLocal
+            addDownloadedImage(image)
+        else:
+            logging.error(
+                f'Image {image["fileNameWiki"]} which belongs to {person["wikidataID"]} not found! REMOVING IT!')
+            person['images'].pop(image['fileNameWiki'], None)
+    else:
+        logging.error(
+            f'Image {image["fileNameWiki"]} - {person["wikidataID"]} has no URL! REMOVING IT!')
+        person['images'].pop(image['fileNameWiki'], None)
+
+    journal.addEntry('pictures', f'{person["wikidataID"]}/{image["fileNameWiki"]}', image.get('fileNameLocal'))
+    return image
+
+
+def replayPictures(people):
+    """This method sets local files of pictures downloaded before the restart and removes pictures removed
+       before it, according to the journal. Oversize pictures are kept without local file. Pictures, whose local
+       file does not exist anymore, are downloaded again.
+
+        Keyword arguments:
+        people -- list of people from processed dataset
+    """
+
+    completedPictures = journal.getEntries('pictures')
+    if not completedPictures:
+        return
+
+    for person in people:
+        for image in list(person.get('images', {}).values()):
+            key = f'{person["wikidataID"]}/{image["fileNameWiki"]}'
+            if key not in completedPictures:
+                continue
+            fileNameLocal = completedPictures[key]
+            if fileNameLocal is None:
+                person['images'].pop(image['fileNameWiki'], None)
+            elif fileNameLocal is False:
+                continue
+            elif os.path.isfile(f'{IMAGES_DIRECTORY}/{fileNameLocal}'):
+                image['fileNameLocal'] = fileNameLocal
+                addDownloadedImage(image)
+
+
+def downloadPicture(url, extension):
+    """This method streams one picture to the disk and returns the name of the local file, None is returned
+       if the picture is not found. The content is written in chunks into a temporary file in IMAGES_DIRECTORY
+       while its SHA-256 hash is computed, then the file is atomically renamed to the hash. Memory used
+       does not depend on the size of the picture and no partially written picture can have the final name.
+
+        Keyword arguments:
+        url -- URL of the picture
+        extension -- extension of the picture, it is appended to the hash
+    """
+
+    hash = hashlib.sha256()
+    with client.getHostSemaphore(url), client.request('GET', url, stream=True) as response:
+        if not response.ok:
+            return None
+        with tempfile.NamedTemporaryFile(dir=IMAGES_DIRECTORY, suffix='.part', delete=False) as f:
+            try:
+                for chunk in client.countBytes(response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE), url):
+                    hash.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+
+    fileNameLocal = f'{hash.hexdigest()}{extension}'
+    os.replace(f.name, f'{IMAGES_DIRECTORY}/{fileNameLocal}')
+    return fileNameLocal
+
+
+def isOversize(image):
+    """This method checks if the image is bigger than MAX_IMAGE_BYTES or has more pixels than MAX_IMAGE_PIXELS.
+       Images without known size and scaled images are not considered oversize.
+
+        Keyword arguments:
+        image -- image with metadata from getMetadataAndLinks
+    """
+
+    if 'scale' in image:
+        return False
+    if image.get('size', 0) > MAX_IMAGE_BYTES:
+        return True
+
+    return image.get('width', 0) * image.get('height', 0) > MAX_IMAGE_PIXELS
+
+
+def getDownloadedImages():
+    """This method returns the index of all the downloaded images, keys are SHA-1 hashes of the files
+       from Wikimedia Commons (see getDownloadedImageKey) and values are names of the local files. The index is loaded
+       from downloadedImages.json in DATA_DIRECTORY on the first call.
+
+        Keyword arguments:
+        None
+    """
+
+    global downloadedImages
+    with downloadedImagesLock:
+        if downloadedImages is None:
+            if os.path.isfile(f'{DATA_DIRECTORY}/downloadedImages.json'):
+                downloadedImages = readData(f'{DATA_DIRECTORY}/downloadedImages.json')
+            else:
+                downloadedImages = {}
+
+    return downloadedImages
+
+
+def getDownloadedImage(image):
+    """This method returns the name of the local file with the same content as the image, None is returned
+       if there is no such file.
+
+        Keyword arguments:
+        image -- image with metadata from getMetadataAndLinks
+    """
+
+    if 'sha1' not in image:
+        return None
+    fileNameLocal = getDownloadedImages().get(getDownloadedImageKey(image))
+    if fileNameLocal is None or not os.path.isfile(f'{IMAGES_DIRECTORY}/{fileNameLocal}'):
+        return None
+
+    return fileNameLocal
+
+
+def addDownloadedImage(image):
+    """This method adds the downloaded image to the index of downloaded images.
+
+        Keyword arguments:
+        image -- downloaded image with metadata from getMetadataAndLinks
+    """
+
+    if 'sha1' in image:
+        downloadedImages = getDownloadedImages()
+        with downloadedImagesLock:
+            downloadedImages[getDownloadedImageKey(image)] = image['fileNameLocal']
+
+
+def getDownloadedImageKey(image):
+    """This method returns the key of the image in the index of downloaded images. Scaled images are stored
+       under SHA-1 of the original with the width they are scaled to, so they are not mixed with the originals.
+
+        Keyword arguments:
+        image -- image with metadata from getMetadataAndLinks
+    """
+
+    if 'scale' in image:
+        return f'{image["sha1"]}-{DOWNLOAD_WIDTH}px'
+
+    return image['sha1']
+
+
+def saveDownloadedImages():
+    """This method saves the index of downloaded images to downloadedImages.json in DATA_DIRECTORY.
+       Images downloaded by other processes in the meantime are kept.
+
+        Keyword arguments:
+        None
+    """
+
+    downloadedImages = getDownloadedImages()
+    with downloadedImagesLock:
+        downloadedImages.update(mergeAndSaveData(downloadedImages, f'{DATA_DIRECTORY}/downloadedImages.json'))
@@ -0,0 +1,286 @@
+# Module name: DumpReader
+# Purpose: This module contains functions for reading people from the Wikidata JSON dump
+#          (https://dumps.wikimedia.org/wikidatawiki/entities/) as an alternative to the SPARQL endpoint.
+#          People are written into per year shards in DUMP_DIRECTORY, which are read by getDumpData.
+
+import bz2
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+
+from contextlib import contextmanager
+from itertools import islice
+from multiprocessing import Pool
+from tqdm import tqdm
+
+from create.transformer import addPersonToDictionary
+from constants import DUMP_DIRECTORY, DUMP_BATCH_SIZE, DUMP_PROCESSES, START_YEAR, END_YEAR, FILE_EXT_INDEX
+
+# Parallel decompressors of the dump by its extension and Python functions used when they are not installed
+DECOMPRESSORS = {'.bz2': ('lbzip2', bz2.open), '.gz': ('pigz', gzip.open)}
+
+
+def readDump(location, fromYear=None, toYear=None, processes=None):
+    """This method reads all the people born between two years from the Wikidata JSON dump and writes them
+       into shards {year}.jsonl in DUMP_DIRECTORY. Every line of the shard is one person in the same format
+       as the records of simplifySparqlData, so the shard can be processed the same way as the data
+       from the SPARQL endpoint. The dump is decompressed in a separate process and its entities
+       are parsed in parallel by a pool of processes.
+
+        Keyword arguments:
+        location -- location of the dump, it can be compressed with bzip2 (.bz2) or gzip (.gz)
+        fromYear -- first birth year (default defined in constants module)
+        toYear -- first birth year after the range (default defined in constants module)
+        processes -- number of processes parsing the dump (default defined in constants module)
+    """
+
+    if fromYear is None:
+        fromYear = START_YEAR
+    if toYear is None:
+        toYear = END_YEAR
+    if processes is None:
+        processes = DUMP_PROCESSES
+
+    os.makedirs(DUMP_DIRECTORY, exist_ok=True)
+    shards = {}
+    try:
+        with openDump(location) as dump, Pool(processes) as pool:
+            batches = iter(lambda: list(islice(dump, DUMP_BATCH_SIZE)), [])
+            for people in tqdm(pool.imap(parseDumpLines, batches), desc='readDump', unit='batch'):
+                for year, person in people:
+                    if fromYear <= year < toYear:
+                        if year not in shards:
+                            shards[year] = open(f'{DUMP_DIRECTORY}/{year}.jsonl', 'w', encoding="UTF-8")
+                        shards[year].write(json.dumps(person, ensure_ascii=False) + '\n')
+    finally:
+        for shard in shards.values():
+            shard.close()
+
+
+@contextmanager
+def openDump(location):
+    """This method opens the dump as a text stream of lines, it is used as a context manager. Compressed dumps
+       are decompressed by lbzip2 or pigz in a separate process using all the cores if they are installed,
+       by Python otherwise. CalledProcessError is raised when the decompressor fails (e.g., the dump
+       is truncated or corrupted), so a partially read dump is never taken as a whole one.
+
+        Keyword arguments:
+        location -- location of the dump
+    """
+
+    extension = os.path.splitext(location)[FILE_EXT_INDEX]
+    if extension not in DECOMPRESSORS:
+        with open(location, 'r', encoding="UTF-8") as dump:
+            yield dump
+        return
+
+    command, openFile = DECOMPRESSORS[extension]
+    if shutil.which(command) is None:
+        logging.warning(f'{command} is not installed, the dump is decompressed on a single core')
+        with openFile(location, 'rt', encoding="UTF-8") as dump:
+            yield dump
+        return
+
+    process = subprocess.Popen([command, '-dc', location], stdout=subprocess.PIPE)
+    try:
+        with io.TextIOWrapper(process.stdout, encoding="UTF-8") as dump:
+            yield dump
+    except BaseException:
+        # The dump is not read to its end, so the decompressor would be blocked on the full pipe
+        process.kill()
+        process.wait()
+        raise
+    returnCode = process.wait()
+    if returnCode != 0:
+        raise subprocess.CalledProcessError(returnCode, [command, '-dc', location])
+
+
+def parseDumpLines(lines):
+    """This method parses a batch of lines of the dump, see parseDumpLine. It is called in the pool
+       of processes, so only the people are sent back.
+
+        Keyword arguments:
+        lines -- list of lines of the dump
+    """
+
+    people = []
+    for line in lines:
+        try:
+            people.extend(parseDumpLine(line))
+        except (ValueError, KeyError, TypeError):
+            logging.exception(f'Exception happened while parsing line of the dump - {line[:100]}')
+
+    return people
+
+
+def parseDumpLine(line):
+    """This method parses one line of the dump, which contains one entity. If the entity is a human
+       (P31 = Q5) with english label and a birth date, it is returned as a list of tuples with the birth year
+       and the person. There is one tuple for every year of its birth dates, as the SPARQL query returns
+       the person only with the birth dates in the queried range. Lines that are not entities
+       (opening and closing bracket of the array) and other entities result in an empty list.
+
+        Keyword arguments:
+        line -- one line of the dump
+    """
+
+    line = line.strip().rstrip(',')
+    # Cheap check, so most of the entities does not have to be decoded
+    if not line.startswith('{') or '"Q5"' not in line or '"P569"' not in line:
+        return []
+
+    entity = json.loads(line)
+    claims = entity.get('claims', {})
+    if 'Q5' not in getTruthyValues(claims, 'P31') or 'en' not in entity.get('labels', {}):
+        return []
+
+    person = {'wikidataID': entity['id'], 'name': entity['labels']['en']['value']}
+    if 'en' in entity.get('descriptions', {}):
+        person['description'] = entity['descriptions']['en']['value']
+    for property, key in [('P21', 'gender'), ('P27', 'nationality'), ('P106', 'occupation')]:
+        values = getTruthyValues(claims, property)
+        if values:
+            person[key] = values
+    deathDates = [toSparqlDate(value) for value in getTruthyValues(claims, 'P570')]
+    if deathDates:
+        person['deathDate'] = deathDates[0] if len(deathDates) == 1 else deathDates
+    if 'enwiki' in entity.get('sitelinks', {}):
+        person['wikipediaTitle'] = entity['sitelinks']['enwiki']['title'].replace(' ', '_')
+    person['images'] = getImages(claims)
+
+    birthDatesByYear = {}
+    for value in getTruthyValues(claims, 'P569'):
+        birthDate = toSparqlDate(value)
+        birthDatesByYear.setdefault(getYear(birthDate), []).append(birthDate)
+
+    people = []
+    for year, birthDates in birthDatesByYear.items():
+        birthDates = list(dict.fromkeys(birthDates))
+        people.append((year, person | {'birthDate': birthDates[0] if len(birthDates) == 1 else birthDates}))
+
+    return people
+
+
+def getTruthyValues(claims, property):
+    """This method returns values of the statements of the property, which would be returned by the SPARQL
+       endpoint as wdt: triples. Those are statements with the best rank (preferred, normal if there is
+       no preferred statement) and known value (see removeBrokenData).
+
+        Keyword arguments:
+        claims -- claims of the entity
+        property -- Wikidata property (e.g., P31)
+    """
+
+    statements = [statement for statement in claims.get(property, []) if statement.get('rank') != 'deprecated']
+    if any(statement.get('rank') == 'preferred' for statement in statements):
+        statements = [statement for statement in statements if statement.get('rank') == 'preferred']
+
+    return [value for value in (getSnakValue(statement['mainsnak']) for statement in statements) if value is not None]
+
+
+def getSnakValue(snak):
+    """This method returns value of the snak. Items are returned as their IDs, times as their full timestamps,
+       other values (e.g., file names, texts with their language) as they are. None is returned for unknown
+       values or no values.
+
+        Keyword arguments:
+        snak -- main snak or qualifier of the statement
+    """
+
+    if snak.get('snaktype') != 'value':
+        return None
+    value = snak['datavalue']['value']
+    if isinstance(value, dict):
+        if 'id' in value:
+            return value['id']
+        if 'time' in value:
+            return value['time']
+
+    return value
+
+
+def getImages(claims):
+    """This method returns images of the person in the same format as in the simplified SPARQL data.
+       All the statements of P18 are used like in the SPARQL query (p:P18), with english captions (P2096)
+       and dates (P585) from their qualifiers.
+
+        Keyword arguments:
+        claims -- claims of the entity
+    """
+
+    images = {}
+    for statement in claims.get('P18', []):
+        fileName = getSnakValue(statement['mainsnak'])
+        if fileName is None:
+            continue
+        fileName = fileName.replace(" ", "_")
+        qualifiers = statement.get('qualifiers', {})
+        captions = [getSnakValue(snak) for snak in qualifiers.get('P2096', [])]
+        dates = [getSnakValue(snak) for snak in qualifiers.get('P585', [])]
+        image = {
+            "caption": [caption['text'] for caption in captions
+                        if caption is not None and caption['language'].split('-')[0] == 'en'],
+            "date": [toSparqlDate(date) for date in dates if date is not None],
+            "fileNameWiki": fileName,
+            "extension": f'{os.path.splitext(fileName)[FILE_EXT_INDEX].lower()}'
+        }
+        if fileName in images:
+            for key in ['caption', 'date']:
+                images[fileName][key].extend(value for value in image[key] if value not in images[fileName][key])
+        else:
+            images[fileName] = image
+
+    return images
+
+
+def toSparqlDate(time):
+    """This method converts Wikidata timestamp (e.g., +1905-02-00T00:00:00Z) into the date as it is returned
+       by the SPARQL endpoint and shortened by GENERAL_DATE_OFFSET (e.g., 1905-02-01). Unknown months and days
+       are replaced by the first ones, as the SPARQL endpoint does.
+
+        Keyword arguments:
+        time -- Wikidata timestamp
+    """
+
+    time = time.lstrip('+')
+    sign = '-' if time.startswith('-') else ''
+    year, month, day = time.lstrip('-').split('T')[0].split('-')
+
+    return f'{sign}{year}-{max(month, "01")}-{max(day, "01")}'
+
+
+def getYear(date):
+    """This method returns the year of the date, years before Christ are negative.
+
+        Keyword arguments:
+        date -- date in format of toSparqlDate
+    """
+
+    return int(date[:date.index('-', 1)])
+
+
+def getDumpData(fromYear, toYear):
+    """This method reads people born between two years from the shards of the dump created by readDump
+       and processes them into the same format as processSparqlData.
+
+        Keyword arguments:
+        fromYear -- first birth year
+        toYear -- first birth year after the range
+    """
+
+    peopleDictionary = {}
+    for year in range(fromYear, toYear):
+        location = f'{DUMP_DIRECTORY}/{year}.jsonl'
+        if not os.path.isfile(location):
+            logging.error(f'Shard of the dump for year {year} does not exist')
+            continue
+        with open(location, 'r', encoding="UTF-8") as f:
+            for line in f:
+                addPersonToDictionary(json.loads(line), peopleDictionary)
+
+    return peopleDictionary
+
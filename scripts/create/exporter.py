@@ -0,0 +1,186 @@
+# Module name: Exporter
+# Purpose: This module contains functions for exporting the image-level view of the dataset
+#          (see transformer.toImageData) into a columnar Parquet file. Selections for training and statistics
+#          then run as vectorised scans of the columns with predicate pushdown instead of filtering millions
+#          of dictionaries.
+#          Package pyarrow is optional, it is imported only when the table is exported or read.
+
+import os
+
+from tqdm import tqdm
+
+from create.storage import importOptional
+from create.utils import readData
+from constants import IMAGE_TABLE_LOCATION, DATA_DIRECTORY, START_YEAR, END_YEAR, YEAR_STEP, YEAR_OFFSET, \
+    BANNED_EXTENSIONS
+
+
+def getSchema():
+    """This method returns the schema of the image table, every row is one image with the properties
+       of its person. Box and score are filled only for images with exactly one face, which are used for training.
+
+        Keyword arguments:
+        None
+    """
+
+    pa = importOptional('pyarrow')
+    return pa.schema([
+        ('wikidataID', pa.string()),
+        ('birthYear', pa.int16()),
+        ('birthDate', pa.string()),
+        ('deathDate', pa.string()),
+        ('gender', pa.string()),
+        ('nationality', pa.list_(pa.string())),
+        ('occupation', pa.list_(pa.string())),
+        ('wikipediaTitle', pa.string()),
+        ('fileNameWiki', pa.string()),
+        ('fileNameLocal', pa.string()),
+        ('extension', pa.string()),
+        ('age', pa.int16()),
+        ('faceCount', pa.int16()),
+        ('box', pa.list_(pa.int32())),
+        ('score', pa.float32())
+    ])
+
+
+def exportImageTable(location=None, years=None):
+    """This method exports images of all the year files into the Parquet file. Every year is one row group,
+       so the memory is bounded by the size of one year and row groups of other years are skipped, when
+       the table is read with a filter on birthYear. The file is replaced atomically.
+       Dates are exported as strings, the earliest one is used when there are more of them.
+       Gender is exported only for people with exactly one gender.
+
+        Keyword arguments:
+        location -- location of the Parquet file (default defined in constants module)
+        years -- list of years to export (default: all the years between START_YEAR and END_YEAR)
+    """
+
+    if location is None:
+        location = IMAGE_TABLE_LOCATION
+    if years is None:
+        years = range(START_YEAR, END_YEAR, YEAR_STEP)
+
+    pa = importOptional('pyarrow')
+    pq = importOptional('pyarrow.parquet')
+    schema = getSchema()
+    with pq.ParquetWriter(f'{location}.{os.getpid()}.tmp', schema, compression='zstd') as writer:
+        for year in tqdm(years, desc='exportImageTable'):
+            file = f'{DATA_DIRECTORY}/{year}.json'
+            if not os.path.isfile(file):
+                continue
+            columns = getColumns(readData(file))
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+    os.replace(f'{location}.{os.getpid()}.tmp', location)
+
+
+def getColumns(data):
+    """This method converts people of one year into the columns of the image table.
+
+        Keyword arguments:
+        data -- processed data of one year
+    """
+
+    columns = {field: [] for field in getSchema().names}
+    for person in data.values():
+        birthDate = getDate(person.get('birthDate'))
+        deathDate = getDate(person.get('deathDate'))
+        gender = person['gender'][0] if len(person.get('gender', [])) == 1 else None
+        for image in person.get('images', {}).values():
+            faces = image.get('faces')
+            columns['wikidataID'].append(person['wikidataID'])
+            columns['birthYear'].append(int(birthDate[:YEAR_OFFSET]) if birthDate else None)
+            columns['birthDate'].append(birthDate)
+            columns['deathDate'].append(deathDate)
+            columns['gender'].append(gender)
+            columns['nationality'].append(person.get('nationality'))
+            columns['occupation'].append(person.get('occupation'))
+            columns['wikipediaTitle'].append(person.get('wikipediaTitle'))
+            columns['fileNameWiki'].append(image['fileNameWiki'])
+            columns['fileNameLocal'].append(image.get('fileNameLocal'))
+            columns['extension'].append(image.get('extension'))
+            columns['age'].append(image.get('age'))
+            columns['faceCount'].append(len(faces) if faces is not None else None)
+            columns['box'].append(faces[0]['box'] if faces is not None and len(faces) == 1 else None)
+            columns['score'].append(faces[0].get('score') if faces is not None and len(faces) == 1 else None)
+
+    return columns
+
+
+def getDate(value):
+    """This method returns the earliest of the dates or the date itself, None is returned when there is no date.
+
+        Keyword arguments:
+        value -- date or list of dates
+    """
+
+    if isinstance(value, list):
+        return min(value) if value else None
+    return value
+
+
+def readImageTable(filters=None, columns=None, location=None):
+    """This method reads the image table as pyarrow Table. Filters are pushed down to the Parquet reader,
+       so row groups, which cannot match them, are not read at all.
+
+        Keyword arguments:
+        filters -- filters in the format of pyarrow.parquet.read_table, list of tuples
+                   (e.g., [('age', '>=', 17), ('birthYear', '<', 1900)]) or expression (default: None)
+        columns -- list of columns to read (default: all the columns)
+        location -- location of the Parquet file (default defined in constants module)
+    """
+
+    if location is None:
+        location = IMAGE_TABLE_LOCATION
+
+    pq = importOptional('pyarrow.parquet')
+    return pq.read_table(location, columns=columns, filters=filters)
+
+
+def readTrainingImages(forGender=False, columns=None, location=None):
+    """This method reads images usable for training in the same selection as merger.mergeAllDataForTrainingAge
+       (age between 17 and 80) or merger.mergeAllDataForTrainingGender (male or female) from the image table.
+       Images have exactly one face and known age and their extension is not banned.
+
+        Keyword arguments:
+        forGender -- if True the images for gender training are returned, for age training otherwise (default: False)
+        columns -- list of columns to read (default: all the columns)
+        location -- location of the Parquet file (default defined in constants module)
+    """
+
+    pc = importOptional('pyarrow.compute')
+    filters = (pc.field('faceCount') == 1) & pc.field('age').is_valid() & \
+        ~pc.field('extension').isin(BANNED_EXTENSIONS)
+    if forGender:
+        filters &= pc.field('gender').isin(['male', 'female'])
+    else:
+        filters &= (pc.field('age') >= 17) & (pc.field('age') <= 80)
+
+    return readImageTable(filters=filters, columns=columns, location=location)
+
+
+def toImageData(table):
+    """This method converts the image table into the list of images in the same format
+       as transformer.toImageData, so it can be used by the existing training code.
+
+        Keyword arguments:
+        table -- pyarrow Table read by readImageTable
+    """
+
+    images = []
+    for row in table.to_pylist():
+        image = {}
+        for key in ['gender', 'birthDate', 'deathDate', 'nationality', 'occupation']:
+            if row.get(key) is not None:
+                image[key] = [row[key]] if key == 'gender' else row[key]
+        for key in ['age', 'fileNameLocal', 'extension']:
+            if row.get(key) is not None:
+                image[key] = row[key]
+        if row.get('box') is not None:
+            image['faces'] = [{'box': row['box'], 'score': row['score']}]
+        images.append(image)
+
+    return images
+
+
+if __name__ == '__main__':
+    exportImageTable()
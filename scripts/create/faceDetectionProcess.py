@@ -3,35 +3,57 @@
 
 import os
 
-from create.utils import readData, saveData
+from create import scheduler, instrumentation, database
+from create.utils import readData, saveData, mergeAndSaveData
 from create.faceDetectionSetup import config
 from create.faceDetector import detectFaces
 from eval.checker import checkFaceDetection, checkFaces
-from constants import DATA_DIRECTORY, START_YEAR, END_YEAR, YEAR_STEP
+from constants import DATA_DIRECTORY, START_YEAR, END_YEAR, YEAR_STEP, STORAGE_FORMAT, STORAGE_COMPRESSION, DATA_STORE
 
 
-def detectFacesJob():
+def detectFacesJob(processes=None):
     """This method detects all the faces in database. Checks for the processedImages.json file
-       and uses it, if it is found.
+       and uses it, if it is found. Years are processed in parallel by worker processes, see scheduler module.
+       Every stage is measured, see instrumentation module.
 
        Keyword arguments:
-        None
+        processes -- number of worker processes (default defined in constants module)
     """
 
     config()
+    instrumentation.startRun('faceDetection')
+    generation = scheduler.getGeneration('faceDetection')
+    if scheduler.runYears('faceDetection', detectFacesInYear, range(START_YEAR, END_YEAR, YEAR_STEP), processes,
+                          initializer=config, generation=generation):
+        scheduler.resetYears('faceDetection', generation)
+
+
+def detectFacesInYear(year):
+    """This method detects all the faces in one year of database. Images processed in this year are merged
+       into the processedImages.json file, so they can be used by other years. When DATA_STORE is 'sqlite',
+       the year is updated in the database too, so the training data queried from it contain the faces.
+
+       Keyword arguments:
+        year -- year to process
+    """
+
+    print(f'Starting year: {year}!')
     if os.path.exists(f'{DATA_DIRECTORY}/processedImages.json'):
         processedImages = readData(f'{DATA_DIRECTORY}/processedImages.json')
     else:
         processedImages = {}
-    for year in range(START_YEAR, END_YEAR, YEAR_STEP):
-        print(f'Starting year: {year}!')
-        data = readData(f'{DATA_DIRECTORY}/{year}.json')
-        checkFaceDetection(data)
-        processedImages, data = detectFaces(data, processedImages)
-        checkFaceDetection(data)
-
-        saveData(data, f'{DATA_DIRECTORY}/{year}.json')
-        saveData(processedImages, f'{DATA_DIRECTORY}/processedImages.json')
+    data = instrumentation.runStage('readData', year, readData, f'{DATA_DIRECTORY}/{year}.json')
+    checkFaceDetection(data)
+    processedImages, data = instrumentation.runStage('detectFaces', year, detectFaces, data, processedImages)
+    checkFaceDetection(data)
+
+    instrumentation.runStage('saveData', year, saveData, data, f'{DATA_DIRECTORY}/{year}.json',
+                             format=STORAGE_FORMAT, compression=STORAGE_COMPRESSION)
+    instrumentation.runStage('saveProcessedImages', year, mergeAndSaveData, processedImages,
+                             f'{DATA_DIRECTORY}/processedImages.json')
+    if DATA_STORE == 'sqlite':
+        instrumentation.runStage('updateDatabase', year, database.buildDatabase, years=[year])
+
 
 if __name__ == '__main__':
     detectFacesJob()
\ No newline at end of file
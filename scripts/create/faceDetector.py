@@ -26,6 +26,9 @@ def detectFaces(data, processedImages=None):
     for index, person in enumerate(
             tqdm(data.values(), desc='detectFaces', miniters=int(len(data) / 100))):
         for image in person['images'].values():
+            # Images that were not downloaded cannot be processed
+            if 'fileNameLocal' not in image:
+                continue
             if image['fileNameLocal'] not in processedImages:
                 if image['extension'] in ALLOWED_EXTENSIONS:
                     if 'faces' not in image:
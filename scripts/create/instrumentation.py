@@ -0,0 +1,221 @@
+# Module name: Instrumentation
+# Purpose: This module contains functions for measuring stages of the pipeline. Every stage is measured
+#          for wall time, number of people and images going in and out, requests sent by the client
+#          and resident memory of the process at its start and end. Measurements of one run are saved
+#          in a JSON report in STATS_DIRECTORY and optionally in a Prometheus textfile (PROMETHEUS_TEXTFILE).
+
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # resource module is available only on Unix, peak memory of the process is not measured elsewhere
+    resource = None
+
+from datetime import datetime
+
+from create import client
+from create.utils import mergeAndSaveData
+from constants import STATS_DIRECTORY, PROMETHEUS_TEXTFILE
+
+# Name of the environment variable with ID of the run, worker processes inherit it from the main process
+RUN_ID_VARIABLE = 'WIKIPEOPLE_RUN_ID'
+
+
+def startRun(name):
+    """This method starts a new run, all the stages measured until the next run is started are saved in its
+       report stats/report-{run}.json. The ID of the run is shared with the worker processes started afterwards.
+
+        Keyword arguments:
+        name -- name of the run (e.g., dataCollection)
+    """
+
+    runId = f'{name}-{datetime.now().strftime("%Y-%m-%dT%H-%M-%S")}'
+    os.environ[RUN_ID_VARIABLE] = runId
+    return runId
+
+
+def getReportLocation():
+    """This method returns location of the report of the current run.
+
+        Keyword arguments:
+        None
+    """
+
+    runId = os.environ.get(RUN_ID_VARIABLE, f'{os.getpid()}')
+    return f'{STATS_DIRECTORY}/report-{runId}.json'
+
+
+def runStage(name, year, function, *args, **kwargs):
+    """This method calls the function of the stage with the arguments and saves its measurements to the report.
+       The result of the function is returned. Records going in are counted in the first argument, records
+       going out in the result, if they are datasets (dictionaries of people). When the function returns
+       a tuple (e.g., detectFaces), its last item is counted.
+
+        Keyword arguments:
+        name -- name of the stage
+        year -- year processed by the stage, None if the stage is not processing a year
+        function -- function of the stage
+        args -- arguments of the function
+        kwargs -- keyword arguments of the function
+    """
+
+    recordsIn = countRecords(args[0]) if args else None
+    requestsBefore = sumRequests(client.getStats())
+    rssStart = getRss()
+    start = time.monotonic()
+    cpuStart = time.process_time()
+
+    result = function(*args, **kwargs)
+
+    wallTime = time.monotonic() - start
+    cpuTime = time.process_time() - cpuStart
+    requestsAfter = sumRequests(client.getStats())
+    measurement = {
+        'stage': name,
+        'year': year,
+        'start': datetime.now().timestamp() - wallTime,
+        'wallTime': wallTime,
+        'cpuTime': cpuTime,
+        'recordsIn': recordsIn,
+        'recordsOut': countRecords(result[-1] if isinstance(result, tuple) else result),
+        'requests': {key: requestsAfter[key] - requestsBefore[key] for key in requestsAfter},
+        'rssStart': rssStart,
+        'rssEnd': getRss(),
+        # High-water mark of the whole process since its start, not of the stage
+        'processMaxRss': getProcessMaxRss(),
+        'pid': os.getpid()
+    }
+    saveMeasurement(measurement)
+
+    return result
+
+
+def getRss():
+    """This method returns the current resident memory of the process in bytes, None is returned
+       when it cannot be read (/proc is available only on Linux).
+
+        Keyword arguments:
+        None
+    """
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def getProcessMaxRss():
+    """This method returns the peak resident memory of the process since its start in bytes, None is returned
+       when it cannot be measured (resource module is available only on Unix).
+
+        Keyword arguments:
+        None
+    """
+
+    if resource is None:
+        return None
+
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return maxRss if sys.platform == 'darwin' else maxRss * 1024
+
+
+def countRecords(data):
+    """This method counts people and their images in the dataset, None is returned for other data.
+
+        Keyword arguments:
+        data -- processed data from sparql endpoint
+    """
+
+    # Only datasets are counted, other dictionaries (e.g., processed images) are not
+    if not isinstance(data, dict) or not isinstance(next(iter(data.values()), {}), dict):
+        return None
+
+    images = sum(len(person.get('images', {})) for person in data.values() if isinstance(person, dict))
+    return {'people': len(data), 'images': images}
+
+
+def sumRequests(stats):
+    """This method sums requests, errors, retries, downloaded bytes and responses and bytes read from the cache
+       of all the endpoints in the statistics of the client.
+
+        Keyword arguments:
+        stats -- statistics returned by client.getStats
+    """
+
+    total = {'requests': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'cacheHits': 0, 'cachedBytes': 0}
+    for endpointStats in stats.values():
+        for key in total:
+            total[key] += endpointStats[key]
+
+    return total
+
+
+def saveMeasurement(measurement):
+    """This method adds the measurement of the stage to the report of the current run, it is merged with
+       the measurements of other processes. Prometheus textfile is updated as well, if it is configured.
+
+        Keyword arguments:
+        measurement -- measurement of the stage created by runStage
+    """
+
+    key = measurement['stage'] if measurement['year'] is None else f'{measurement["year"]}/{measurement["stage"]}'
+    report = mergeAndSaveData({key: measurement}, getReportLocation())
+    if PROMETHEUS_TEXTFILE is not None:
+        savePrometheusTextfile(report, PROMETHEUS_TEXTFILE)
+
+
+def savePrometheusTextfile(report, location):
+    """This method saves the report in Prometheus text format, so it can be collected by textfile collector
+       of node exporter (https://github.com/prometheus/node_exporter#textfile-collector).
+
+        Keyword arguments:
+        report -- report of the run
+        location -- location of the textfile, it should end with .prom
+    """
+
+    metrics = {
+        'wikipeople_stage_wall_seconds': ('gauge', 'Wall time of the stage', lambda m: m['wallTime']),
+        'wikipeople_stage_cpu_seconds': ('gauge', 'CPU time of the stage', lambda m: m['cpuTime']),
+        'wikipeople_stage_people_in': ('gauge', 'People going into the stage',
+                                       lambda m: (m['recordsIn'] or {}).get('people')),
+        'wikipeople_stage_people_out': ('gauge', 'People going out of the stage',
+                                        lambda m: (m['recordsOut'] or {}).get('people')),
+        'wikipeople_stage_images_in': ('gauge', 'Images going into the stage',
+                                       lambda m: (m['recordsIn'] or {}).get('images')),
+        'wikipeople_stage_images_out': ('gauge', 'Images going out of the stage',
+                                        lambda m: (m['recordsOut'] or {}).get('images')),
+        'wikipeople_stage_requests': ('gauge', 'Requests sent in the stage', lambda m: m['requests']['requests']),
+        'wikipeople_stage_errors': ('gauge', 'Failed requests in the stage', lambda m: m['requests']['errors']),
+        'wikipeople_stage_retries': ('gauge', 'Retried requests in the stage', lambda m: m['requests']['retries']),
+        'wikipeople_stage_bytes': ('gauge', 'Bytes downloaded in the stage', lambda m: m['requests']['bytes']),
+        'wikipeople_stage_cache_hits': ('gauge', 'Responses read from the cache in the stage',
+                                        lambda m: m['requests'].get('cacheHits')),
+        'wikipeople_stage_cached_bytes': ('gauge', 'Bytes read from the cache in the stage',
+                                          lambda m: m['requests'].get('cachedBytes')),
+        'wikipeople_stage_rss_start_bytes': ('gauge', 'Resident memory of the process at the start of the stage',
+                                             lambda m: m.get('rssStart')),
+        'wikipeople_stage_rss_end_bytes': ('gauge', 'Resident memory of the process at the end of the stage',
+                                           lambda m: m.get('rssEnd')),
+        'wikipeople_process_max_rss_bytes': ('gauge', 'Peak resident memory of the process since its start, '
+                                                      'measured after the stage', lambda m: m.get('processMaxRss')),
+    }
+
+    lines = []
+    for metric, (metricType, description, getValue) in metrics.items():
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} {metricType}')
+        for measurement in report.values():
+            value = getValue(measurement)
+            if value is not None:
+                year = '' if measurement['year'] is None else measurement['year']
+                lines.append(f'{metric}{{stage="{measurement["stage"]}",year="{year}"}} {value}')
+
+    # Collector must not read partially written file
+    with open(f'{location}.{os.getpid()}.tmp', 'w', encoding="UTF-8") as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(f'{location}.{os.getpid()}.tmp', location)
@@ -0,0 +1,114 @@
+# Module name: Journal
+# Purpose: This module contains functions for journaling completed work of the data collection, so it can be
+#          resumed after a crash. Journal of every year is an append-only file {year}.jsonl in JOURNAL_DIRECTORY,
+#          every line is one completed unit of work (chunk of people of a SPARQL partition, chunk of labels, batch
+#          of the Mediawiki API, downloaded picture) with its result. Units of people are keyed by wikidataID
+#          and the file or title, so work shared by more people is not skipped for the others.
+#          When no journal is open, nothing is journaled.
+
+import json
+import logging
+import os
+import threading
+
+from constants import JOURNAL_DIRECTORY
+
+# Open journal, dictionary with the file and the entries read from it, see openJournal
+journal = None
+journalLock = threading.Lock()
+
+
+def openJournal(name):
+    """This method opens the journal with the passed name and reads all its entries. The last line of the journal
+       can be written only partially, when the process was killed, such line is ignored.
+
+        Keyword arguments:
+        name -- name of the journal, usually a year
+    """
+
+    global journal
+    closeJournal()
+    os.makedirs(JOURNAL_DIRECTORY, exist_ok=True)
+    location = f'{JOURNAL_DIRECTORY}/{name}.jsonl'
+    entries = {}
+    if os.path.isfile(location):
+        with open(location, 'r', encoding="UTF-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logging.warning(f'Skipping partially written entry of the journal {location}')
+                    continue
+                entries.setdefault(entry['stage'], {})[entry['key']] = entry['value']
+
+    f = open(location, 'a', encoding="UTF-8")
+    if f.tell() > 0:
+        # Partially written line is ended, so the next entry starts on a new line
+        with open(location, 'rb') as r:
+            r.seek(-1, os.SEEK_END)
+            if r.read(1) != b'\n':
+                f.write('\n')
+    with journalLock:
+        journal = {'file': f, 'entries': entries}
+
+
+def closeJournal():
+    """This method closes the open journal, its file is kept, so the work can be resumed.
+
+        Keyword arguments:
+        None
+    """
+
+    global journal
+    with journalLock:
+        if journal is not None:
+            journal['file'].close()
+            journal = None
+
+
+def removeJournal(name):
+    """This method closes the open journal and removes the journal with the passed name, it is called when
+       the work of the journal is done.
+
+        Keyword arguments:
+        name -- name of the journal, usually a year
+    """
+
+    closeJournal()
+    try:
+        os.remove(f'{JOURNAL_DIRECTORY}/{name}.jsonl')
+    except FileNotFoundError:
+        pass
+
+
+def getEntries(stage):
+    """This method returns all the entries of the stage in the open journal as a dictionary with keys
+       of the entries and their values. Empty dictionary is returned, when no journal is open.
+
+        Keyword arguments:
+        stage -- name of the stage (e.g., sparql, pictures)
+    """
+
+    with journalLock:
+        if journal is None:
+            return {}
+        return dict(journal['entries'].get(stage, {}))
+
+
+def addEntry(stage, key, value):
+    """This method appends the entry to the open journal. The entry is flushed to the disk before the method
+       returns, so the work is not lost, when the process is killed. Nothing is done, when no journal is open.
+
+        Keyword arguments:
+        stage -- name of the stage (e.g., sparql, pictures)
+        key -- key of the unit of work, it is unique within the stage
+        value -- result of the unit of work, it has to be serializable to JSON
+    """
+
+    with journalLock:
+        if journal is None:
+            return
+        journal['entries'].setdefault(stage, {})[key] = value
+        journal['file'].write(json.dumps({'stage': stage, 'key': key, 'value': value}, ensure_ascii=False) + '\n')
+        journal['file'].flush()
+        os.fsync(journal['file'].fileno())
@@ -1,21 +1,30 @@
 # Module name: Labeler
 # Purpose: This module contains functions to label Wikidata tags in dataset.
 
-import requests
+import os
+import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
-from constants import WIKIDATA_ENTITY_OFFSET, HEADERS, SPARQL_URL, PROPERTIES_WITH_TAGS
+from create import client, journal
+from create.utils import readData, mergeAndSaveData
+from constants import WIKIDATA_ENTITY_OFFSET, SPARQL_URL, PROPERTIES_WITH_TAGS, DATA_DIRECTORY, LABELS_TTL, \
+    LABEL_WORKERS
 
+# Labels of all the tags resolved so far, they are loaded from labels.json in DATA_DIRECTORY on the first use
+labels = None
 
-def labelTags(data):
+
+def labelTags(data, url=None):
     """This method labels all Wikidata tags in a dataset passed into the method.
 
         Keyword arguments:
         data -- processed data from sparql endpoint
+        url -- URL of the SPARQL endpoint (default defined in constants module)
     """
 
-    tagsDictionary = createTagsDictionary(data)
+    tagsDictionary = createTagsDictionary(data, url=url)
     for person in tqdm(data.values(), desc='labelTags', miniters=int(len(data) / 100)):
         for key, value in list(person.items()):
             if key in PROPERTIES_WITH_TAGS:
@@ -30,40 +39,98 @@ def labelTags(data):
     return data
 
 
-def createTagsDictionary(data, chunkSize=500):
+def createTagsDictionary(data, chunkSize=500, workers=None, url=None):
     """This method creates a dictionary with tags and their labels from all the data passed into the method.
+       Labels are stored in labels.json in DATA_DIRECTORY, so only tags that were not labeled yet or whose
+       label is older than LABELS_TTL are sent to the endpoint. Chunks of tags are labeled in parallel.
+       Labeled chunks are journaled, so they are not labeled again after a restart.
 
         Keyword arguments:
         data -- processed data from sparql endpoint
         chunkSize -- number of tags that can be labeled at once, there is a limitation on the endpoint (default: 500)
+        workers -- number of chunks labeled at once (default defined in constants module)
+        url -- URL of the SPARQL endpoint (default defined in constants module)
     """
 
+    if workers is None:
+        workers = LABEL_WORKERS
+
+    storedLabels = getLabels()
+    journaledLabels = journal.getEntries('labels')
+    for chunkLabels in journaledLabels.values():
+        storedLabels.update(chunkLabels)
     tags = getAllTags(data, PROPERTIES_WITH_TAGS)
-    tagsDictionary = {}
-
-    with requests.Session() as session:
-        for i in range(0, len(tags), chunkSize):
-            queryValues = "wd:" + " wd:".join(tags[i:i + chunkSize])
-            query = f'''
-                SELECT DISTINCT ?item ?itemLabel
-                WHERE {{
-                    VALUES ?item {{ {queryValues} }}
-                    SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
-                }}
-            '''
-            r = session.get(url=SPARQL_URL, params={'format': 'json', 'query': query},
-                            headers=HEADERS)
-            data = r.json()['results']['bindings']
-
-            for tag in data:
-                item = tag['item']['value'][WIKIDATA_ENTITY_OFFSET:]
-                itemLabel = tag['itemLabel']['value']
-                # This condition removes tags, that does not have an english label,
-                # all data with no label are removed
-                if item != itemLabel:
-                    tagsDictionary[item] = itemLabel
-
-    return tagsDictionary
+    now = time.time()
+    unknownTags = [tag for tag in tags if tag not in storedLabels or now - storedLabels[tag]['time'] > LABELS_TTL]
+    chunks = [unknownTags[i:i + chunkSize] for i in range(0, len(unknownTags), chunkSize)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(getLabelsForChunk, chunk, url): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            # Tags without a label are stored as well, so they are not sent to the endpoint again
+            chunkLabels = {tag: {'label': None, 'time': now} for tag in futures[future]}
+            for tag, label in future.result().items():
+                chunkLabels[tag] = {'label': label, 'time': now}
+            storedLabels.update(chunkLabels)
+            journal.addEntry('labels', futures[future][0], chunkLabels)
+
+    if unknownTags or journaledLabels:
+        # Labels resolved by other processes in the meantime are kept
+        storedLabels.update(mergeAndSaveData(storedLabels, f'{DATA_DIRECTORY}/labels.json'))
+
+    return {tag: storedLabels[tag]['label'] for tag in tags if storedLabels[tag]['label'] is not None}
+
+
+def getLabelsForChunk(tags, url=None):
+    """This method gets english labels of the tags from the endpoint. The query is sent in the body
+       of a POST request, so it is not limited by the length of the URL.
+
+        Keyword arguments:
+        tags -- list of tags to be labeled
+        url -- URL of the SPARQL endpoint (default defined in constants module)
+    """
+
+    if url is None:
+        url = SPARQL_URL
+
+    queryValues = "wd:" + " wd:".join(tags)
+    query = f'''
+        SELECT DISTINCT ?item ?itemLabel
+        WHERE {{
+            VALUES ?item {{ {queryValues} }}
+            SERVICE wikibase:label {{ bd:serviceParam wikibase:language "en". }}
+        }}
+    '''
+    data = client.getJson(url, data={'format': 'json', 'query': query})['results']['bindings']
+
+    labels = {}
+    for tag in data:
+        item = tag['item']['value'][WIKIDATA_ENTITY_OFFSET:]
+        itemLabel = tag['itemLabel']['value']
+        # This condition removes tags, that does not have an english label,
+        # all data with no label are removed
+        if item != itemLabel:
+            labels[item] = itemLabel
+
+    return labels
+
+
+def getLabels():
+    """This method returns labels of all the tags resolved so far. Labels are loaded from labels.json
+       in DATA_DIRECTORY on the first call. Every label is stored with the time it was resolved.
+
+        Keyword arguments:
+        None
+    """
+
+    global labels
+    if labels is None:
+        if os.path.isfile(f'{DATA_DIRECTORY}/labels.json'):
+            labels = readData(f'{DATA_DIRECTORY}/labels.json')
+        else:
+            labels = {}
+
+    return labels
 
 
 def getAllTags(data, properties):
@@ -8,9 +8,10 @@ import random
 
 from tqdm import tqdm
 
-from constants import START_YEAR, END_YEAR, DATA_DIRECTORY, YEAR_STEP, YEAR_OFFSET, PROPERTIES_TO_MERGE
+from constants import START_YEAR, END_YEAR, DATA_DIRECTORY, YEAR_STEP, YEAR_OFFSET, PROPERTIES_TO_MERGE, DATA_STORE, \
+    BANNED_EXTENSIONS, PERSON_PROPERTIES_FOR_EVALUATION, IMAGE_PROPERTIES_FOR_EVALUATION, IMAGE_METADATA_PROPERTIES
 from create.utils import addDistinctValues, readData
-from create import transformer
+from create import transformer, database
 
 
 def mergeListOfValues(data):
@@ -78,6 +79,39 @@ def mergeDatasets(datasets):
     return result
 
 
+def replaceImageMetadata(foundData, data):
+    """This method removes metadata of the stored images, which were downloaded again, so the fresh metadata
+       replace them in mergeDatasets. Metadata describe only the current revision of the file (e.g., its size
+       and hash change, when the file is uploaded again), so they cannot be merged into lists as other values.
+       The same holds for url and scale, which depend on DOWNLOAD_MODE. When the url, the scale or the hash
+       has changed, the local file and its faces belong to another rendition or revision of the image, so they
+       are removed too and the image is downloaded and put through face detection again.
+       Only images with fresh metadata from getMetadataAndLinks (i.e., with url) are changed.
+
+        Keyword arguments:
+        foundData -- stored data of the year, it is changed in place
+        data -- freshly downloaded data of the year
+    """
+
+    for wikidataID, person in data.items():
+        if wikidataID not in foundData:
+            continue
+        foundImages = foundData[wikidataID].get('images', {})
+        for fileNameWiki, image in person.get('images', {}).items():
+            if fileNameWiki not in foundImages or 'url' not in image:
+                continue
+            foundImage = foundImages[fileNameWiki]
+            # Hashes are compared only when both are known, images stored before hashes were downloaded are kept
+            isHashChanged = 'sha1' in foundImage and 'sha1' in image and foundImage['sha1'] != image['sha1']
+            if foundImage.get('url') != image['url'] or foundImage.get('scale') != image.get('scale') or isHashChanged:
+                foundImage.pop('fileNameLocal', None)
+                foundImage.pop('faces', None)
+            for property in ['url', 'scale'] + IMAGE_METADATA_PROPERTIES:
+                foundImage.pop(property, None)
+
+    return foundData
+
+
 def mergeAllData():
     """This method merges data from all years into one dictionary so calculations can be performed on
        all the data.
@@ -122,12 +156,16 @@ def splitAllData(data):
 
 def mergeAllDataForTrainingAge():
     """This method merges data from all years into one dictionary and filter out those data not suitable for
-       age estimation model training.
+       age estimation model training. When DATA_STORE is 'sqlite', the same images are queried
+       from the database instead, see database.queryImages.
 
         Keyword arguments:
         None
     """
 
+    if DATA_STORE == 'sqlite':
+        return database.queryImages(withAge=True, minAge=17, maxAge=80, faces=1, excludeExtensions=BANNED_EXTENSIONS)
+
     allData = []
     for year in tqdm(range(START_YEAR, END_YEAR, YEAR_STEP),
                      desc='mergeAllDataForTrainingAge'):
@@ -143,12 +181,17 @@ def mergeAllDataForTrainingAge():
 
 def mergeAllDataForTrainingGender():
     """This method merges data from all years into one dictionary and filter out those data not suitable for
-       gender estimation model training.
+       gender estimation model training. When DATA_STORE is 'sqlite', the same images are queried
+       from the database instead, see database.queryImages.
 
         Keyword arguments:
         None
     """
 
+    if DATA_STORE == 'sqlite':
+        return database.queryImages(withAge=True, faces=1, genders=['male', 'female'],
+                                    excludeExtensions=BANNED_EXTENSIONS)
+
     allData = []
     for year in tqdm(range(START_YEAR, END_YEAR, YEAR_STEP),
                      desc='mergeAllDataForTrainingGender'):
@@ -164,12 +207,16 @@ def mergeAllDataForTrainingGender():
 
 def mergeAllDataForTraining():
     """This method merges data from all years into one dictionary and filter out those data not suitable for
-       model training.
+       model training. When DATA_STORE is 'sqlite', the same images are queried
+       from the database instead, see database.queryImages.
 
         Keyword arguments:
         None
     """
 
+    if DATA_STORE == 'sqlite':
+        return database.queryImages(withAge=True, faces=1, excludeExtensions=BANNED_EXTENSIONS)
+
     allData = []
     for year in tqdm(range(START_YEAR, END_YEAR, YEAR_STEP),
                      desc='mergeAllDataForTraining'):
@@ -184,12 +231,18 @@ def mergeAllDataForTraining():
 
 def mergeAllDataForEvaluation():
     """This method merges data from all years into one dictionary and filter out those data not suitable for
-       evaluation.
+       evaluation. When DATA_STORE is 'sqlite', the same images are queried
+       from the database instead, see database.queryImages.
 
         Keyword arguments:
         None
     """
 
+    if DATA_STORE == 'sqlite':
+        return database.queryImages(withAge=True, faces=1, withWikipedia=True,
+                                    personProperties=PERSON_PROPERTIES_FOR_EVALUATION,
+                                    imageProperties=IMAGE_PROPERTIES_FOR_EVALUATION)
+
     allData = []
     for year in tqdm(range(START_YEAR, END_YEAR, YEAR_STEP),
                      desc='mergeAllDataForEvaluation'):
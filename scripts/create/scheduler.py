@@ -0,0 +1,307 @@
+# Module name: Scheduler
+# Purpose: This module contains functions for running a job for every year in parallel worker processes.
+#          Years are leased with lease files in LEASE_DIRECTORY, so the same job can be run on more machines
+#          sharing the filesystem and no year is processed by two workers at once.
+#          Completion of years is kept separately for every generation of the job, see resetYears.
+
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+import time
+
+from create import client
+from constants import DATA_DIRECTORY, LEASE_DIRECTORY, LEASE_TTL, WORKER_PROCESSES
+
+
+def runYears(name, job, years, processes=None, initializer=None, generation=None):
+    """This method runs the job for every year, which was not completed yet, in a pool of worker processes.
+       Years are ordered by their size in the previous run (size of their file in DATA_DIRECTORY), the largest
+       first, so the small years fill the gaps at the end. Years leased by other machines are checked again
+       until they are completed or their lease expires. Years that failed are not run again in this call.
+       True is returned, when all the years of the generation are completed, then resetYears has to be called
+       with the generation to start the next one.
+
+        Keyword arguments:
+        name -- name of the job, leases of different jobs are independent
+        job -- function with year as the only argument, it has to be defined on the module level
+        years -- list of years to process
+        processes -- number of worker processes (default defined in constants module)
+        initializer -- function called in every worker process before the first job (default: None)
+        generation -- generation of the job, see getGeneration (default: current generation)
+    """
+
+    if processes is None:
+        processes = WORKER_PROCESSES
+    if generation is None:
+        generation = getGeneration(name)
+
+    # Leases and completion of every generation are in its own directory
+    name = f'{name}/{generation}'
+    os.makedirs(f'{LEASE_DIRECTORY}/{name}', exist_ok=True)
+    years = sorted(years, key=getYearSize, reverse=True)
+    # Processes are spawned, so they do not inherit threads or open connections of this process
+    context = multiprocessing.get_context('spawn')
+    failedYears = set()
+    with context.Pool(processes, initializer=initializeWorker, initargs=(processes, initializer)) as pool:
+        while True:
+            pending = [year for year in years if not isYearCompleted(name, year)]
+            if not pending:
+                return True
+            if all(year in failedYears for year in pending):
+                return False
+            available = [year for year in pending if year not in failedYears and not isYearLeased(name, year)]
+            if not available:
+                logging.info(f'Waiting for {len(pending)} years of {name} leased by other workers')
+                time.sleep(LEASE_TTL / 3)
+                continue
+            for year, status in pool.imap_unordered(runYear, [(name, job, year) for year in available]):
+                if status == 'completed':
+                    print(f'Year {year} of {name} was completed!')
+                elif status == 'failed':
+                    failedYears.add(year)
+
+
+def initializeWorker(processes, initializer):
+    """This method initializes the worker process, limit of concurrent requests to one host is divided
+       among the worker processes (see client.setWorkerProcesses) and the initializer of the job is called.
+
+        Keyword arguments:
+        processes -- number of worker processes
+        initializer -- function called in every worker process before the first job, None if there is none
+    """
+
+    client.setWorkerProcesses(processes)
+    if initializer is not None:
+        initializer()
+
+
+def runYear(task):
+    """This method runs the job for one year in the worker process, if the year can be leased.
+       The lease is renewed while the job is running and released afterwards. Tuple of the year
+       and its status is returned, the status is 'completed', 'failed' or 'skipped', when the year
+       is leased or completed by other worker.
+
+        Keyword arguments:
+        task -- tuple of the name of the job, the job and the year
+    """
+
+    name, job, year = task
+    if isYearCompleted(name, year):
+        return year, 'skipped'
+    lease = acquireLease(name, year)
+    if lease is None:
+        return year, 'skipped'
+    # The year could be completed by the previous owner of the lease in the meantime
+    if isYearCompleted(name, year):
+        releaseLease(name, year, lease)
+        return year, 'skipped'
+
+    stop = threading.Event()
+    renewal = threading.Thread(target=renewLease, args=(name, year, lease, stop), daemon=True)
+    renewal.start()
+    try:
+        job(year)
+        open(getCompletionLocation(name, year), 'w').close()
+    except Exception:
+        logging.exception(f'Exception happened in year {year} of {name}')
+        return year, 'failed'
+    finally:
+        stop.set()
+        renewal.join()
+        releaseLease(name, year, lease)
+
+    return year, 'completed'
+
+
+def getGeneration(name):
+    """This method returns the current generation of the job, 0 is returned when the job was never run.
+       Generations are directories in LEASE_DIRECTORY/name, the current one is the highest of them.
+
+        Keyword arguments:
+        name -- name of the job
+    """
+
+    directory = f'{LEASE_DIRECTORY}/{name}'
+    if not os.path.isdir(directory):
+        return 0
+
+    return max((int(fileName) for fileName in os.listdir(directory) if fileName.isdigit()), default=0)
+
+
+def resetYears(name, generation):
+    """This method starts the next generation of the job after all the years of the generation were completed,
+       so the next run processes them again. Completion of the generation is not removed, so workers still running
+       it (e.g., on other machines) see all the years completed and do not process them again. The next
+       generation is created only once, calls by the other workers do nothing. Generations older
+       than the completed one are removed, no worker can use them anymore.
+
+        Keyword arguments:
+        name -- name of the job
+        generation -- completed generation
+    """
+
+    directory = f'{LEASE_DIRECTORY}/{name}'
+    os.makedirs(f'{directory}/{generation + 1}', exist_ok=True)
+    for fileName in os.listdir(directory):
+        if fileName.isdigit() and int(fileName) < generation:
+            shutil.rmtree(f'{directory}/{fileName}', ignore_errors=True)
+
+
+def getYearSize(year):
+    """This method returns the size of the year file from the previous run, 0 if there is no such file.
+
+        Keyword arguments:
+        year -- year of the file
+    """
+
+    try:
+        return os.path.getsize(f'{DATA_DIRECTORY}/{year}.json')
+    except OSError:
+        return 0
+
+
+def getLeaseLocation(name, year, lease):
+    """This method returns location of the lease file of the year with the sequence number.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- year of the lease
+        lease -- sequence number of the lease
+    """
+
+    return f'{LEASE_DIRECTORY}/{name}/{year}.{lease}.lease'
+
+
+def getLastLease(name, year):
+    """This method returns the highest sequence number of the leases of the year, -1 if it was never leased.
+       Only the lease with the highest number can be valid, the older ones were taken over.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- year of the lease
+    """
+
+    prefix = f'{year}.'
+    leases = [fileName[len(prefix):-len('.lease')] for fileName in os.listdir(f'{LEASE_DIRECTORY}/{name}')
+              if fileName.startswith(prefix) and fileName.endswith('.lease')]
+
+    return max((int(lease) for lease in leases if lease.isdigit()), default=-1)
+
+
+def getCompletionLocation(name, year):
+    """This method returns location of the file marking the year as completed.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- completed year
+    """
+
+    return f'{LEASE_DIRECTORY}/{name}/{year}.done'
+
+
+def isYearCompleted(name, year):
+    """This method checks if the year was completed by any worker.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- year to check
+    """
+
+    return os.path.exists(getCompletionLocation(name, year))
+
+
+def isYearLeased(name, year):
+    """This method checks if the year is leased by a worker, expired and released leases are not taken into account.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- year to check
+    """
+
+    return isLeaseValid(name, year, getLastLease(name, year))
+
+
+def isLeaseValid(name, year, lease):
+    """This method checks if the lease with the sequence number exists and was renewed in the last LEASE_TTL.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- year of the lease
+        lease -- sequence number of the lease
+    """
+
+    try:
+        return time.time() - os.path.getmtime(getLeaseLocation(name, year, lease)) < LEASE_TTL
+    except OSError:
+        return False
+
+
+def acquireLease(name, year):
+    """This method leases the year, the sequence number of the lease is returned, if it was acquired by this worker,
+       None otherwise. Lease is a file with the sequence number one higher than the last lease of the year
+       and it is created exclusively, so only one worker can get it even on more machines. Expired lease
+       (not renewed for LEASE_TTL) of a crashed worker is taken over the same way, the old file is never
+       removed before the new lease is created, so two workers cannot lease the year at once.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- year to lease
+    """
+
+    lastLease = getLastLease(name, year)
+    if isLeaseValid(name, year, lastLease):
+        return None
+
+    lease = lastLease + 1
+    try:
+        fd = os.open(getLeaseLocation(name, year, lease), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time()}, f)
+
+    if lastLease >= 0:
+        logging.info(f'Lease {lastLease} of year {year} of {name} was taken over')
+        try:
+            os.remove(getLeaseLocation(name, year, lastLease))
+        except OSError:
+            pass
+
+    return lease
+
+
+def renewLease(name, year, lease, stop):
+    """This method renews the lease of the year until the stop event is set.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- leased year
+        lease -- sequence number of the lease
+        stop -- event set when the job is finished
+    """
+
+    while not stop.wait(LEASE_TTL / 3):
+        try:
+            os.utime(getLeaseLocation(name, year, lease))
+        except OSError:
+            logging.exception(f'Exception happened while renewing lease of year {year} of {name}')
+
+
+def releaseLease(name, year, lease):
+    """This method releases the lease of the year. The file is kept with the time of modification set to 0,
+       so it is expired, but its sequence number is not used again.
+
+        Keyword arguments:
+        name -- name of the job
+        year -- leased year
+        lease -- sequence number of the lease
+    """
+
+    try:
+        os.utime(getLeaseLocation(name, year, lease), (0, 0))
+    except OSError:
+        logging.exception(f'Exception happened while releasing lease of year {year} of {name}')
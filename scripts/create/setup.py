@@ -4,7 +4,8 @@
 import logging
 import os
 
-from constants import IMAGES_DIRECTORY, DATA_DIRECTORY, DATASET_DIRECTORY, STATS_DIRECTORY, LOGS_DIRECTORY
+from constants import IMAGES_DIRECTORY, DATA_DIRECTORY, DATASET_DIRECTORY, STATS_DIRECTORY, LOGS_DIRECTORY, \
+    CACHE_DIRECTORY
 
 
 def directoriesConfig():
@@ -29,6 +30,9 @@ def directoriesConfig():
     if not os.path.exists(LOGS_DIRECTORY):
         os.makedirs(LOGS_DIRECTORY)
 
+    if not os.path.exists(CACHE_DIRECTORY):
+        os.makedirs(CACHE_DIRECTORY)
+
 
 def loggerConfig():
     """This method sets up the logger.
@@ -0,0 +1,467 @@
+# Module name: Storage
+# Purpose: This module contains storage backends of the data files used by readData and saveData. Data can be
+#          saved as indented JSON, compact JSON Lines or msgpack, optionally compressed by gzip or zstd.
+#          Format and compression of a file are detected from its content, so the files keep their names
+#          (e.g., 1900.json) and all the modules read them the same way. Packages msgpack and zstandard
+#          are optional, they are imported only when they are needed.
+#          Saved year files are indexed in one SQLite index of their directory (INDEX_NAME), which maps every
+#          wikidataID to its year and to the byte offset of its line in uncompressed JSON Lines files, so one person
+#          can be read by getPerson without reading all the year files or parsing the whole year file.
+
+import gzip
+import importlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from tqdm import tqdm
+
+from constants import DATA_DIRECTORY, STORAGE_FORMAT, STORAGE_COMPRESSION, STORAGE_COMPRESSION_LEVEL
+
+# First line of JSON Lines files, it distinguishes them from JSON files
+JSONL_HEADER = '{"storage":"jsonl","version":1'
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+YEAR_FILE_PATTERN = r'-?\d+\.json'
+INDEX_NAME = 'yearFiles.sqlite'
+INDEX_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS files (
+        year INTEGER PRIMARY KEY,
+        size INTEGER NOT NULL,
+        modified INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS people (
+        wikidataID TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        offset INTEGER,
+        length INTEGER,
+        PRIMARY KEY (wikidataID, year)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS peopleYear ON people (year);
+'''
+
+# Connections to the indexes of the year files by process and directory, see getIndex
+indexes = {}
+indexLock = threading.RLock()
+
+
+def saveData(data, file, format='json', compression=None, indent=2):
+    """This method saves data to a file in the format with the compression.
+
+        Keyword arguments:
+        data -- data to save, dictionary or list
+        file -- file and location to save data to
+        format -- 'json', 'jsonl' or 'msgpack' (default: 'json')
+        compression -- None, 'gzip' or 'zstd' (default: None)
+        indent -- number of spaces for nicer formatting of JSON, it is used only by 'json' format (default: 2)
+    """
+
+    saveIndex(data, writeData(data, file, format, compression, indent), file)
+
+
+def writeData(data, file, format='json', compression=None, indent=2):
+    """This method writes data to a file in the format with the compression without indexing it. Offsets
+       of the lines of JSON Lines dictionaries are returned for uncompressed files, None otherwise.
+
+        Keyword arguments:
+        data -- data to save, dictionary or list
+        file -- file and location to save data to
+        format -- 'json', 'jsonl' or 'msgpack' (default: 'json')
+        compression -- None, 'gzip' or 'zstd' (default: None)
+        indent -- number of spaces for nicer formatting of JSON, it is used only by 'json' format (default: 2)
+    """
+
+    savers = {'json': saveJson, 'jsonl': saveJsonLines, 'msgpack': saveMsgpack}
+    if format not in savers:
+        raise ValueError(f'Unknown storage format {format}')
+
+    with openFile(file, 'wb', compression) as f:
+        offsets = savers[format](data, f, indent)
+
+    # Offsets in compressed files cannot be seeked to, other formats are not line based
+    return offsets if format == 'jsonl' and compression is None else None
+
+
+def readData(file):
+    """This method reads data from a file saved by saveData in any format and compression,
+       both are detected from the content of the file.
+
+        Keyword arguments:
+        file -- file and location to read data from
+    """
+
+    format, compression = detectStorage(file)
+    readers = {'json': readJson, 'jsonl': readJsonLines, 'msgpack': readMsgpack}
+    with openFile(file, 'rb', compression) as f:
+        return readers[format](f)
+
+
+def detectStorage(file):
+    """This method returns tuple of the format and the compression of a file saved by saveData.
+
+        Keyword arguments:
+        file -- file and location to check
+    """
+
+    with open(file, 'rb') as f:
+        magic = f.read(len(ZSTD_MAGIC))
+    compression = 'gzip' if magic.startswith(GZIP_MAGIC) else 'zstd' if magic == ZSTD_MAGIC else None
+
+    with openFile(file, 'rb', compression) as f:
+        start = f.peek(len(JSONL_HEADER))[:len(JSONL_HEADER)]
+    if start == JSONL_HEADER.encode('utf-8'):
+        return 'jsonl', compression
+    if start[:1].isspace() or start[:1] in [b'{', b'[', b'"'] or start[:1].isdigit():
+        return 'json', compression
+    return 'msgpack', compression
+
+
+def openFile(file, mode, compression=None):
+    """This method opens a file for binary reading or writing with the compression. Returned stream
+       supports peek, when it is opened for reading.
+
+        Keyword arguments:
+        file -- file and location to open
+        mode -- 'rb' or 'wb'
+        compression -- None, 'gzip' or 'zstd' (default: None)
+    """
+
+    if compression is None:
+        return open(file, mode)
+    if compression == 'gzip':
+        return gzip.open(file, mode, compresslevel=STORAGE_COMPRESSION_LEVEL['gzip'])
+    if compression == 'zstd':
+        zstandard = importOptional('zstandard')
+        if mode == 'wb':
+            return zstandard.ZstdCompressor(level=STORAGE_COMPRESSION_LEVEL['zstd']).stream_writer(open(file, mode))
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(file, mode)))
+
+    raise ValueError(f'Unknown storage compression {compression}')
+
+
+def importOptional(name):
+    """This method imports an optional package, ImportError with the name of the package to install
+       is raised when it is missing.
+
+        Keyword arguments:
+        name -- name of the package or its module (e.g., pyarrow.parquet)
+    """
+
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        package = name.split('.')[0]
+        raise ImportError(f'Package {package} is required, install it with pip install {package}') from e
+
+
+def saveJson(data, f, indent):
+    """This method writes data to the binary stream as JSON.
+
+        Keyword arguments:
+        data -- data to save
+        f -- binary stream
+        indent -- number of spaces for nicer formatting of JSON
+    """
+
+    text = io.TextIOWrapper(f, encoding='UTF-8')
+    json.dump(data, text, ensure_ascii=False, indent=indent)
+    text.flush()
+    # The stream is closed by the caller
+    text.detach()
+
+
+def readJson(f):
+    """This method reads data from the binary stream of JSON.
+
+        Keyword arguments:
+        f -- binary stream
+    """
+
+    return json.load(io.TextIOWrapper(f, encoding='UTF-8'))
+
+
+def saveJsonLines(data, f, indent=None):
+    """This method writes data to the binary stream as JSON Lines. The first line is the header with the type
+       of the data, every other line is one item of a list or one [key, value] pair of a dictionary (e.g., one person),
+       so the file can be read or processed line by line. Dictionary with offset and length in bytes of the line
+       of every key is returned for dictionaries, None for lists.
+
+        Keyword arguments:
+        data -- data to save, dictionary or list
+        f -- binary stream
+        indent -- not used, JSON Lines are always compact (default: None)
+    """
+
+    isDictionary = isinstance(data, dict)
+    offsets = {} if isDictionary else None
+    position = f.write(f'{JSONL_HEADER},"type":"{"dict" if isDictionary else "list"}"}}\n'.encode('utf-8'))
+    for item in data.items() if isDictionary else data:
+        line = json.dumps(list(item) if isDictionary else item, ensure_ascii=False, separators=(',', ':'))
+        line = f'{line}\n'.encode('utf-8')
+        if isDictionary:
+            offsets[item[0]] = [position, len(line)]
+        position += f.write(line)
+
+    return offsets
+
+
+def readJsonLines(f):
+    """This method reads data from the binary stream of JSON Lines written by saveJsonLines. Lines are joined
+       into one JSON array, which is parsed at once, that is much faster than parsing every line on its own.
+
+        Keyword arguments:
+        f -- binary stream
+    """
+
+    header = json.loads(f.readline())
+    # Lines of JSON cannot contain a new line, it is always escaped
+    items = f.read().decode('utf-8').strip().replace('\n', ',')
+    items = json.loads(f'[{items}]')
+    if header['type'] == 'dict':
+        return dict(items)
+    return items
+
+
+def getYear(file):
+    """This method returns the birth year of the people in a year file (e.g., 1900 for 1900.json),
+       None is returned for other files.
+
+        Keyword arguments:
+        file -- file and location of the data
+    """
+
+    fileName = os.path.basename(file)
+    return int(fileName[:-len('.json')]) if re.fullmatch(YEAR_FILE_PATTERN, fileName) else None
+
+
+def getIndex(directory):
+    """This method returns connection to the index of the year files in the directory, the index is created
+       when it does not exist. Connections are opened only once in every process and shared by its threads.
+
+        Keyword arguments:
+        directory -- directory with the year files
+    """
+
+    location = os.path.abspath(f'{directory}/{INDEX_NAME}')
+    with indexLock:
+        # Connections cannot be used by forked processes
+        if (os.getpid(), location) not in indexes:
+            connection = sqlite3.connect(location, timeout=60, check_same_thread=False)
+            # Readers are not blocked by the processes saving other years
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(INDEX_SCHEMA)
+            indexes[(os.getpid(), location)] = connection
+        return indexes[(os.getpid(), location)]
+
+
+def saveIndex(data, offsets, file):
+    """This method replaces the people of a year file in the index of its directory. Size and modification
+       time of the file are saved too, so the index of the file is built again, when the file is changed
+       without it (see refreshIndex). Other files than year files are not indexed.
+
+        Keyword arguments:
+        data -- data saved in the file
+        offsets -- dictionary with offset and length of the line of every key returned by saveJsonLines,
+                   None when the file is not seekable by lines
+        file -- file and location of the data
+    """
+
+    year = getYear(file)
+    if year is None or not isinstance(data, dict):
+        return
+
+    offsets = offsets or {}
+    stat = os.stat(file)
+    connection = getIndex(os.path.dirname(file) or '.')
+    with indexLock, connection:
+        connection.execute('DELETE FROM people WHERE year = ?', (year,))
+        connection.executemany('INSERT OR REPLACE INTO people VALUES (?, ?, ?, ?)',
+                               ((key, year, *offsets.get(key, (None, None))) for key in data))
+        connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (year, stat.st_size, stat.st_mtime_ns))
+
+
+def indexFile(file):
+    """This method builds the index of a year file, which was not saved by saveData (e.g., it was copied
+       or saved by an older version). Offsets of the lines are found for uncompressed JSON Lines files.
+
+        Keyword arguments:
+        file -- year file and location
+    """
+
+    if detectStorage(file) != ('jsonl', None):
+        saveIndex(readData(file), None, file)
+        return
+
+    offsets = {}
+    with open(file, 'rb') as f:
+        position = len(f.readline())
+        for line in f:
+            offsets[json.loads(line)[0]] = [position, len(line)]
+            position += len(line)
+    saveIndex(offsets, offsets, file)
+
+
+def refreshIndex(directory, fileNames):
+    """This method builds the index of the year files again, when they were changed since they were indexed.
+       Only the sizes and modification times of the files are checked, so it is cheap for unchanged files.
+       People of the removed files are removed from the index.
+
+        Keyword arguments:
+        directory -- directory with the year files
+        fileNames -- names of the year files to check (e.g., ['1900.json'])
+    """
+
+    connection = getIndex(directory)
+    with indexLock:
+        indexedFiles = {row[0]: (row[1], row[2]) for row in connection.execute('SELECT * FROM files')}
+
+    for fileName in fileNames:
+        file = f'{directory}/{fileName}'
+        if not os.path.isfile(file):
+            if getYear(file) in indexedFiles:
+                with indexLock, connection:
+                    connection.execute('DELETE FROM people WHERE year = ?', (getYear(file),))
+                    connection.execute('DELETE FROM files WHERE year = ?', (getYear(file),))
+            continue
+        stat = os.stat(file)
+        if indexedFiles.get(getYear(file)) != (stat.st_size, stat.st_mtime_ns):
+            indexFile(file)
+
+
+def readPerson(file, wikidataID):
+    """This method reads one person from a year file, None is returned when the person is not in the file.
+       Only the line of the person is read and parsed, when the file is uncompressed JSON Lines file,
+       the whole file is read otherwise.
+
+        Keyword arguments:
+        file -- year file and location
+        wikidataID -- wikidata ID of the person
+    """
+
+    year = getYear(file)
+    if year is None:
+        return readData(file).get(wikidataID)
+
+    directory = os.path.dirname(file) or '.'
+    refreshIndex(directory, [os.path.basename(file)])
+    connection = getIndex(directory)
+    with indexLock:
+        row = connection.execute('SELECT offset, length FROM people WHERE wikidataID = ? AND year = ?',
+                                 (wikidataID, year)).fetchone()
+    if row is None:
+        return None
+
+    offset, length = row
+    if offset is not None:
+        with open(file, 'rb') as f:
+            f.seek(offset)
+            line = f.read(length)
+        # The file can be saved again by another process after its index was checked
+        if line.startswith(json.dumps([wikidataID], ensure_ascii=False)[:-1].encode('utf-8') + b','):
+            key, person = json.loads(line)
+            return person
+
+    return readData(file).get(wikidataID)
+
+
+def getPerson(wikidataID, year=None, directory=None):
+    """This method returns one person from the year files, None is returned when the person is not found.
+       When the year is not known, it is found in the index of all the year files, so only one year file
+       is read. People with more birth years are returned from the earliest one.
+
+        Keyword arguments:
+        wikidataID -- wikidata ID of the person
+        year -- birth year of the person, name of its year file (default: None)
+        directory -- directory with the year files (default defined in constants module)
+    """
+
+    if directory is None:
+        directory = DATA_DIRECTORY
+
+    if year is not None:
+        file = f'{directory}/{year}.json'
+        return readPerson(file, wikidataID) if os.path.isfile(file) else None
+
+    connection = getIndex(directory)
+    with indexLock:
+        indexedFiles = [f'{row[0]}.json' for row in connection.execute('SELECT year FROM files')]
+    refreshIndex(directory, sorted(set(getYearFiles(directory) + indexedFiles)))
+    with indexLock:
+        row = connection.execute('SELECT year FROM people WHERE wikidataID = ? ORDER BY year LIMIT 1',
+                                 (wikidataID,)).fetchone()
+
+    return readPerson(f'{directory}/{row[0]}.json', wikidataID) if row is not None else None
+
+
+def getYearFiles(directory):
+    """This method returns sorted names of all the year files (e.g., 1900.json) in the directory.
+
+        Keyword arguments:
+        directory -- directory with the year files
+    """
+
+    return sorted(fileName for fileName in os.listdir(directory) if re.fullmatch(YEAR_FILE_PATTERN, fileName))
+
+
+def saveMsgpack(data, f, indent=None):
+    """This method writes data to the binary stream as msgpack.
+
+        Keyword arguments:
+        data -- data to save
+        f -- binary stream
+        indent -- not used, msgpack is binary format (default: None)
+    """
+
+    msgpack = importOptional('msgpack')
+    f.write(msgpack.packb(data, use_bin_type=True))
+
+
+def readMsgpack(f):
+    """This method reads data from the binary stream of msgpack.
+
+        Keyword arguments:
+        f -- binary stream
+    """
+
+    msgpack = importOptional('msgpack')
+    return msgpack.unpackb(f.read(), raw=False)
+
+
+def migrateData(format=None, compression=None, directory=None):
+    """This method converts all the year files (e.g., 1900.json) in the directory into the format with
+       the compression. Every file is replaced atomically, so it is never left partially written.
+       Converted files are indexed again.
+       Total sizes of the files before and after are printed.
+
+        Keyword arguments:
+        format -- 'json', 'jsonl' or 'msgpack' (default defined in constants module with its compression)
+        compression -- None, 'gzip' or 'zstd' (default: None)
+        directory -- directory with the year files (default defined in constants module)
+    """
+
+    if format is None:
+        format, compression = STORAGE_FORMAT, STORAGE_COMPRESSION
+    if directory is None:
+        directory = DATA_DIRECTORY
+
+    files = getYearFiles(directory)
+    sizeBefore, sizeAfter = 0, 0
+    for fileName in tqdm(files, desc='migrateData'):
+        location = f'{directory}/{fileName}'
+        sizeBefore += os.path.getsize(location)
+        if detectStorage(location) != (format, compression):
+            data = readData(location)
+            offsets = writeData(data, f'{location}.{os.getpid()}.tmp', format, compression)
+            os.replace(f'{location}.{os.getpid()}.tmp', location)
+            saveIndex(data, offsets, location)
+        sizeAfter += os.path.getsize(location)
+
+    print(f'Migrated {len(files)} files to {format} ({compression}), {sizeBefore} B -> {sizeAfter} B')
+
+
+if __name__ == '__main__':
+    migrateData()
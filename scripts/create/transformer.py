@@ -13,7 +13,8 @@ from create.utils import addDistinctValues, getLastPartOfURL
 from create import merger
 from constants import BROKEN_DATA, PERSON_PROPERTIES_FOR_TRAINING, IMAGE_PROPERTIES_FOR_TRAINING, GENERAL_DATE_OFFSET, \
     WIKIPEDIA_FILE_NAME_OFFSET, FILE_EXT_INDEX, WIKIDATA_ENTITY_OFFSET, BANNED_EXTENSIONS, \
-    PERSON_PROPERTIES_FOR_EVALUATION, IMAGE_PROPERTIES_FOR_EVALUATION, WIKIPEDIA_TITLE_OFFSET
+    PERSON_PROPERTIES_FOR_EVALUATION, IMAGE_PROPERTIES_FOR_EVALUATION, WIKIPEDIA_TITLE_OFFSET, \
+    SPARQL_VALUES_SEPARATOR, SPARQL_IMAGE_SEPARATOR
 
 
 def removeBrokenData(data):
@@ -27,14 +28,27 @@ def removeBrokenData(data):
     """
 
     for record in tqdm(data, desc='removeBrokenData', miniters=int(len(data) / 100)):
-        for property in list(record):
-            for brokenData in BROKEN_DATA:
-                if brokenData in record[property]['value']:
-                    del record[property]
+        removeBrokenRecord(record)
 
     return data
 
 
+def removeBrokenRecord(record):
+    """This method removes unknown data from one record of raw data from sparql endpoint,
+       see removeBrokenData for more details.
+
+        Keyword arguments:
+        record -- one record of raw data from sparql endpoint
+    """
+
+    for property in list(record):
+        for brokenData in BROKEN_DATA:
+            if property in record and brokenData in record[property]['value']:
+                del record[property]
+
+    return record
+
+
 def simplifySparqlData(data):
     """This method simplifies raw data from sparql endpoint into more usable format,
        creates all necessary object properties or transform them.
@@ -47,47 +61,119 @@ def simplifySparqlData(data):
     result = []
 
     for record in tqdm(data, desc='simplifySparqlData', miniters=int(len(data) / 100)):
-        simpRec = {}  # simpRec -- simplified record
-        # Have to process wikidataID first as it is used with other properties
-        if 'wikidataID' in record:
-            value = record['wikidataID']['value'][WIKIDATA_ENTITY_OFFSET:]
-            simpRec['wikidataID'] = value
-        # Have to create images object before filling it with other properties (date, caption, etc.)
-        if 'imageUrl' in record:
-            image = {
-                "caption": [],
-                "date": [],
-            }
-        for key, value in record.items():
-            if key in ['occupation', 'nationality', 'gender']:
-                simpRec[key] = [getLastPartOfURL(value['value'])]
-            if key in ['description', 'name']:
-                simpRec[key] = value['value']
-            elif key == 'wikipediaTitle':
-                # simpRec[key] = getLastPartOfURL(value['value'])
-                simpRec[key] = value['value'][:WIKIPEDIA_TITLE_OFFSET]
-            elif key == 'birthDate' or key == 'deathDate':
-                simpRec[key] = value['value'][:GENERAL_DATE_OFFSET]
-            elif key == 'imageUrl':
-                # urllib.parse.unquote gets rid of the special characters in URL (%20, etc.)
-                # I need to do it, so I can use name of the file to distinguish
-                # whether the image is in the set already or not
-                # I cannot use getLastPartOfURL, because fileNames can contain special characters which will result in
-                # stripping incorrect part of URL
-                fileName = value['value'][WIKIPEDIA_FILE_NAME_OFFSET:]
-                image['fileNameWiki'] = unquote(fileName).replace(" ", "_")
-                image['extension'] = f'{os.path.splitext(image["fileNameWiki"])[FILE_EXT_INDEX].lower()}'
-                simpRec['images'] = {image['fileNameWiki']: image}
-            elif key == 'imageDate':
-                image['date'].append(value['value'][:GENERAL_DATE_OFFSET])
-            elif key == 'caption':
-                image['caption'].append(value['value'])
-
-        result.append(simpRec)
+        result.append(simplifySparqlRecord(record))
 
     return result
 
 
+def simplifySparqlRecord(record):
+    """This method simplifies one record of raw data from sparql endpoint, see simplifySparqlData for more details.
+
+        Keyword arguments:
+        record -- one record of raw data from sparql endpoint
+    """
+
+    simpRec = {}  # simpRec -- simplified record
+    # Have to process wikidataID first as it is used with other properties
+    if 'wikidataID' in record:
+        value = record['wikidataID']['value'][WIKIDATA_ENTITY_OFFSET:]
+        simpRec['wikidataID'] = value
+    # Have to create images object before filling it with other properties (date, caption, etc.)
+    if 'imageUrl' in record:
+        image = {
+            "caption": [],
+            "date": [],
+        }
+    for key, value in record.items():
+        if key in ['occupation', 'nationality', 'gender']:
+            simpRec[key] = [getLastPartOfURL(value['value'])]
+        if key in ['description', 'name']:
+            simpRec[key] = value['value']
+        elif key == 'wikipediaTitle':
+            # Title is the rest of the URL of the article, it is unquoted as the titles in the dump
+            simpRec[key] = unquote(value['value'][WIKIPEDIA_TITLE_OFFSET:])
+        elif key == 'birthDate' or key == 'deathDate':
+            simpRec[key] = value['value'][:GENERAL_DATE_OFFSET]
+        elif key == 'imageUrl':
+            # urllib.parse.unquote gets rid of the special characters in URL (%20, etc.)
+            # I need to do it, so I can use name of the file to distinguish
+            # whether the image is in the set already or not
+            # I cannot use getLastPartOfURL, because fileNames can contain special characters which will result in
+            # stripping incorrect part of URL
+            fileName = value['value'][WIKIPEDIA_FILE_NAME_OFFSET:]
+            image['fileNameWiki'] = unquote(fileName).replace(" ", "_")
+            image['extension'] = f'{os.path.splitext(image["fileNameWiki"])[FILE_EXT_INDEX].lower()}'
+            simpRec['images'] = {image['fileNameWiki']: image}
+        elif key == 'imageDate':
+            image['date'].append(value['value'][:GENERAL_DATE_OFFSET])
+        elif key == 'caption':
+            image['caption'].append(value['value'])
+
+    return simpRec
+
+
+def simplifyGroupedSparqlRecord(record):
+    """This method simplifies one record of the grouped sparql query (see downloader.getGroupedSparqlQuery)
+       into the same format as simplifySparqlData and processSparqlData, so all the values of a person are
+       already merged. Unknown values (see removeBrokenData) are left out. Components of an image (URL, caption
+       and date) are checked one by one, so an unknown caption or date does not remove the whole image,
+       the same as removeBrokenRecord removes only the unknown property in the flat query.
+
+        Keyword arguments:
+        record -- one record of raw data from the grouped sparql query
+    """
+
+    values = {}
+    for key, value in record.items():
+        items = [item for item in value['value'].split(SPARQL_VALUES_SEPARATOR) if item]
+        if key == 'images':
+            items = [[component if not isBrokenValue(component) else '' for component in
+                      item.split(SPARQL_IMAGE_SEPARATOR)] for item in items]
+            # Image without known URL is left out, the same as record without imageUrl in the flat query
+            values[key] = [item for item in items if item[0]]
+        else:
+            values[key] = [item for item in items if not isBrokenValue(item)]
+
+    simpRec = {'wikidataID': record['wikidataID']['value'][WIKIDATA_ENTITY_OFFSET:]}  # simpRec -- simplified record
+    for key, items in values.items():
+        if not items:
+            continue
+        if key in ['genders', 'nationalities', 'occupations']:
+            property = {'genders': 'gender', 'nationalities': 'nationality', 'occupations': 'occupation'}[key]
+            simpRec[property] = [getLastPartOfURL(item) for item in items]
+        elif key in ['names', 'descriptions']:
+            simpRec[key[:-1]] = items[0]
+        elif key == 'wikipediaTitles':
+            simpRec['wikipediaTitle'] = unquote(items[0][WIKIPEDIA_TITLE_OFFSET:])
+        elif key in ['birthDates', 'deathDates']:
+            dates = list(dict.fromkeys(item[:GENERAL_DATE_OFFSET] for item in items))
+            simpRec[key[:-1]] = dates[0] if len(dates) == 1 else dates
+        elif key == 'images':
+            simpRec['images'] = {}
+            for item in items:
+                url, caption, date = item
+                fileName = unquote(url[WIKIPEDIA_FILE_NAME_OFFSET:]).replace(" ", "_")
+                image = {
+                    "caption": [caption] if caption else [],
+                    "date": [date[:GENERAL_DATE_OFFSET]] if date else [],
+                    "fileNameWiki": fileName,
+                    "extension": f'{os.path.splitext(fileName)[FILE_EXT_INDEX].lower()}'
+                }
+                addDistinctValues(fileName, image, simpRec['images'])
+
+    return simpRec
+
+
+def isBrokenValue(value):
+    """This method checks if the value is unknown, see removeBrokenData.
+
+        Keyword arguments:
+        value -- value from sparql endpoint
+    """
+
+    return any(brokenData in value for brokenData in BROKEN_DATA)
+
+
 def processSparqlData(data):
     """This method processes simplified data from sparql endpoint,
        checks for duplicities in RDF triplets and only save distinct values.
@@ -100,19 +186,101 @@ def processSparqlData(data):
     peopleDictionary = {}
 
     for person in tqdm(data, desc='processSparqlData', miniters=int(len(data) / 100)):
-        wikidataID = person['wikidataID']
-        if wikidataID in peopleDictionary:
-            for key, value in person.items():
-                addDistinctValues(key, value, peopleDictionary[wikidataID])
-        else:
-            # having all pictures in a dictionary is better for processing even if there is just one
-            if 'images' not in person:
-                person['images'] = {}
-            peopleDictionary[wikidataID] = person
+        addPersonToDictionary(person, peopleDictionary)
+
+    return peopleDictionary
+
+
+def addPersonToDictionary(person, peopleDictionary):
+    """This method adds one simplified record from sparql endpoint to the dictionary of people,
+       when the person is already in the dictionary only distinct values are added.
+
+       Keyword arguments:
+       person -- one simplified record from sparql endpoint
+       peopleDictionary -- dictionary of processed people with wikidataID as a key
+    """
+
+    wikidataID = person['wikidataID']
+    if wikidataID in peopleDictionary:
+        for key, value in person.items():
+            addDistinctValues(key, value, peopleDictionary[wikidataID])
+    else:
+        # having all pictures in a dictionary is better for processing even if there is just one
+        if 'images' not in person:
+            person['images'] = {}
+        peopleDictionary[wikidataID] = person
 
     return peopleDictionary
 
 
+def parseSparqlTsvLine(line, variables):
+    """This method parses one line of the TSV response from sparql endpoint into the same record
+       as is returned in the JSON response. Empty cells are unbound variables, they are left out of the record.
+
+       Keyword arguments:
+       line -- one line of the TSV response, except the header
+       variables -- names of the variables from the header of the TSV response without the question mark
+    """
+
+    cells = line.split('\t')
+    if len(cells) != len(variables):
+        raise ValueError(f'Line of SPARQL TSV response has {len(cells)} cells instead of {len(variables)}')
+
+    return {variable: {'value': parseRdfTerm(cell)} for variable, cell in zip(variables, cells) if cell}
+
+
+def parseRdfTerm(term):
+    """This method returns value of RDF term from the TSV response of sparql endpoint. Terms are encoded the same
+       way as in N-Triples, e.g. <http://www.wikidata.org/entity/Q42>, "Douglas Adams"@en
+       or "1952-03-11T00:00:00Z"^^<http://www.w3.org/2001/XMLSchema#dateTime>.
+
+       Keyword arguments:
+       term -- RDF term
+    """
+
+    if term.startswith('<') and term.endswith('>'):
+        return term[1:-1]
+    if term.startswith('"'):
+        end = term.rindex('"')
+        if end == 0:
+            raise ValueError(f'Literal {term} is not terminated')
+        return unescapeRdfLiteral(term[1:end])
+    # Blank nodes and numbers without datatype
+    return term
+
+
+def unescapeRdfLiteral(literal):
+    """This method replaces escape sequences in the literal from the TSV response by the characters they represent.
+
+       Keyword arguments:
+       literal -- literal without quotes, language or datatype
+    """
+
+    if '\\' not in literal:
+        return literal
+
+    escapes = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+    result = []
+    i = 0
+    while i < len(literal):
+        character = literal[i]
+        if character == '\\' and i + 1 < len(literal):
+            escaped = literal[i + 1]
+            if escaped in escapes:
+                result.append(escapes[escaped])
+                i += 2
+                continue
+            if escaped in 'uU':
+                length = 4 if escaped == 'u' else 8
+                result.append(chr(int(literal[i + 2:i + 2 + length], 16)))
+                i += 2 + length
+                continue
+        result.append(character)
+        i += 1
+
+    return ''.join(result)
+
+
 def toImageData(data):
     """This method creates dataset, which is images oriented. This dataset is better usable for model training.
 
@@ -240,6 +408,7 @@ def toEvaluationSample():
        annotated images with exactly one face detected in them and age found, are put together.
        These images are further filtered for related Wikipedia page. All images without a related
        Wikipedia page are filtered out. From those 1000 are pseudorandomly chosen.
+       When DATA_STORE is 'sqlite', the images are queried from the database, see merger.mergeAllDataForEvaluation.
 
        Keyword arguments:
         None
@@ -2,10 +2,11 @@
 # Purpose: This module contains functions that are used in multiple modules.
 
 import os
-import json
 
 from urllib.parse import urlparse, unquote
 
+from create import storage
+
 
 def addDistinctValues(property, value, node):
     """This method checks for duplicate values in any structure (list, dict) and only adds it once.
@@ -54,29 +55,74 @@ def getLastPartOfURL(url):
     return unquote(os.path.basename(urlparse(url).path))
 
 
-def saveData(data, file, indent=2):
-    """This method saves data to a file with a specific indent.
+def saveData(data, file, indent=2, format='json', compression=None):
+    """This method saves data to a file with a specific indent. Year files are saved in STORAGE_FORMAT
+       with STORAGE_COMPRESSION, see storage module.
 
         Keyword arguments:
         data -- processed data from sparql endpoint
         file -- file and location to save data to
         indent -- number of spaces for nicer formatting of JSON (default: 2)
+        format -- 'json', 'jsonl' or 'msgpack' (default: 'json')
+        compression -- None, 'gzip' or 'zstd' (default: None)
+    """
+
+    storage.saveData(data, file, format, compression, indent)
+
+
+def mergeAndSaveData(data, file, indent=2):
+    """This method merges dictionary into the dictionary stored in a file and saves the result back, values
+       from data replace the stored ones. It is used for files shared by more processes (e.g., labels),
+       the file is locked during the merge and replaced atomically, so no update is lost
+       and the file is never read partially written. The merged dictionary is returned.
+
+        Keyword arguments:
+        data -- dictionary to merge into the file
+        file -- file and location to save data to
+        indent -- number of spaces for nicer formatting of JSON (default: 2)
     """
 
-    with open(file, 'w', encoding="UTF-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=indent)
+    with open(f'{file}.lock', 'w') as lock:
+        lockFile(lock)
+        storedData = readData(file) if os.path.isfile(file) else {}
+        storedData.update(data)
+        saveData(storedData, f'{file}.{os.getpid()}.tmp', indent)
+        os.replace(f'{file}.{os.getpid()}.tmp', file)
+
+    return storedData
+
+
+def lockFile(f):
+    """This method waits until the open file is exclusively locked by this process, the lock is released
+       when the file is closed. Files are locked by fcntl on Unix and by msvcrt on Windows.
+
+        Keyword arguments:
+        f -- open file used as the lock
+    """
+
+    if os.name == 'nt':
+        import msvcrt
+        while True:
+            try:
+                # Blocking lock gives up after 10 seconds, so it is tried again
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                pass
+    else:
+        import fcntl
+        fcntl.flock(f, fcntl.LOCK_EX)
 
 
 def readData(file):
-    """This method reads data from a file passed as an argument.
+    """This method reads data from a file passed as an argument, its format and compression are detected,
+       see storage module.
 
         Keyword arguments:
         file -- file and location to read data from
     """
 
-    with open(file, 'r', encoding="UTF-8") as f:
-        data = json.loads(f.read())
-    return data
+    return storage.readData(file)
 
 
 def countProperty(data, properties={}, verbose=False):
@@ -0,0 +1,115 @@
+# Module name: Benchmark
+# Purpose: This module contains a benchmark of the whole data collection pipeline. The pipeline is run
+#          against the local fake Wikimedia services (see fakeWikimedia module) in a temporary directory
+#          and throughput of every stage is computed from the report of the run (see instrumentation module).
+
+import os
+import tempfile
+
+from create import client, instrumentation, scheduler
+from create.dataCollectionProcess import downloadYear
+from create.dataCollectionSetup import config
+from create.utils import readData, saveData
+from eval.fakeWikimedia import startServer, getUrlOverrides
+from constants import STATS_DIRECTORY
+
+
+def runBenchmark(fromYear=1900, toYear=1905, processes=1, peoplePerYear=1000, imagesPerPerson=1, latency=None,
+                 errorRate=0.0, directory=None):
+    """This method runs the data collection of the years against the fake Wikimedia services and returns
+       the throughput of every stage, see getThroughput. All the directories of constants module are relative
+       to the working directory, so the benchmark changes the working directory to run-*/scripts/create
+       in the directory until it is finished and all the data, images, journals, completed years
+       and reports are created there. Every run gets its own run-* directory, so nothing from the previous
+       runs is reused. The summary is saved to benchmark-{run}.json in STATS_DIRECTORY of the run directory.
+
+        Keyword arguments:
+        fromYear -- first year of the benchmark (default: 1900)
+        toYear -- first year after the benchmark (default: 1905)
+        processes -- number of worker processes (default: 1)
+        peoplePerYear -- number of people born in every year (default: 1000)
+        imagesPerPerson -- number of images of every person (default: 1)
+        latency -- dictionary with mean latencies of the fake services, see fakeWikimedia.startServer (default: None)
+        errorRate -- probability of failure of every request to the fake services (default: 0.0)
+        directory -- directory of the benchmark, it is kept afterwards (default: new temporary directory)
+    """
+
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='wikipeople-benchmark-')
+    os.makedirs(directory, exist_ok=True)
+    runDirectory = tempfile.mkdtemp(prefix='run-', dir=directory)
+    os.makedirs(f'{runDirectory}/scripts/create')
+    workingDirectory = os.getcwd()
+
+    server = startServer(peoplePerYear=peoplePerYear, imagesPerPerson=imagesPerPerson, latency=latency,
+                         errorRate=errorRate, seed=0)
+    client.setUrlOverrides(getUrlOverrides(server.url))
+    try:
+        os.chdir(f'{runDirectory}/scripts/create')
+        config()
+        runId = instrumentation.startRun('benchmark')
+        scheduler.runYears('benchmark', downloadYear, range(fromYear, toYear), processes, initializer=config)
+
+        summary = {
+            'directory': runDirectory,
+            'years': [fromYear, toYear],
+            'processes': processes,
+            'server': server.config | {'requests': server.counts},
+            'stages': getThroughput(readData(instrumentation.getReportLocation()))
+        }
+        saveData(summary, f'{STATS_DIRECTORY}/benchmark-{runId}.json')
+    finally:
+        client.setUrlOverrides(None)
+        server.shutdown()
+        os.chdir(workingDirectory)
+
+    printThroughput(summary['stages'])
+
+    return summary
+
+
+def getThroughput(report):
+    """This method sums the measurements of every stage over all the years in the report and computes
+       its throughput in people, images, requests and downloaded bytes per second of wall time.
+
+        Keyword arguments:
+        report -- report of the run created by instrumentation.runStage
+    """
+
+    stages = {}
+    for measurement in report.values():
+        stage = stages.setdefault(measurement['stage'], {'wallTime': 0.0, 'cpuTime': 0.0, 'people': 0,
+                                                         'images': 0, 'requests': 0, 'errors': 0, 'bytes': 0})
+        stage['wallTime'] += measurement['wallTime']
+        stage['cpuTime'] += measurement['cpuTime']
+        # Records going out are counted, so the stages downloading people (e.g., getSparqlData) are measured too
+        records = measurement['recordsOut'] or measurement['recordsIn'] or {}
+        stage['people'] += records.get('people', 0)
+        stage['images'] += records.get('images', 0)
+        for key in ['requests', 'errors', 'bytes']:
+            stage[key] += measurement['requests'][key]
+
+    for stage in stages.values():
+        wallTime = max(stage['wallTime'], 1e-9)
+        for key in ['people', 'images', 'requests', 'bytes']:
+            stage[f'{key}PerSecond'] = stage[key] / wallTime
+
+    return stages
+
+
+def printThroughput(stages):
+    """This method prints the throughput of the stages as a table.
+
+        Keyword arguments:
+        stages -- throughput of the stages returned by getThroughput
+    """
+
+    print(f'{"stage":<40}{"wall [s]":>10}{"people/s":>12}{"images/s":>12}{"requests/s":>12}{"MB/s":>10}')
+    for name, stage in stages.items():
+        print(f'{name:<40}{stage["wallTime"]:>10.2f}{stage["peoplePerSecond"]:>12.1f}'
+              f'{stage["imagesPerSecond"]:>12.1f}{stage["requestsPerSecond"]:>12.1f}'
+              f'{stage["bytesPerSecond"] / 1024 / 1024:>10.2f}')
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -1,19 +1,25 @@
+import copy
 import os
+import tempfile
 import time
 from collections import Counter
+from datetime import datetime, timezone
 
 import schedule
 
+from create import client
 from create.ageFinder import addAgeToImages
 from create.corrector import removeBrokenImages
 from create.merger import mergeListOfValues, mergeDatasets
 from create.utils import readData, saveData, countProperty
-from create.transformer import removeBrokenData, processSparqlData, simplifySparqlData
 from create.dataCollectionSetup import config
 from create.sorter import orderData, changeOrderOfProperties
 from create.labeler import labelTags
-from create.downloader import getRawSparqlData, getThumbnails, getMetadataAndLinks, getPictures
-from constants import START_YEAR, END_YEAR, YEAR_STEP, DATA_DIRECTORY, STATS_DIRECTORY
+from create.downloader import getSparqlData, getThumbnails, getMetadataAndLinks, getPictures, getChangedPeople, \
+    getSparqlDataForPeople
+from eval.fakeWikimedia import startServer, getUrlOverrides
+from constants import START_YEAR, END_YEAR, YEAR_STEP, DATA_DIRECTORY, STATS_DIRECTORY, YEAR_OFFSET, STORAGE_FORMAT, \
+    STORAGE_COMPRESSION, SPARQL_URL, MWAPI_URL
 
 
 def fullDataDownload(results, resultsAllFalse):
@@ -48,6 +54,8 @@ def fullDataDownload(results, resultsAllFalse):
     }
 
     config()
+    # Changes made during the download are downloaded again by the next incremental download
+    startTime = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
     totalProperties = {}
     totalPropertiesAllFalse = {}
     for year in range(START_YEAR, END_YEAR, YEAR_STEP):
@@ -56,10 +64,7 @@ def fullDataDownload(results, resultsAllFalse):
             foundData = readData(f'{DATA_DIRECTORY}/{year}.json')
         else:
             foundData = {}
-        data = getRawSparqlData(year, year + YEAR_STEP)
-        data = removeBrokenData(data)
-        data = simplifySparqlData(data)
-        data = processSparqlData(data)
+        data = getSparqlData(year, year + YEAR_STEP)
         data = mergeListOfValues(data)
 
         data = labelTags(data)
@@ -69,11 +74,167 @@ def fullDataDownload(results, resultsAllFalse):
         data = changeOrderOfProperties(data)
         data = mergeDatasets([foundData, data])
         data = mergeListOfValues(data)
-        saveData(data, f'{DATA_DIRECTORY}/{year}.json')
+        saveData(data, f'{DATA_DIRECTORY}/{year}.json', format=STORAGE_FORMAT, compression=STORAGE_COMPRESSION)
         totalProperties = Counter(totalProperties) + Counter(countProperty(data, propertiesToCount))
         totalPropertiesAllFalse = Counter(totalPropertiesAllFalse) + Counter(
             countProperty(data, propertiesToCountAllFalse))
 
+    saveData({'dateModified': startTime}, f'{DATA_DIRECTORY}/highWaterMark.json')
+    results.append(totalProperties)
+    resultsAllFalse.append(totalPropertiesAllFalse)
+    saveData(results, f'{STATS_DIRECTORY}/results.json')
+    saveData(resultsAllFalse, f'{STATS_DIRECTORY}/resultsAllFalse.json')
+
+
+def incrementalDataDownload(results, resultsAllFalse, sparqlUrl=None, apiUrl=None):
+    """This method downloads only people modified since the last download and merges them into the year
+       files they belong to. The time of the last modification (schema:dateModified) downloaded so far
+       is stored in highWaterMark.json in DATA_DIRECTORY, the full download is run when it does not exist.
+       Only the CPU part.
+
+       Keyword arguments:
+        results -- list of counted properties of all the downloads
+        resultsAllFalse -- list of counted properties of all the downloads, lists are counted as one value
+        sparqlUrl -- URL of the SPARQL endpoint, e.g., a local stand-in endpoint (default defined in constants module)
+        apiUrl -- URL of the Mediawiki API, e.g., a local stand-in endpoint (default defined in constants module)
+    """
+
+    if not os.path.isfile(f'{DATA_DIRECTORY}/highWaterMark.json'):
+        fullDataDownload(results, resultsAllFalse)
+        return
+
+    config()
+    highWaterMark = readData(f'{DATA_DIRECTORY}/highWaterMark.json')['dateModified']
+    changedPeople = getChangedPeople(highWaterMark, url=sparqlUrl)
+    print(f'Found {len(changedPeople)} people modified since {highWaterMark}!')
+    data = getSparqlDataForPeople(list(changedPeople), url=sparqlUrl)
+
+    data = labelTags(data, url=sparqlUrl)
+    data = getThumbnails(data, url=apiUrl)
+
+    for year, yearData in splitByYear(data).items():
+        print(f'Merging year: {year}!')
+        # Birth dates are merged only after the split, the same as in the year by year download
+        yearData = mergeListOfValues(yearData)
+        yearData = orderData(yearData)
+        yearData = changeOrderOfProperties(yearData)
+        if os.path.isfile(f'{DATA_DIRECTORY}/{year}.json'):
+            foundData = readData(f'{DATA_DIRECTORY}/{year}.json')
+        else:
+            foundData = {}
+        yearData = mergeDatasets([foundData, yearData])
+        yearData = mergeListOfValues(yearData)
+        saveData(yearData, f'{DATA_DIRECTORY}/{year}.json', format=STORAGE_FORMAT, compression=STORAGE_COMPRESSION)
+
+    # The mark is moved only after all the changes are saved, so a failed download is repeated
+    if changedPeople:
+        saveData({'dateModified': max(changedPeople.values())}, f'{DATA_DIRECTORY}/highWaterMark.json')
+    countAllData(results, resultsAllFalse)
+
+
+def splitByYear(data):
+    """This method splits people into datasets by the year of their birth. People with birth dates in more
+       years are put into all of them with only the birth dates of the year, the same way as they are
+       downloaded by getSparqlData, which queries birth dates of one year at once.
+
+       Keyword arguments:
+        data -- processed data from sparql endpoint, birth dates are not merged by mergeListOfValues yet
+    """
+
+    years = {}
+    for wikidataID, person in data.items():
+        birthDates = person['birthDate'] if isinstance(person['birthDate'], list) else [person['birthDate']]
+        for year in sorted({int(birthDate[:YEAR_OFFSET]) for birthDate in birthDates}):
+            # Only years, which would be downloaded by fullDataDownload are kept
+            if year not in range(START_YEAR, END_YEAR, YEAR_STEP):
+                continue
+            yearBirthDates = [birthDate for birthDate in birthDates if int(birthDate[:YEAR_OFFSET]) == year]
+            # Every year gets its own copy, they are merged and saved independently
+            yearPerson = copy.deepcopy(person)
+            yearPerson['birthDate'] = yearBirthDates[0] if len(yearBirthDates) == 1 else yearBirthDates
+            years.setdefault(year, {})[wikidataID] = yearPerson
+
+    return years
+
+
+def checkIncrementalDownload(peoplePerYear=20, directory=None):
+    """This method checks the incremental download against the local fake Wikimedia services (see fakeWikimedia
+       module). The full download is run in two directories, then the changed people are changed
+       by the next revision of the fake data and the full download is run again in the first directory
+       and the incremental download in the second one. Year files of both directories have to be the same.
+       The incremental download gets only the URLs of the fake services, no URL overrides, so every request,
+       which would not be sent to the passed URLs, fails. Years with different files are printed and returned.
+
+       Keyword arguments:
+        peoplePerYear -- number of people born in every year (default: 20)
+        directory -- directory of the check, it is kept afterwards (default: new temporary directory)
+    """
+
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='wikipeople-incremental-')
+    workingDirectory = os.getcwd()
+    server = startServer(peoplePerYear=peoplePerYear, latency={'sparql': 0, 'api': 0, 'images': 0}, seed=0)
+    overrides = getUrlOverrides(server.url)
+    try:
+        client.setUrlOverrides(overrides)
+        for name in ['full', 'incremental']:
+            os.makedirs(f'{directory}/{name}/scripts/create', exist_ok=True)
+            os.chdir(f'{directory}/{name}/scripts/create')
+            fullDataDownload([], [])
+
+        server.config['revision'] += 1
+        os.chdir(f'{directory}/full/scripts/create')
+        fullDataDownload([], [])
+        client.setUrlOverrides(None)
+        os.chdir(f'{directory}/incremental/scripts/create')
+        incrementalDataDownload([], [], sparqlUrl=overrides[SPARQL_URL], apiUrl=overrides[MWAPI_URL])
+
+        differentYears = []
+        for year in range(START_YEAR, END_YEAR, YEAR_STEP):
+            fullData = readData(f'{directory}/full/scripts/create/{DATA_DIRECTORY}/{year}.json')
+            if readData(f'{DATA_DIRECTORY}/{year}.json') != fullData:
+                differentYears.append(year)
+    finally:
+        client.setUrlOverrides(None)
+        server.shutdown()
+        os.chdir(workingDirectory)
+
+    print(f'Fake services served {server.counts} requests, {len(differentYears)} years differ from '
+          f'the full download: {differentYears}')
+    return differentYears
+
+
+def countAllData(results, resultsAllFalse):
+    """This method counts properties in all the year files and saves the counts to STATS_DIRECTORY,
+       see fullDataDownload.
+
+       Keyword arguments:
+        results -- list of counted properties of all the downloads
+        resultsAllFalse -- list of counted properties of all the downloads, lists are counted as one value
+    """
+
+    propertiesToCount = {
+        'name': False,
+        'description': False,
+        'gender': True,
+        'birthDate': False,
+        'deathDate': False,
+        'nationality': True,
+        'occupation': True,
+        'images': True,
+        'wikipediaTitle': False
+    }
+    propertiesToCountAllFalse = {property: False for property in propertiesToCount}
+
+    totalProperties = {}
+    totalPropertiesAllFalse = {}
+    for year in range(START_YEAR, END_YEAR, YEAR_STEP):
+        if os.path.isfile(f'{DATA_DIRECTORY}/{year}.json'):
+            data = readData(f'{DATA_DIRECTORY}/{year}.json')
+            totalProperties = Counter(totalProperties) + Counter(countProperty(data, propertiesToCount))
+            totalPropertiesAllFalse = Counter(totalPropertiesAllFalse) + Counter(
+                countProperty(data, propertiesToCountAllFalse))
+
     results.append(totalProperties)
     resultsAllFalse.append(totalPropertiesAllFalse)
     saveData(results, f'{STATS_DIRECTORY}/results.json')
@@ -138,7 +299,7 @@ if __name__ == '__main__':
     ]
     # fullDataDownload(results, resultsAllFalse)
 
-    schedule.every().day.at("01:00").do(fullDataDownload, results, resultsAllFalse)
+    schedule.every().day.at("01:00").do(incrementalDataDownload, results, resultsAllFalse)
 
     while True:
         schedule.run_pending()
@@ -0,0 +1,734 @@
+# Module name: FakeWikimedia
+# Purpose: This module contains a local stand-in for the Wikimedia services used by the data collection.
+#          It serves synthetic responses of the SPARQL endpoint (people, changed people and labels),
+#          of the Mediawiki API (login, userinfo, pageprops, pageimages and imageinfo with extmetadata) and PNG images
+#          of upload.wikimedia.org, with configurable latency and error injection. The data are generated
+#          deterministically from the birth year, so the same people are returned to every query. Some people
+#          have a second birth date (only the year) in the next year, as many people in Wikidata do.
+#          Requests are redirected to the server by client.setUrlOverrides, see getUrlOverrides.
+#          The same people can be written into a synthetic Wikidata JSON dump for dumpReader, see writeDump
+#          and checkDumpReader.
+
+import bz2
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import secrets
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import zlib
+
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from create import client
+from create.downloader import getSparqlData
+from create.dumpReader import DECOMPRESSORS, readDump, getDumpData
+from constants import SPARQL_URL, MWAPI_URL, WIKIMEDIA_COMMONS_API_URL, SPARQL_VALUES_SEPARATOR, \
+    SPARQL_IMAGE_SEPARATOR, START_YEAR, END_YEAR
+
+UPLOAD_URL = 'https://upload.wikimedia.org'
+DATE_TIME_TYPE = '<http://www.w3.org/2001/XMLSchema#dateTime>'
+GENDERS = ['Q6581097', 'Q6581072']
+NATIONALITIES = ['Q30', 'Q145', 'Q142', 'Q183', 'Q213']
+OCCUPATIONS = ['Q82955', 'Q33999', 'Q36180', 'Q901', 'Q937857', 'Q1028181']
+DEFAULT_LATENCY = {'sparql': 0.5, 'api': 0.1, 'images': 0.05}
+
+
+def startServer(port=0, peoplePerYear=1000, imagesPerPerson=1, imageWidth=640, imageHeight=800, latency=None,
+                errorRate=0.0, seed=None, botPassword=None):
+    """This method starts the fake server in a daemon thread and returns it. URL of the server
+       is in its url attribute and the number of served requests by route in its counts attribute.
+       Revision of the data is in config['revision'] of the server, every tenth person (the changed people)
+       has a different description in every revision, so changes can be simulated by increasing it.
+
+        Keyword arguments:
+        port -- port of the server, 0 for any free port (default: 0)
+        peoplePerYear -- number of people born in every year (default: 1000)
+        imagesPerPerson -- number of images of every person (default: 1)
+        imageWidth -- width of the original images in pixels (default: 640)
+        imageHeight -- height of the original images in pixels (default: 800)
+        latency -- dictionary with mean latency in seconds of routes sparql, api and images,
+                   latencies are exponentially distributed (default defined in DEFAULT_LATENCY)
+        errorRate -- probability of 503 response for every request (default: 0.0)
+        seed -- seed of the random generator of latencies and errors (default: None)
+        botPassword -- tuple of the user name and password of a bot, which can log in to the API and has
+                       apihighlimits right, None disables the login (default: None)
+    """
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeWikimediaHandler)
+    server.daemon_threads = True
+    server.config = {
+        'peoplePerYear': peoplePerYear,
+        'imagesPerPerson': imagesPerPerson,
+        'imageWidth': imageWidth,
+        'imageHeight': imageHeight,
+        'latency': DEFAULT_LATENCY | (latency or {}),
+        'errorRate': errorRate,
+        'revision': 0,
+        'botPassword': botPassword
+    }
+    server.random = random.Random(seed)
+    server.counts = {}
+    # Login tokens and logged in users by session cookie
+    server.tokens = {}
+    server.users = {}
+    server.lock = threading.Lock()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def getUrlOverrides(serverUrl):
+    """This method returns replacements of the URLs of Wikimedia services by the fake server,
+       which are passed to client.setUrlOverrides.
+
+        Keyword arguments:
+        serverUrl -- URL of the fake server
+    """
+
+    return {
+        SPARQL_URL: f'{serverUrl}/sparql',
+        MWAPI_URL: f'{serverUrl}/w/api.php',
+        WIKIMEDIA_COMMONS_API_URL: f'{serverUrl}/w/api.php',
+        UPLOAD_URL: f'{serverUrl}/upload'
+    }
+
+
+class FakeWikimediaHandler(BaseHTTPRequestHandler):
+    """Handler of the requests to the fake server, the configuration is read from the server."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_request(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = parse_qs(urlparse(self.path).query)
+        params.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+        self.handle_request(params)
+
+    def handle_request(self, params):
+        params = {key: values[-1] for key, values in params.items()}
+        path = urlparse(self.path).path
+        if path == '/sparql':
+            route = 'sparql'
+        elif path.startswith('/upload/'):
+            route = 'images'
+        else:
+            route = 'api'
+        server = self.server
+        with server.lock:
+            server.counts[route] = server.counts.get(route, 0) + 1
+            latency = server.random.expovariate(1 / server.config['latency'][route]) \
+                if server.config['latency'][route] > 0 else 0
+            failed = server.random.random() < server.config['errorRate']
+        time.sleep(latency)
+
+        if failed:
+            with server.lock:
+                server.counts['errors'] = server.counts.get('errors', 0) + 1
+            self.send_body(503, b'Service Unavailable', 'text/plain')
+        elif route == 'sparql':
+            self.send_body(200, *getSparqlResponse(params.get('query', ''), server.config))
+        elif route == 'images':
+            content = getImageResponse(path, server.config)
+            if content is None:
+                self.send_body(404, b'Not Found', 'text/plain')
+            else:
+                self.send_body(200, content, 'image/png')
+        elif path == '/w/api.php' and (params.get('action') == 'login' or params.get('meta') == 'tokens'):
+            self.send_login(params)
+        elif path == '/w/api.php':
+            user = server.users.get(self.get_session())
+            self.send_body(200, json.dumps(getApiResponse(params, server.config, user)).encode('utf-8'),
+                           'application/json')
+        else:
+            self.send_body(404, b'Not Found', 'text/plain')
+
+    def send_login(self, params):
+        # Login token is bound to the session, see https://www.mediawiki.org/wiki/API:Login
+        server = self.server
+        session = self.get_session() or secrets.token_hex(16)
+        with server.lock:
+            if params.get('meta') == 'tokens':
+                server.tokens[session] = secrets.token_hex(16) + '+\\'
+                response = {'batchcomplete': True, 'query': {'tokens': {'logintoken': server.tokens[session]}}}
+            elif params.get('lgtoken') != server.tokens.get(session):
+                response = {'login': {'result': 'Failed', 'reason': 'Unable to continue login. Your session most '
+                                                                    'likely timed out.'}}
+            elif server.config['botPassword'] is None or \
+                    (params.get('lgname'), params.get('lgpassword')) != tuple(server.config['botPassword']):
+                response = {'login': {'result': 'Failed', 'reason': 'Incorrect username or password entered.'}}
+            else:
+                server.users[session] = params['lgname'].split('@')[0]
+                response = {'login': {'result': 'Success', 'lguserid': 1, 'lgusername': server.users[session]}}
+        self.send_body(200, json.dumps(response).encode('utf-8'), 'application/json', session)
+
+    def get_session(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        return cookie['session'].value if 'session' in cookie else None
+
+    def send_body(self, status, content, contentType, session=None):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        if session is not None:
+            self.send_header('Set-Cookie', f'session={session}; path=/; HttpOnly')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Every request would be printed otherwise
+        pass
+
+
+def getPerson(wikidataID, config):
+    """This method returns the synthetic person with the wikidataID, None is returned for wikidataIDs,
+       which do not belong to any person. WikidataID is Q{year}{index} with the index in 6 digits.
+       Every seventh person has a second birth date, the first day of the next year.
+
+        Keyword arguments:
+        wikidataID -- wikidataID of the person
+        config -- configuration of the server
+    """
+
+    match = re.fullmatch(r'Q(\d+)(\d{6})', wikidataID)
+    if match is None or int(match.group(2)) >= config['peoplePerYear']:
+        return None
+
+    year, index = int(match.group(1)), int(match.group(2))
+    birthDate = date(year, 1, 1) + timedelta(days=index % 365)
+    person = {
+        'wikidataID': wikidataID,
+        'name': f'Person {wikidataID}',
+        'description': f'synthetic person born in {year}',
+        'birthDates': [birthDate.isoformat()],
+        'gender': GENDERS[index % len(GENDERS)],
+        'nationality': NATIONALITIES[index % len(NATIONALITIES)],
+        'occupation': OCCUPATIONS[index % len(OCCUPATIONS)],
+        'wikipediaTitle': f'Person_{wikidataID}',
+        'images': [f'{wikidataID}_{image}.png' for image in range(config['imagesPerPerson'])]
+    }
+    if index % 10 == 0 and config['revision']:
+        person['description'] += f' (revision {config["revision"]})'
+    if index % 7 == 3:
+        person['birthDates'].append(date(year + 1, 1, 1).isoformat())
+    if index % 3:
+        person['deathDate'] = date(year + 40 + index % 50, 1, 1).isoformat()
+
+    return person
+
+
+def getPersonBetween(person, fromDate, toDate):
+    """This method returns the person with only the birth dates between two dates, the same as the SPARQL
+       endpoint returns only the birth dates matching the filter of the query. None is returned,
+       when no birth date of the person is between the dates.
+
+        Keyword arguments:
+        person -- synthetic person
+        fromDate -- first birth date in the range
+        toDate -- first birth date after the range
+    """
+
+    birthDates = [birthDate for birthDate in person['birthDates'] if fromDate <= date.fromisoformat(birthDate) < toDate]
+    if not birthDates:
+        return None
+
+    return person | {'birthDates': birthDates}
+
+
+def getPeople(fromDate, toDate, config):
+    """This method returns all the synthetic people born between two dates.
+
+        Keyword arguments:
+        fromDate -- first birth date in the range
+        toDate -- first birth date after the range
+        config -- configuration of the server
+    """
+
+    people = []
+    # People born in the previous year can have the second birth date in the range
+    for year in range(fromDate.year - 1, toDate.year + 1):
+        for index in range(config['peoplePerYear']):
+            person = getPersonBetween(getPerson(f'Q{year}{index:06d}', config), fromDate, toDate)
+            if person is not None:
+                people.append(person)
+
+    return people
+
+
+def parseDate(dateString):
+    """This method parses date of the SPARQL query, zero month and day are the first ones.
+
+        Keyword arguments:
+        dateString -- date in format YEAR-MONTH-DAY
+    """
+
+    year, month, day = [int(part) for part in dateString.split('-')]
+    return date(year, max(month, 1), max(day, 1))
+
+
+def getSparqlResponse(query, config):
+    """This method returns the content and the content type of the response to the SPARQL query. Queries
+       of labels are answered in JSON, queries of people and changed people in TSV.
+
+        Keyword arguments:
+        query -- SPARQL query
+        config -- configuration of the server
+    """
+
+    values = re.search(r'VALUES \?(?:wikidataID|item) \{([^}]*)}', query)
+    wikidataIDs = [value[len('wd:'):] for value in values.group(1).split()] if values else None
+
+    if 'wikibase:label' in query:
+        bindings = [{'item': {'type': 'uri', 'value': f'http://www.wikidata.org/entity/{wikidataID}'},
+                     'itemLabel': {'type': 'literal', 'value': f'Label {wikidataID}'}}
+                    for wikidataID in wikidataIDs or []]
+        content = {'head': {'vars': ['item', 'itemLabel']}, 'results': {'bindings': bindings}}
+        return json.dumps(content).encode('utf-8'), 'application/sparql-results+json'
+
+    if 'schema:dateModified' in query:
+        # Every tenth person is changed, people born in the year before START_YEAR can have the second birth
+        # date in it
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        lines = ['?wikidataID\t?dateModified']
+        lines += [f'<http://www.wikidata.org/entity/Q{year}{index:06d}>\t"{now}"^^{DATE_TIME_TYPE}'
+                  for year in range(START_YEAR - 1, END_YEAR)
+                  for index in range(0, config['peoplePerYear'], 10)]
+        return ('\n'.join(lines) + '\n').encode('utf-8'), 'text/tab-separated-values'
+
+    dates = re.search(r'"([-\d]+)"\^\^xsd:dateTime <= \?birthDate\) && \(\?birthDate < "([-\d]+)"', query)
+    fromDate, toDate = parseDate(dates.group(1)), parseDate(dates.group(2))
+    if wikidataIDs is None:
+        people = getPeople(fromDate, toDate, config)
+    else:
+        people = [getPersonBetween(person, fromDate, toDate) for person in
+                  (getPerson(wikidataID, config) for wikidataID in wikidataIDs) if person is not None]
+        people = [person for person in people if person is not None]
+
+    if 'GROUP_CONCAT' in query:
+        lines = ['\t'.join(['?wikidataID', '?names', '?descriptions', '?birthDates', '?deathDates', '?genders',
+                            '?nationalities', '?occupations', '?wikipediaTitles', '?images'])]
+        lines += [getGroupedSparqlLine(person) for person in people]
+    else:
+        lines = ['\t'.join(['?wikidataID', '?name', '?description', '?imageUrl', '?caption', '?imageDate',
+                            '?birthDate', '?deathDate', '?gender', '?nationality', '?occupation',
+                            '?wikipediaTitle'])]
+        for person in people:
+            lines += getSparqlLines(person)
+
+    return ('\n'.join(lines) + '\n').encode('utf-8'), 'text/tab-separated-values'
+
+
+def getSparqlLines(person):
+    """This method returns lines of the TSV response of the flat SPARQL query for the person,
+       one line for every image and birth date.
+
+        Keyword arguments:
+        person -- synthetic person
+    """
+
+    lines = []
+    for fileName, birthDate in [(fileName, birthDate) for fileName in person['images'] or [None]
+                                for birthDate in person['birthDates']]:
+        cells = [
+            f'<http://www.wikidata.org/entity/{person["wikidataID"]}>',
+            f'"{person["name"]}"@en',
+            f'"{person["description"]}"@en',
+            f'<http://commons.wikimedia.org/wiki/Special:FilePath/{quote(fileName)}>' if fileName else '',
+            f'"Portrait of {person["name"]}"@en' if fileName else '',
+            '',
+            f'"{birthDate}T00:00:00Z"^^{DATE_TIME_TYPE}',
+            f'"{person["deathDate"]}T00:00:00Z"^^{DATE_TIME_TYPE}' if 'deathDate' in person else '',
+            f'<http://www.wikidata.org/entity/{person["gender"]}>',
+            f'<http://www.wikidata.org/entity/{person["nationality"]}>',
+            f'<http://www.wikidata.org/entity/{person["occupation"]}>',
+            f'<https://en.wikipedia.org/wiki/{person["wikipediaTitle"]}>'
+        ]
+        lines.append('\t'.join(cells))
+
+    return lines
+
+
+def getGroupedSparqlLine(person):
+    """This method returns the line of the TSV response of the grouped SPARQL query for the person.
+
+        Keyword arguments:
+        person -- synthetic person
+    """
+
+    images = [SPARQL_IMAGE_SEPARATOR.join([f'http://commons.wikimedia.org/wiki/Special:FilePath/{quote(fileName)}',
+                                           f'Portrait of {person["name"]}', ''])
+              for fileName in person['images']]
+    cells = [
+        f'<http://www.wikidata.org/entity/{person["wikidataID"]}>',
+        f'"{person["name"]}"',
+        f'"{person["description"]}"',
+        f'"{SPARQL_VALUES_SEPARATOR.join(f"{birthDate}T00:00:00Z" for birthDate in person["birthDates"])}"',
+        f'"{person["deathDate"]}T00:00:00Z"' if 'deathDate' in person else '""',
+        f'"http://www.wikidata.org/entity/{person["gender"]}"',
+        f'"http://www.wikidata.org/entity/{person["nationality"]}"',
+        f'"http://www.wikidata.org/entity/{person["occupation"]}"',
+        f'"https://en.wikipedia.org/wiki/{person["wikipediaTitle"]}"',
+        f'"{SPARQL_VALUES_SEPARATOR.join(images)}"'
+    ]
+
+    return '\t'.join(cells)
+
+
+def writeDump(location, fromYear, toYear, config):
+    """This method writes the synthetic people born between two years into a Wikidata JSON dump
+       (one entity per line in a JSON array), which is compressed by bzip2 or gzip depending on the extension
+       of the location. Every fifth person has a deprecated occupation and every fourth person is followed
+       by an entity, which is not a human, so the dump has to be filtered the same way as the SPARQL query.
+
+        Keyword arguments:
+        location -- location of the dump (e.g., latest-all.json.bz2)
+        fromYear -- first birth year
+        toYear -- first birth year after the range
+        config -- configuration of the server, the people are the same as the people served by it
+    """
+
+    openFile = {'.bz2': bz2.open, '.gz': gzip.open}.get(location[location.rfind('.'):], open)
+    with openFile(location, 'wt', encoding='UTF-8') as f:
+        f.write('[\n')
+        for year in range(fromYear, toYear):
+            for index in range(config['peoplePerYear']):
+                person = getPerson(f'Q{year}{index:06d}', config)
+                f.write(json.dumps(getDumpEntity(person, index)) + ',\n')
+                if index % 4 == 0:
+                    city = {'type': 'item', 'id': f'Q9{year}{index:06d}', 'labels': getTexts(f'City {year}'),
+                            'claims': {'P31': [getStatement('P31', getItem('Q515'))]}}
+                    f.write(json.dumps(city) + ',\n')
+        # The last entity is not followed by a comma
+        f.write(json.dumps({'type': 'property', 'id': 'P18', 'labels': getTexts('image')}) + '\n]\n')
+
+
+def checkDumpReader(peoplePerYear=20, fromYear=1900, toYear=1905, directory=None):
+    """This method checks dumpReader against the fake services. Synthetic dump of the people served
+       by the fake services is written compressed by bzip2 and by gzip and read by readDump, every year of getDumpData has to be the same as getSparqlData
+       from the fake SPARQL endpoint. Then the dump is truncated and readDump has to fail.
+       Failed checks are printed and returned as tuples of the extension and the year (or 'truncated').
+
+       Keyword arguments:
+        peoplePerYear -- number of people born in every year (default: 20)
+        fromYear -- first birth year (default: 1900)
+        toYear -- first birth year after the range (default: 1905)
+        directory -- directory of the check, it is kept afterwards (default: new temporary directory)
+    """
+
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='wikipeople-dump-')
+    workingDirectory = os.getcwd()
+    server = startServer(peoplePerYear=peoplePerYear, latency={'sparql': 0, 'api': 0, 'images': 0}, seed=0)
+    failedChecks = []
+    try:
+        client.setUrlOverrides(getUrlOverrides(server.url))
+        os.makedirs(f'{directory}/scripts/create', exist_ok=True)
+        os.chdir(f'{directory}/scripts/create')
+        sparqlData = {year: getSparqlData(year, year + 1) for year in range(fromYear, toYear)}
+        for extension in DECOMPRESSORS:
+            # People born in the year before can have the second birth date in the range
+            location = f'{directory}/dump.json{extension}'
+            writeDump(location, fromYear - 1, toYear, server.config)
+            readDump(location, fromYear, toYear)
+            failedChecks += [(extension, year) for year in range(fromYear, toYear)
+                             if getDumpData(year, year + 1) != sparqlData[year]]
+
+            with open(location, 'rb') as f:
+                content = f.read()
+            with open(f'{directory}/truncated.json{extension}', 'wb') as f:
+                f.write(content[:len(content) // 2])
+            try:
+                readDump(f'{directory}/truncated.json{extension}', fromYear, toYear)
+                failedChecks.append((extension, 'truncated'))
+            except (subprocess.CalledProcessError, EOFError, OSError):
+                pass
+    finally:
+        client.setUrlOverrides(None)
+        server.shutdown()
+        os.chdir(workingDirectory)
+
+    print(f'Dump reader failed {len(failedChecks)} checks: {failedChecks}')
+    return failedChecks
+
+
+def getDumpEntity(person, index):
+    """This method returns the synthetic person as an entity of the Wikidata JSON dump.
+
+        Keyword arguments:
+        person -- synthetic person
+        index -- index of the person in its birth year
+    """
+
+    claims = {
+        'P31': [getStatement('P31', getItem('Q5'))],
+        'P569': [getStatement('P569', getTime(birthDate)) for birthDate in person['birthDates']],
+        'P21': [getStatement('P21', getItem(person['gender']))],
+        'P27': [getStatement('P27', getItem(person['nationality']))],
+        'P106': [getStatement('P106', getItem(person['occupation']))],
+        'P18': [getStatement('P18', {'type': 'string', 'value': fileName},
+                             {'P2096': [{'snaktype': 'value', 'property': 'P2096',
+                                         'datavalue': {'type': 'monolingualtext',
+                                                       'value': {'text': f'Portrait of {person["name"]}',
+                                                                 'language': 'en'}}}]})
+                for fileName in person['images']]
+    }
+    if 'deathDate' in person:
+        claims['P570'] = [getStatement('P570', getTime(person['deathDate']))]
+    if index % 5 == 1:
+        claims['P106'].append(getStatement('P106', getItem(OCCUPATIONS[0]), rank='deprecated'))
+
+    return {
+        'type': 'item',
+        'id': person['wikidataID'],
+        'labels': getTexts(person['name']),
+        'descriptions': getTexts(person['description']),
+        'claims': claims,
+        'sitelinks': {'enwiki': {'site': 'enwiki', 'title': person['wikipediaTitle'].replace('_', ' ')}}
+    }
+
+
+def getStatement(property, datavalue, qualifiers=None, rank='normal'):
+    """This method returns a statement of the Wikidata JSON dump with the value.
+
+        Keyword arguments:
+        property -- Wikidata property (e.g., P31)
+        datavalue -- data value of the main snak
+        qualifiers -- qualifiers of the statement by property (default: None)
+        rank -- rank of the statement (default: 'normal')
+    """
+
+    statement = {'mainsnak': {'snaktype': 'value', 'property': property, 'datavalue': datavalue},
+                 'type': 'statement', 'rank': rank}
+    if qualifiers:
+        statement['qualifiers'] = qualifiers
+
+    return statement
+
+
+def getItem(wikidataID):
+    """This method returns a data value of the Wikidata JSON dump with the item.
+
+        Keyword arguments:
+        wikidataID -- wikidata ID of the item
+    """
+
+    return {'type': 'wikibase-entityid', 'value': {'entity-type': 'item', 'id': wikidataID}}
+
+
+def getTime(isoDate):
+    """This method returns a data value of the Wikidata JSON dump with the date with day precision.
+
+        Keyword arguments:
+        isoDate -- date in format YEAR-MONTH-DAY
+    """
+
+    return {'type': 'time', 'value': {'time': f'+{isoDate}T00:00:00Z', 'timezone': 0, 'before': 0, 'after': 0,
+                                      'precision': 11, 'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}}
+
+
+def getTexts(text):
+    """This method returns english labels or descriptions of the Wikidata JSON dump with the text.
+
+        Keyword arguments:
+        text -- english text
+    """
+
+    return {'en': {'language': 'en', 'value': text}}
+
+
+def getApiResponse(params, config, user=None):
+    """This method returns the response of the Mediawiki API to the query with the parameters. Queries
+       of userinfo, pageprops and pageimages with imageinfo are supported, in the format version 2.
+
+        Keyword arguments:
+        params -- parameters of the query
+        config -- configuration of the server
+        user -- name of the logged in bot, None for anonymous requests (default: None)
+    """
+
+    if params.get('meta') == 'userinfo' and user is not None:
+        return {'batchcomplete': True, 'query': {'userinfo': {'id': 1, 'name': user,
+                                                              'rights': ['read', 'bot', 'apihighlimits']}}}
+    if params.get('meta') == 'userinfo':
+        return {'batchcomplete': True, 'query': {'userinfo': {'id': 0, 'name': '127.0.0.1', 'anon': True,
+                                                              'rights': ['read']}}}
+
+    pages = []
+    for title in params.get('titles', '').split('|'):
+        if params.get('prop') == 'pageprops':
+            pages.append(getPageProps(title, config))
+        elif 'imageinfo' in params.get('prop', ''):
+            pages.append(getImageInfo(title, params, config))
+
+    return {'batchcomplete': True, 'query': {'pages': pages}}
+
+
+def getPageProps(title, config):
+    """This method returns the page of the Wikipedia article with the title with its page properties.
+
+        Keyword arguments:
+        title -- title of the article
+        config -- configuration of the server
+    """
+
+    match = re.fullmatch(r'Person[_ ](Q\d+)', title)
+    person = getPerson(match.group(1), config) if match else None
+    if person is None:
+        return {'ns': 0, 'title': title, 'missing': True}
+
+    page = {'pageid': int(person['wikidataID'][1:]), 'ns': 0, 'title': title.replace('_', ' '),
+            'pageprops': {'wikibase_item': person['wikidataID']}}
+    if person['images']:
+        page['pageprops']['page_image_free'] = person['images'][0]
+
+    return page
+
+
+def getImageInfo(title, params, config):
+    """This method returns the page of the file with the title with its original and imageinfo. URL of the image
+       scaled to iiurlwidth is returned, when it is requested.
+
+        Keyword arguments:
+        title -- title of the file (e.g., File:Q1840000001_0.png)
+        params -- parameters of the query
+        config -- configuration of the server
+    """
+
+    fileName = title[len('File:'):].replace(' ', '_')
+    if getImageFile(fileName, config) is None:
+        return {'ns': 6, 'title': title.replace('_', ' '), 'missing': True, 'imagerepository': ''}
+
+    content = getOriginalImage(fileName, config['imageWidth'], config['imageHeight'])
+    digest = hashlib.md5(fileName.encode('utf-8')).hexdigest()
+    source = f'{UPLOAD_URL}/wikipedia/commons/{digest[0]}/{digest[:2]}/{quote(fileName)}'
+    imageinfo = {
+        'size': len(content),
+        'width': config['imageWidth'],
+        'height': config['imageHeight'],
+        'sha1': hashlib.sha1(content).hexdigest(),
+        'mime': 'image/png',
+        'extmetadata': {
+            'DateTime': {'value': '2020-01-01 00:00:00', 'source': 'mediawiki-metadata'},
+            'ImageDescription': {'value': f'<p>Portrait of {fileName}</p>', 'source': 'commons-desc-page'}
+        }
+    }
+    if 'url' in params.get('iiprop', '').split('|'):
+        imageinfo['url'] = source
+        if 'iiurlwidth' in params:
+            width = min(int(params['iiurlwidth']), config['imageWidth'])
+            imageinfo['thumburl'] = f'{UPLOAD_URL}/wikipedia/commons/thumb/{digest[0]}/{digest[:2]}/' \
+                                    f'{quote(fileName)}/{width}px-{quote(fileName)}'
+            imageinfo['thumbwidth'] = width
+            imageinfo['thumbheight'] = round(config['imageHeight'] * width / config['imageWidth'])
+
+    return {'ns': 6, 'title': title.replace('_', ' '), 'imagerepository': 'shared',
+            'original': {'source': source, 'width': config['imageWidth'], 'height': config['imageHeight']},
+            'imageinfo': [imageinfo]}
+
+
+def getImageFile(fileName, config):
+    """This method returns the person owning the image file, None is returned for unknown files.
+
+        Keyword arguments:
+        fileName -- name of the file (e.g., Q1840000001_0.png)
+        config -- configuration of the server
+    """
+
+    match = re.fullmatch(r'(Q\d+)_(\d+)\.png', fileName)
+    if match is None or int(match.group(2)) >= config['imagesPerPerson']:
+        return None
+
+    return getPerson(match.group(1), config)
+
+
+def getImageResponse(path, config):
+    """This method returns the content of the original or scaled image from the path of upload.wikimedia.org,
+       None is returned for unknown images.
+
+        Keyword arguments:
+        path -- path of the request
+        config -- configuration of the server
+    """
+
+    parts = [unquote(part) for part in path.split('/')]
+    thumb = re.fullmatch(r'(\d+)px-(.+)', parts[-1]) if 'thumb' in parts else None
+    fileName = thumb.group(2) if thumb else parts[-1]
+    if getImageFile(fileName, config) is None:
+        return None
+
+    if thumb is None:
+        return getOriginalImage(fileName, config['imageWidth'], config['imageHeight'])
+    width = min(int(thumb.group(1)), config['imageWidth'])
+
+    return createPng(width, round(config['imageHeight'] * width / config['imageWidth']), getColor(fileName))
+
+
+@lru_cache(maxsize=256)
+def getOriginalImage(fileName, width, height):
+    """This method returns the content of the original image, it is cached, as it is needed for every query
+       of its metadata (size and SHA-1) and for its download.
+
+        Keyword arguments:
+        fileName -- name of the file
+        width -- width of the image in pixels
+        height -- height of the image in pixels
+    """
+
+    return createPng(width, height, getColor(fileName))
+
+
+def getColor(fileName):
+    """This method returns the RGB color of the image, it is derived from its name, so every image
+       has a different content and hash.
+
+        Keyword arguments:
+        fileName -- name of the file
+    """
+
+    return tuple(hashlib.md5(fileName.encode('utf-8')).digest()[:3])
+
+
+def createPng(width, height, color):
+    """This method creates a PNG image of one color.
+
+        Keyword arguments:
+        width -- width of the image in pixels
+        height -- height of the image in pixels
+        color -- tuple of red, green and blue component
+    """
+
+    def chunk(chunkType, data):
+        return struct.pack('>I', len(data)) + chunkType + data + struct.pack('>I', zlib.crc32(chunkType + data))
+
+    # Every row starts with filter type 0 (None)
+    row = b'\x00' + bytes(color) * width
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(row * height)) + \
+        chunk(b'IEND', b'')
+
+
+if __name__ == '__main__':
+    server = startServer(port=8000)
+    print(f'Fake Wikimedia is running on {server.url}, URL overrides:')
+    print(json.dumps(getUrlOverrides(server.url), indent=2))
+    try:
+        while True:
+            time.sleep(60)
+            print(f'Served requests: {server.counts}')
+    except KeyboardInterrupt:
+        server.shutdown()
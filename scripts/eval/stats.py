@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 from tqdm import tqdm
 
 import constants
+from create import database
 from create.utils import readData, saveData, countProperty, addToDictionary
 from create.transformer import toTrainingPeople, toEvaluationSample
 
@@ -148,7 +149,10 @@ def getAllInfo(datasetOnly=False):
     totalPropertiesAllFalse = {}
     step = 1
     for year in tqdm(range(constants.START_YEAR, constants.END_YEAR, step), desc='getAllInfo'):
-        data = readData(f'{constants.DATA_DIRECTORY}/{year}.json')
+        if constants.DATA_STORE == 'sqlite':
+            data = database.queryPeople(fromYear=year, toYear=year + 1)
+        else:
+            data = readData(f'{constants.DATA_DIRECTORY}/{year}.json')
         if datasetOnly:
             data = toTrainingPeople(data)
         totalProperties = Counter(totalProperties) + Counter(countProperty(data, propertiesToCount))
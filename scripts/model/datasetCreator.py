@@ -7,7 +7,8 @@ from PIL import Image, ExifTags
 from tqdm import tqdm
 
 import constants
-from create.merger import mergeAllDataForTraining, mergeAllDataForTrainingAge, mergeAllDataForTrainingGender
+from create.merger import mergeAllDataForTraining
+from model.imageIndex import buildImageIndex, loadImageIndex, selectForAge, selectForGender, sample, toImages
 
 
 def toImagesAge(dir):
@@ -86,10 +87,11 @@ def createDirectoriesForAge():
 
     # my dataset part - used in:
     # - directory 1-n
-    data = mergeAllDataForTrainingAge()
-    amount = [1000, 10000, 100000, len(data)]
-    datasets = [random.sample(data, number) for number in amount[:-1]]
-    datasets.append(data)
+    index = loadImageIndex()
+    positions = selectForAge(index)
+    amount = [1000, 10000, 100000, len(positions)]
+    datasets = [toImages(index, sample(positions, number)) for number in amount[:-1]]
+    datasets.append(toImages(index, positions))
     for i, data in tqdm(enumerate(datasets), desc="create directories for age from my dataset"):
         srcDir = f"{constants.DATASET_DIRECTORY}/age/0"
         destDir = f"{constants.DATASET_DIRECTORY}/age/{i + 1}"
@@ -147,10 +149,11 @@ def createDirectoriesForGender():
     # my dataset part - used in:
     # - directory 1-n
 
-    data = mergeAllDataForTrainingGender()
-    amount = [1000, 10000, 100000, len(data)]
-    datasets = [random.sample(data, number) for number in amount[:-1]]
-    datasets.append(data)
+    index = loadImageIndex()
+    positions = selectForGender(index)
+    amount = [1000, 10000, 100000, len(positions)]
+    datasets = [toImages(index, sample(positions, number)) for number in amount[:-1]]
+    datasets.append(toImages(index, positions))
     for i, data in tqdm(enumerate(datasets), desc="create directories for age from my dataset"):
         srcDir = f"{constants.DATASET_DIRECTORY}/gender/0"
         destDir = f"{constants.DATASET_DIRECTORY}/gender/{i + 1}"
@@ -205,5 +208,6 @@ def transformImage(inLocation, outLocation, box, size):
 
 if __name__ == '__main__':
     transformAllPics()
+    buildImageIndex()
     createDirectoriesForAge()
     createDirectoriesForGender()
\ No newline at end of file
@@ -0,0 +1,200 @@
+# Module name: ImageIndex
+# Purpose: This module contains a memory-mapped NumPy index of the images usable for training. Every image is one
+#          record of a structured array with its age, gender, birth year, face box, score, extension and SHA-256
+#          hash of its local file, so selections, samples and splits are vectorised operations over the index.
+#          The index is loaded with mmap_mode, so its pages are shared by all the processes using it.
+
+import binascii
+import os
+
+import numpy as np
+
+import constants
+from create.merger import mergeAllDataForTraining
+
+GENDERS = ['', 'male', 'female']  # code 0 is used for people without exactly one of the genders
+EXTENSIONS = [''] + constants.ALLOWED_EXTENSIONS  # code 0 is used for other extensions
+IMAGE_INDEX_DTYPE = np.dtype([
+    ('age', 'i2'),
+    ('gender', 'i1'),
+    ('year', 'i2'),
+    ('box', 'i4', (4,)),
+    ('score', 'f4'),
+    ('extension', 'i1'),
+    # Raw bytes of the hash, fixed size byte strings would lose trailing zero bytes
+    ('hash', 'u1', (32,))
+])
+
+
+def buildImageIndex(location=None):
+    """This method builds the index of all the images usable for training (see merger.mergeAllDataForTraining)
+       and saves it atomically as .npy file.
+
+        Keyword arguments:
+        location -- location of the index (default defined in constants module)
+    """
+
+    if location is None:
+        location = constants.IMAGE_INDEX_LOCATION
+
+    data = mergeAllDataForTraining()
+    index = np.zeros(len(data), dtype=IMAGE_INDEX_DTYPE)
+    for i, image in enumerate(data):
+        fileName, extension = os.path.splitext(image['fileNameLocal'])
+        gender = image.get('gender', [])
+        index[i] = (
+            image['age'],
+            GENDERS.index(gender[0]) if len(gender) == 1 and gender[0] in GENDERS else 0,
+            int(image['birthDate'][:constants.YEAR_OFFSET]) if 'birthDate' in image else 0,
+            image['faces'][0]['box'],
+            image['faces'][0].get('score', 0),
+            EXTENSIONS.index(extension) if extension in EXTENSIONS else 0,
+            np.frombuffer(binascii.unhexlify(fileName), dtype='u1')
+        )
+
+    os.makedirs(os.path.dirname(location), exist_ok=True)
+    # np.save appends .npy to the names without it
+    temporaryLocation = f'{location}.{os.getpid()}.tmp.npy'
+    np.save(temporaryLocation, index)
+    os.replace(temporaryLocation, location)
+
+    return index
+
+
+def loadImageIndex(location=None):
+    """This method memory-maps the index read-only, it is built first if it does not exist.
+
+        Keyword arguments:
+        location -- location of the index (default defined in constants module)
+    """
+
+    if location is None:
+        location = constants.IMAGE_INDEX_LOCATION
+    if not os.path.isfile(location):
+        buildImageIndex(location)
+
+    return np.load(location, mmap_mode='r')
+
+
+def selectForAge(index, minAge=17, maxAge=80):
+    """This method returns positions of the images usable for age estimation training,
+       the same images as merger.mergeAllDataForTrainingAge.
+
+        Keyword arguments:
+        index -- image index
+        minAge -- minimal age (default: 17)
+        maxAge -- maximal age (default: 80)
+    """
+
+    return np.flatnonzero((index['age'] >= minAge) & (index['age'] <= maxAge))
+
+
+def selectForGender(index):
+    """This method returns positions of the images usable for gender estimation training,
+       the same images as merger.mergeAllDataForTrainingGender.
+
+        Keyword arguments:
+        index -- image index
+    """
+
+    return np.flatnonzero(index['gender'] > 0)
+
+
+def sample(positions, number, rng=None):
+    """This method returns random sample of the positions without replacement.
+
+        Keyword arguments:
+        positions -- positions of images in the index
+        number -- size of the sample
+        rng -- numpy random generator (default: new unseeded generator)
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    return rng.choice(positions, number, replace=False)
+
+
+def stratifiedSample(index, positions, number, key='age', rng=None):
+    """This method returns random sample of the positions, in which every class of the key (e.g., every age)
+       has the same share as in all the positions. Remaining places are given to the classes with the largest
+       remainders.
+
+        Keyword arguments:
+        index -- image index
+        positions -- positions of images in the index
+        number -- size of the sample
+        key -- field of the index with the classes (default: 'age')
+        rng -- numpy random generator (default: new unseeded generator)
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    positions = rng.permutation(positions)
+    classes, inverse, counts = np.unique(index[key][positions], return_inverse=True, return_counts=True)
+    shares = counts * number / len(positions)
+    quotas = np.floor(shares).astype(np.int64)
+    remainders = np.argsort(quotas - shares)[:number - quotas.sum()]
+    quotas[remainders] += 1
+
+    # Rank of every position within its class, positions are already in random order
+    order = np.argsort(inverse, kind='stable')
+    ranks = np.empty(len(positions), dtype=np.int64)
+    ranks[order] = np.arange(len(positions)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return positions[ranks < quotas[inverse]]
+
+
+def split(positions, fractions=None, rng=None):
+    """This method shuffles the positions and splits them into the parts by the fractions.
+
+        Keyword arguments:
+        positions -- positions of images in the index
+        fractions -- fractions of the parts (default: TRAIN, VAL and TEST defined in constants module)
+        rng -- numpy random generator (default: new unseeded generator)
+    """
+
+    if fractions is None:
+        fractions = [constants.TRAIN, constants.VAL, constants.TEST]
+    if rng is None:
+        rng = np.random.default_rng()
+
+    boundaries = (np.cumsum(fractions)[:-1] * len(positions)).astype(np.int64)
+    return np.split(rng.permutation(positions), boundaries)
+
+
+def getFileName(index, position):
+    """This method returns name of the local file of the image.
+
+        Keyword arguments:
+        index -- image index
+        position -- position of the image in the index
+    """
+
+    return f'{bytes(index["hash"][position]).hex()}{EXTENSIONS[index["extension"][position]]}'
+
+
+def toImages(index, positions):
+    """This method returns images at the positions as dictionaries with age, gender and fileNameLocal,
+       in the same format as the images used by datasetCreator.
+
+        Keyword arguments:
+        index -- image index
+        positions -- positions of images in the index
+    """
+
+    images = []
+    for position in positions:
+        gender = GENDERS[index['gender'][position]]
+        images.append({
+            'age': int(index['age'][position]),
+            'gender': [gender] if gender else [],
+            'fileNameLocal': getFileName(index, position)
+        })
+
+    return images
+
+
+if __name__ == '__main__':
+    buildImageIndex()